@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-__version__ = "4.9.c"
+__version__ = "4.10.a"
 # Year, month, day
-__last_update_date__ = "2023-05-26"
+__last_update_date__ = "2026-10-18"
 
 # |===== Check python interpreter version =====|
 
@@ -30,13 +30,14 @@ if "-h" in sys.argv[1:] or "--help" in sys.argv[1:]:
     print("DESCRIPTION:\n")
     print("""barapost-binning.py -- this script is designed for binning (dividing into separate files)
     FASTQ and FASTA files processed by `barapost-local.py`.""")
-    print("""Moreover, it can bin FAST5 files according to taxonomical annotation of basecallsed
+    print("""Moreover, it can bin FAST5 and POD5 files according to taxonomical annotation of basecallsed
   FASTQ files. For details, see README.md on github page
-  (`FAST5 binning` section): https://github.com/masikol/barapost\n""")
+  (`FAST5 binning` section): https://github.com/masikol/barapost
+  Binning POD5 files requires package `pod5`.\n""")
     if "--help" in sys.argv[1:]:
         print("----------------------------------------------------------\n")
         print("""Default parameters:\n
- - if no input files are specified, all FASTQ, FASTA and FAST5 files in current directory will be processed;
+ - if no input files are specified, all FASTQ, FASTA, FAST5 and POD5 files in current directory will be processed;
  - binning sensitivity (see `-s` option): 5 (genus);
  - output directory (`-o` option): directory named `binning_result_<date_and_time_of_run>`
    nested in working directory;
@@ -46,7 +47,9 @@ if "-h" in sys.argv[1:] or "--help" in sys.argv[1:]:
  - filtering by alignment coverage (`-c` option) is disabled;
  - "FAST5 untwisting" is disaled (see `-u` option);
  - number of CPU threads to use (`-t` option): 1;
- - barapost-binning generated trash file(s) (`-n` flag);""")
+ - barapost-binning generated trash file(s) (`-n` flag);
+ - binned FASTA and FASTQ files are not gzipped (`-z` flag);
+ - maximum number of output files open simultaneously (`-f` option): 128;""")
 # end if
 
     print("----------------------------------------------------------\n")
@@ -60,8 +63,8 @@ if "-h" in sys.argv[1:] or "--help" in sys.argv[1:]:
    This is directory specified to `barapost-prober.py` with `-o` option
    and to `barapost-local.py` with `-r` option.
    Default value is "barapost_result".\n""")
-    print("""-d (--indir) --- directory which contains FAST(Q/A/5) files
-   meant to be binned. I.e. all FASTQ, FASTA and FAST5 files in this direcory will be processed;\n""")
+    print("""-d (--indir) --- directory which contains FAST(Q/A/5) and POD5 files
+   meant to be binned. I.e. all FASTQ, FASTA, FAST5 and POD5 files in this direcory will be processed;\n""")
     print("-o (--outdir) --- output directory;\n")
     print("""-s (--binning-sensitivity) --- binning sensitivity,
    i.e. the lowest taxonomy rank that barapost-binning regards;
@@ -70,13 +73,20 @@ if "-h" in sys.argv[1:] or "--help" in sys.argv[1:]:
      3 for order, 4 for family, 5 for genus,
      6 for species.
    Default is 5 (genus);\n""")
-    print("""-u (--untwist-fast5) --- flag option. If specified, FAST5 files will be
+    print("""-u (--untwist-fast5) --- flag option. If specified, FAST5 and POD5 files will be
    binned considering that corresponding FASTQ files may contain reads from other FAST5 files
    and reads from a particular FAST5 file may be ditributed among multiple FASTQ files.
+   Reads are indexed once; index is stored in directory `fast5_to_tsvtaxann_idx` inside
+   the classification directory, and only new and changed files are indexed in next runs.
    Feature is disabled by default;\n""")
     print("""-t (--threads) --- number of CPU threads to use.
-   Affects only FASTA and FASTQ binning.
-   barapost-binning processes FAST5 files in 1 thread anyway (exception is "FAST5 untwisting").\n""")
+   If there are less FASTA and FASTQ files than threads, files are binned one by one,
+   and reads of each file are binned in parallel.
+   FAST5 and POD5 files are binned in parallel to separate directories, which are merged afterwards;\n""")
+    print("""-x (--taxdump) --- directory with NCBI taxonomy dump: files `nodes.dmp`, `names.dmp`
+   (from `taxdump.tar.gz`) and `nucl_gb.accession2taxid` (it can be gzipped).
+   If specified, missing taxonomy is recovered from these files instead of NCBI servers.
+   Files are indexed once; index is stored in the same directory;\n""")
     print("  Filter options:\n")
     print(" Quality and length filters:\n")
     print("""-q (--min-qual) --- threshold for quality filter;
@@ -97,6 +107,13 @@ if "-h" in sys.argv[1:] or "--help" in sys.argv[1:]:
     print("""-n (--no-trash) --- flag option. If specified:
    1) trash files will not be outputed;
    2) sequences, which does not pass filters, won't be written anywhere;\n""")
+    print("""-z (--gzip-output) --- flag option. If specified, binned FASTA and FASTQ files
+   will be written gzipped in BGZF format (like files compressed by `bgzip`),
+   so that they can be indexed and accessed randomly by downstream tools;\n""")
+    print("""-f (--max-open-files) --- maximum number of binned FASTA and FASTQ files open simultaneously
+   per input file. If more files are needed, the least recently used one is closed
+   and reopened later. Decrease it if the limit of open files is exceeded. Default: 128.
+   Binned FAST5 files are opened one at a time;\n""")
 
     if "--help" in sys.argv[1:]:
         print("----------------------------------------------------------\n")
@@ -136,16 +153,17 @@ import getopt
 from glob import glob
 
 try:
-    opts, args = getopt.gnu_getopt(sys.argv[1:], "hvr:d:o:s:q:m:i:c:ut:n",
+    opts, args = getopt.gnu_getopt(sys.argv[1:], "hvr:d:o:s:q:m:i:c:ut:nx:zf:",
         ["help", "version", "taxannot-resdir=", "indir=", "outdir=", "binning-sensitivity=",
          "min-qual=", "min-seq-len=", "min-pident=", "min-coverage=",
-         "untwist-fast5", "threads=", "no-trash"])
+         "untwist-fast5", "threads=", "no-trash", "taxdump=", "gzip-output",
+         "max-open-files="])
 except getopt.GetoptError as gerr:
     print( str(gerr) )
     platf_depend_exit(2)
 # end try
 
-from src.filesystem import is_fasta, is_fastq, is_fast5
+from src.filesystem import is_fasta, is_fastq, is_fast5, is_pod5
 is_fastqa = lambda f: is_fasta(f) or is_fastq(f)
 
 from datetime import datetime
@@ -154,6 +172,7 @@ now = datetime.now().strftime("%Y-%m-%d %H.%M.%S")
 # |== Default parameters: ==|
 fq_fa_list = list() # list with input FASTQ and FASTA files paths
 fast5_list = list() # list with input FAST5 files paths
+pod5_list = list() # list with input POD5 files paths
 tax_annot_res_dir = "barapost_result" # path to directory with classification results
 indir_path = None # path to input directory
 outdir_path = "binning_result_{}".format(now.replace(' ', '_')) # path to output directory
@@ -165,12 +184,16 @@ min_coverage = None # minimum alignment coverage in percent
 untwist_fast5 = False # flag indicating whether to run 'FAST5-untwisting' or not
 n_thr = 1 # number of threads to launch
 no_trash = False
+taxdump_dir = None # directory with NCBI taxonomy dump
+gzip_output = False # flag indicating whether to write binned FASTA and FASTQ files gzipped
+from src.binning_modules.handle_cache import MAX_OPEN_FILES
+max_open_files = MAX_OPEN_FILES # maximum number of output files open simultaneously
 
-# Add positional arguments to ` and fast5_list
+# Add positional arguments to fq_fa_list, fast5_list and pod5_list
 for arg in args:
-    if not is_fastqa(arg) and not is_fast5(arg):
+    if not is_fastqa(arg) and not is_fast5(arg) and not is_pod5(arg):
         print("Error: invalid positional argument: `{}`".format(arg))
-        print("Only FAST(A/Q/5) files can be specified without a key in command line.")
+        print("Only FAST(A/Q/5) and POD5 files can be specified without a key in command line.")
         platf_depend_exit(1)
     # end if
 
@@ -181,6 +204,8 @@ for arg in args:
 
     if is_fastqa(arg):
         fq_fa_list.append( os.path.abspath(arg) )
+    elif is_pod5(arg):
+        pod5_list.append( os.path.abspath(arg) )
     else:
         fast5_list.append( os.path.abspath(arg) )
     # end if
@@ -317,9 +342,32 @@ for opt, arg in opts:
 
         fq_fa_list.extend(list( filter(is_fastqa, glob("{}{}*".format(indir_path, os.sep))) ))
         fast5_list.extend(list( filter(is_fast5, glob("{}{}*".format(indir_path, os.sep))) ))
+        pod5_list.extend(list( filter(is_pod5, glob("{}{}*".format(indir_path, os.sep))) ))
 
     elif opt in ("-n", "--no_trash"):
         no_trash = True
+
+    elif opt in ("-x", "--taxdump"):
+        if not os.path.isdir(arg):
+            print("Error: directory `{}` does not exist!".format(arg))
+            platf_depend_exit(1)
+        # end if
+        taxdump_dir = os.path.abspath(arg)
+
+    elif opt in ("-z", "--gzip-output"):
+        gzip_output = True
+
+    elif opt in ("-f", "--max-open-files"):
+        try:
+            max_open_files = int(arg)
+            if max_open_files < 1:
+                raise ValueError
+            # end if
+        except ValueError:
+            print("Error: maximum number of open files must be integer number > 0!")
+            print("Your value: `{}`".format(arg))
+            platf_depend_exit(1)
+        # end try
     # end if
 # end for
 
@@ -333,7 +381,7 @@ if not os.path.isdir(tax_annot_res_dir):
     # end if
 # end if
 
-num_files = len(fq_fa_list) + len(fast5_list)
+num_files = len(fq_fa_list) + len(fast5_list) + len(pod5_list)
 
 # If no FAST(A/Q/5) file have been specified
 if num_files == 0:
@@ -347,6 +395,7 @@ if num_files == 0:
     else:
         fq_fa_list.extend(list( filter(is_fastqa, glob("{}{}*".format(os.getcwd(), os.sep))) ))
         fast5_list.extend(list( filter(is_fast5, glob("{}{}*".format(os.getcwd(), os.sep))) ))
+        pod5_list.extend(list( filter(is_pod5, glob("{}{}*".format(os.getcwd(), os.sep))) ))
 
         # If there are nothing to process -- just show help message
         if num_files == 0:
@@ -384,7 +433,7 @@ if num_files == 0:
 
 
 # Check if there are duplicated basenames in input files:
-for lst in (fq_fa_list, fast5_list):
+for lst in (fq_fa_list, fast5_list, pod5_list):
     for path in lst:
         bname = os.path.basename(path)
         same_bnames = tuple(filter(lambda f: os.path.basename(f) == bname, lst))
@@ -416,9 +465,23 @@ if len(fast5_list) != 0:
     print("\rImporting h5py... ok")
 # end if
 
+if len(pod5_list) != 0:
+    sys.stdout.write("Importing pod5...")
+    try:
+        import pod5
+    except ImportError as imperr:
+        print("\nPackage `pod5` is not installed: " + str(imperr))
+        print("\n `pod5` package is necessary for POD5 files binning.")
+        print(" Please, install it (e.g. `pip3 install pod5`).")
+        platf_depend_exit(1)
+    # end try
+    print("\rImporting pod5... ok")
+# end if
+
 # Sort input files in order to process them in alphabetical order
 fq_fa_list.sort()
 fast5_list.sort()
+pod5_list.sort()
 
 # Create output directory
 if not os.path.isdir(outdir_path):
@@ -450,7 +513,7 @@ def get_checkstr(fast5_fpath):
     #
     # If no such distinctive string is found in FAST5 file name
     #     (file can be renamed by the user after sequensing)
-    #     whole file name (except of the '.fast5' extention) is returned as checksting.
+    #     whole file name (except of the '.fast5' or '.pod5' extention) is returned as checksting.
     #
     # :param fast5_fpath: path to FAST5 file meant to be processed;
     # :type fast5_fpath: str;
@@ -461,7 +524,7 @@ def get_checkstr(fast5_fpath):
         # I'll lower the 40-character barrier down to 30 just in case.
         filename_payload = re.search(r"([a-zA-Z0-9]{30,}_[0-9]+)", fast5_fpath).group(1)
     except AttributeError:
-        return os.path.basename(fast5_fpath).replace(".fast5", "")
+        return os.path.basename(fast5_fpath).replace(".fast5", "").replace(".pod5", "")
     else:
         return filename_payload
     # end try
@@ -486,13 +549,8 @@ print(get_full_time() + " - Start working\n")
 log_info("Start working.")
 
 # Some possible warnings:
-if len(fq_fa_list) == 0 and n_thr != 1 and not "-u" in sys.argv[1:] and not "--untwist-fast5" in sys.argv[1:]:
-    print("\nWarning! Binning FAST5 files in parallel doesn't give any profit.")
-    print("Number of threads is switched to 1.")
-    n_thr = 1
-# end if
-if len(fast5_list) == 0 and untwist_fast5:
-    print("\nWarning! No FAST5 file has been given to barapost-binning's input.")
+if len(fast5_list) == 0 and len(pod5_list) == 0 and untwist_fast5:
+    print("\nWarning! No FAST5 or POD5 file has been given to barapost-binning's input.")
     print("Therefore, `-u` (`--untwist-fast5`) flag does not make any sense.")
     print("Ignoring it.\n")
     untwist_fast5 = False
@@ -504,7 +562,7 @@ if len(fast5_list) == 0 and untwist_fast5:
 
 printn("Primary validation...")
 if not untwist_fast5:
-    for fpath in fast5_list:
+    for fpath in fast5_list + pod5_list:
         # Get number of directories in 'tax_annot_res_dir' where results of current FAST5
         #    baraposting are located.
         possible_fast5_resdirs_num = len( glob("{}{}*{}*".format(tax_annot_res_dir, os.sep, get_checkstr(fpath))) )
@@ -548,7 +606,7 @@ sys.stdout.write('\r')
 printlog_info("Primary validation...ok")
 print()
 
-is_fastQA5 = lambda f: not re.search(r".*\.(m)?f(ast)?(a|q|5)(\.gz)?$", f) is None
+is_fastQA5 = lambda f: not re.search(r".*\.((m)?f(ast)?(a|q|5)|pod5)(\.gz)?$", f) is None
 
 # Check if there are some results in output directory
 if len( list( filter(is_fastQA5, os.listdir(outdir_path)) ) ) != 0:
@@ -599,14 +657,13 @@ if len( list( filter(is_fastQA5, os.listdir(outdir_path)) ) ) != 0:
 
 del is_fastQA5
 
-# Decide whether to create index:
+# Create index directory:
 if untwist_fast5:
 
-    # Names of index files
-    index_name = "fast5_to_tsvtaxann_idx"
+    from src.binning_modules.fast5_index import get_index_path
 
-    # Create index directory
-    index_dirpath = os.path.join(tax_annot_res_dir, index_name) # name of directory that will contain indicies
+    index_path = get_index_path(tax_annot_res_dir)
+    index_dirpath = os.path.dirname(index_path) # name of directory that will contain index
     if not os.path.isdir(index_dirpath):
         try:
             os.makedirs(index_dirpath)
@@ -617,47 +674,6 @@ if untwist_fast5:
             platf_depend_exit(1)
         # end try
     # end if
-
-    def whether_to_build_index(index_dirpath):
-        # Function checks if there are any files in index directory.
-        # If there are any, it asks a user whether to create a new index or to use old one.
-
-        # :param index_dirpath: path to index directory;
-        # :type index_dirpath: str;
-
-        use_old_index = False
-
-        if len(os.listdir(index_dirpath)) != 0:
-            printlog_info("Index file created by `-u` option already exists (left from previous run).")
-
-            error = True
-
-            while error:
-                reply = input("""  Press ENTER to make new index file
-  or enter 'u' to use old index file:>>""")
-                if reply == "":
-                    try:
-                        for path in glob( os.path.join(index_dirpath, '*') ):
-                            os.unlink(path)
-                        # end for
-                    except OSError as oserr:
-                        printlog_error_time("Error: cannot remove old index files!")
-                        printlog_error( str(oserr) )
-                        platf_depend_exit(1)
-                    # end try
-                    error = False
-                elif reply == 'u':
-                    use_old_index = True
-                    error = False
-                else:
-                    print("Invalid reply!\n")
-                # end if
-            # end while
-            printlog_info("You have chosen to {} index file.".format("use old" if use_old_index else "make new"))
-            print()
-        # end if
-        return use_old_index
-    # end def whether_to_build_index
 # end if
 
 
@@ -683,6 +699,12 @@ if not os.path.exists(outdir_path):
 
 # Module, which defines function for binning FAST5 files (with untwisting or not):
 FAST5_srt_module = None
+# Module, which defines function for binning FAST5 files in parallel:
+FAST5_paral_module = None
+# Module, which defines function for binning POD5 files (with untwisting or not):
+POD5_srt_module = None
+# Module, which defines function for binning POD5 files in parallel:
+POD5_paral_module = None
 # Module, which defines function for binning FASTA and FASTQ files (parallel or not):
 QA_srt_module = None
 # Module, which defines function for "FAST5-untwisting" (parallel or not):
@@ -693,35 +715,41 @@ try:
     if len(fq_fa_list) != 0:
         if n_thr == 1: # import single-thread FASTA-FASTQ binning function
             import src.binning_modules.single_thread_QA as QA_srt_module
+        elif len(fq_fa_list) < n_thr: # import function binning reads of a file in parallel
+            import src.binning_modules.read_parallel_QA as QA_srt_module
         else: # import parallel FASTA-FASTQ binning function
             import src.binning_modules.parallel_QA as QA_srt_module
         # end if
     # end if
 
-    if len(fast5_list) != 0:
-
-        # Will be None if unwtisting is disabled and True/False otherwise
-        use_old_index = None
-
-        if untwist_fast5:
-            use_old_index = whether_to_build_index(index_dirpath)
-            # We do not need untwisting function if we do not make new index
-            if not use_old_index:
-                if n_thr == 1: # import single-thread untwisting
-                    import src.binning_modules.single_thread_FAST5_utwfunc as utw_module
-                else: # import parallel untwisting
-                    import src.binning_modules.parallel_FAST5_utwfunc as utw_module
-                # end if
-            # end if
+    if untwist_fast5:
+        if n_thr == 1: # import single-thread untwisting
+            import src.binning_modules.single_thread_FAST5_utwfunc as utw_module
+        else: # import parallel untwisting
+            import src.binning_modules.parallel_FAST5_utwfunc as utw_module
         # end if
+    # end if
 
-        if use_old_index is None:
+    if len(fast5_list) != 0:
+
+        if not untwist_fast5:
             # If untwisting is disabled, import simple FAST5-binning function:
             import src.binning_modules.single_thread_FAST5_binfunc as FAST5_srt_module
         else:
             # If untwisting is enabled, import FAST5-binning function that "knows" about untwisting:
             import src.binning_modules.single_thread_FAST5_binfunc_utw as FAST5_srt_module
         # end if
+
+        if n_thr != 1: # import function binning FAST5 files in parallel
+            import src.binning_modules.parallel_FAST5 as FAST5_paral_module
+        # end if
+    # end if
+
+    if len(pod5_list) != 0:
+        import src.binning_modules.single_thread_POD5_binfunc as POD5_srt_module
+        if n_thr != 1: # import function binning POD5 files in parallel
+            import src.binning_modules.parallel_POD5 as POD5_paral_module
+        # end if
     # end if
 except ImportError as imperr:
     printlog_error_time("Error: module integrity is corrupted!")
@@ -742,6 +770,13 @@ printlog_info(" - Threads: {};".format(n_thr))
 if untwist_fast5:
     printlog_info(' - "FAST5 untwisting" is enabled;')
 # end if
+if not taxdump_dir is None:
+    printlog_info(" - Offline taxonomy: `{}`;".format(taxdump_dir))
+# end if
+if gzip_output:
+    printlog_info(" - Binned FASTA and FASTQ files are written gzipped (BGZF);")
+# end if
+printlog_info(" - Maximum number of open output files: {};".format(max_open_files))
 print()
 printlog_info("   Following filters will be applied:")
 printlog_info(" - Quality filter. Threshold: Q{};".format(min_qual))
@@ -764,7 +799,7 @@ for path in fq_fa_list:
     log_info("  {}. `{}`.".format(i, path))
     i += 1
 # end for
-for path in fast5_list:
+for path in fast5_list + pod5_list:
     log_info("  {}. `{}`.".format(i, path))
     i += 1
 # end for
@@ -782,6 +817,10 @@ taxonomy_path = os.path.join(taxonomy_dir, "taxonomy.tsv")
 # Check if there is legacy taxonomy file and, if so, reformat it to new (TSV) format
 legacy_taxonomy_handling.check_deprecated_taxonomy(tax_annot_res_dir)
 
+if not taxdump_dir is None:
+    import src.offline_taxonomy as offline_taxonomy
+    offline_taxonomy.init_offline_taxonomy(taxdump_dir)
+# end if
 
 if n_thr != 1:
     from src.spread_files_equally import spread_files_equally
@@ -792,40 +831,62 @@ if n_thr != 1:
 printlog_info('-' * 30)
 print()
 
-if untwist_fast5 and not use_old_index:
-
-    printlog_info_time("Untwisting started.")
-    printn(" Working...")
+if untwist_fast5:
 
+    import sqlite3
     from src.binning_modules.binning_spec import get_tsv_taxann_lst
+    from src.binning_modules.fast5_index import get_outdated_fast5_files
     tsv_taxann_lst = get_tsv_taxann_lst(tax_annot_res_dir)
 
-    if n_thr == 1:
-        for f5_path in fast5_list:
-            utw_module.map_f5reads_2_taxann(f5_path, tsv_taxann_lst, tax_annot_res_dir)
-            sys.stdout.write('\r')
-            printlog_info_time("File `{}` is processed.".format(os.path.basename(f5_path)))
-            printn(" Working...")
-        # end for
+    # Only new FAST5 (and POD5) files and files, whose entries in the index are outdated, are untwisted
+    try:
+        fast5_to_untwist = get_outdated_fast5_files(index_path, fast5_list + pod5_list, tsv_taxann_lst)
+    except (OSError, sqlite3.Error) as err:
+        printlog_error_time("Error: cannot open index file `{}`".format(index_path))
+        printlog_error( str(err) )
+        platf_depend_exit(1)
+    # end try
+
+    if len(fast5_to_untwist) == 0:
+        printlog_info("Index file that maps reads stored in input FAST5 files to \
+TSV files containing taxonomic classification is up to date.")
     else:
-        pool = mp.Pool(n_thr, initializer=utw_module.init_paral_utw,
-            initargs=(mp.Lock(), mp.Lock(),))
-        pool.starmap(utw_module.map_f5reads_2_taxann,
-            [(sublist, tsv_taxann_lst, tax_annot_res_dir,) for sublist in spread_files_equally(fast5_list, n_thr)])
-        pool.close()
-        pool.join()
-    # end if
+        printlog_info_time("Untwisting started.")
+        printlog_info("{}/{} FAST5 and POD5 files will be indexed.".format(len(fast5_to_untwist),
+            len(fast5_list) + len(pod5_list)))
+        printn(" Working...")
+
+        from src.binning_modules.fast5_untwist import build_readid_index
+        # All TSV files are read once: reads of all FAST5 files are found in this index
+        readid_index = build_readid_index(tsv_taxann_lst)
+
+        if n_thr == 1:
+            for f5_path in fast5_to_untwist:
+                utw_module.map_f5reads_2_taxann(f5_path, readid_index, tax_annot_res_dir)
+                sys.stdout.write('\r')
+                printlog_info_time("File `{}` is processed.".format(os.path.basename(f5_path)))
+                printn(" Working...")
+            # end for
+        else:
+            pool = mp.Pool(n_thr, initializer=utw_module.init_paral_utw,
+                initargs=(mp.Lock(), readid_index,))
+            pool.starmap(utw_module.map_f5reads_2_taxann,
+                [(sublist, tax_annot_res_dir,) for sublist in spread_files_equally(fast5_to_untwist, n_thr)])
+            pool.close()
+            pool.join()
+        # end if
 
-    sys.stdout.write('\r')
-    printlog_info_time("Untwisting is completed.")
-    printlog_info("Index file that maps reads stored in input FAST5 files to \
-TSV files containing taxonomic classification is created.")
+        sys.stdout.write('\r')
+        printlog_info_time("Untwisting is completed.")
+        printlog_info("Index file that maps reads stored in input FAST5 files to \
+TSV files containing taxonomic classification is updated.")
+    # end if
     printlog_info('-'*20)
     print()
 # end if
 
 # Import launching module
-if n_thr == 1 or len(fast5_list) != 0:
+if n_thr == 1 or len(fq_fa_list) < n_thr:
     from src.binning_modules.launch import launch_single_thread_binning
 # end if
 
@@ -843,26 +904,62 @@ res_stats = list()
 
 # Bin FAST5 files:
 if len(fast5_list) != 0:
-    res_stats.extend(launch_single_thread_binning(fast5_list,
-        FAST5_srt_module.bin_fast5_file, tax_annot_res_dir, sens,
-            min_qual, min_qlen, min_pident, min_coverage, no_trash))
+    from functools import partial
+    if n_thr != 1: # in parallel
+        bin_fast5_files = partial(FAST5_paral_module.bin_fast5_files,
+            bin_fast5_file=FAST5_srt_module.bin_fast5_file)
+        res_stats.extend(launch_parallel_binning(fast5_list,
+            bin_fast5_files, tax_annot_res_dir, sens, n_thr,
+            min_qual, min_qlen, min_pident, min_coverage, no_trash,
+            init_func=FAST5_paral_module.init_paral_binning))
+        # Merge binned files written by different processes
+        FAST5_paral_module.merge_shards(outdir_path, n_thr)
+    else: # in single thread
+        res_stats.extend(launch_single_thread_binning(fast5_list,
+            FAST5_srt_module.bin_fast5_file, tax_annot_res_dir, sens,
+                min_qual, min_qlen, min_pident, min_coverage, no_trash))
+    # end if
+# end if
 
-    # Assign version attribute in FAST5 files to '2.0' -- multiFAST5
-    from src.binning_modules.fast5 import assign_version_2
-    if len(fast5_list) != 0:
-        assign_version_2(fast5_list)
+# Bin POD5 files:
+if len(pod5_list) != 0:
+    from functools import partial
+    bin_pod5_file = partial(POD5_srt_module.bin_pod5_file, untwist=untwist_fast5)
+    if n_thr != 1: # in parallel
+        bin_pod5_files = partial(POD5_paral_module.bin_pod5_files, bin_pod5_file=bin_pod5_file)
+        res_stats.extend(launch_parallel_binning(pod5_list,
+            bin_pod5_files, tax_annot_res_dir, sens, n_thr,
+            min_qual, min_qlen, min_pident, min_coverage, no_trash,
+            init_func=POD5_paral_module.init_paral_binning))
+        # Merge binned files written by different processes
+        POD5_paral_module.merge_shards(outdir_path, n_thr)
+    else: # in single thread
+        # POD5 files cannot be appended: binned files are created once for all input files
+        from src.binning_modules.pod5_io import BinnedPod5Output
+        binned_pod5_output = BinnedPod5Output()
+        res_stats.extend(launch_single_thread_binning(pod5_list,
+            partial(bin_pod5_file, binned_output=binned_pod5_output), tax_annot_res_dir, sens,
+                min_qual, min_qlen, min_pident, min_coverage, no_trash))
+        binned_pod5_output.close()
     # end if
 # end if
 
 # Bin FASTA and FASTQ files:
 if len(fq_fa_list) != 0:
-    if n_thr != 1: # in parallel
+    from functools import partial
+    bin_fastqa_file = partial(QA_srt_module.bin_fastqa_file, gzip_output=gzip_output,
+        max_open_files=max_open_files)
+    if n_thr != 1 and len(fq_fa_list) < n_thr: # files one by one, reads of each file in parallel
+        res_stats.extend(launch_single_thread_binning(fq_fa_list,
+            partial(bin_fastqa_file, n_thr=n_thr), tax_annot_res_dir, sens,
+            min_qual, min_qlen, min_pident, min_coverage, no_trash))
+    elif n_thr != 1: # in parallel
         res_stats.extend(launch_parallel_binning(fq_fa_list,
-            QA_srt_module.bin_fastqa_file, tax_annot_res_dir, sens, n_thr,
+            bin_fastqa_file, tax_annot_res_dir, sens, n_thr,
             min_qual, min_qlen, min_pident, min_coverage, no_trash))
     else: # in single thread
         res_stats.extend(launch_single_thread_binning(fq_fa_list,
-            QA_srt_module.bin_fastqa_file, tax_annot_res_dir, sens,
+            bin_fastqa_file, tax_annot_res_dir, sens,
             min_qual, min_qlen, min_pident, min_coverage, no_trash))
     # end if
 # end if
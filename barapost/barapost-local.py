@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-__version__ = "3.18.f"
+__version__ = "3.19.a"
 # Year, month, day
-__last_update_date__ = "2023-05-26"
+__last_update_date__ = "2026-10-18"
 
 # |===== Check python interpreter version =====|
 
@@ -37,6 +37,9 @@ if "-h" in sys.argv[1:] or "--help" in sys.argv[1:]:
   generated by "barapost-prober.py" and creates a database on local machine. After that `barapost-local.py classifies
   the rest of data with "BLAST+" toolkit.\n""")
         print("Script processes FASTQ and FASTA (as well as `.fastq.gz` and `.fasta.gz`) files.\n")
+        print("""If an uncompressed input file is indexed with `samtools faidx` or `samtools fqidx`
+  (i.e. there is a `.fai` file beside it), threads read their parts of the file using the index.
+  The same is done for files having barapost read index (see `-I` option).\n""")
         print("""If you have your own FASTA files that can be used as database alone to blast against,
   you can omit "barapost-prober.py" step and go to `barapost-local.py` (see `-l` option).""")
         print("----------------------------------------------------------\n")
@@ -64,7 +67,10 @@ if "-h" in sys.argv[1:] or "--help" in sys.argv[1:]:
    Default value is "barapost_result".\n""")
     print("""-d (--indir) --- directory which contains FASTQ of FASTA files meant to be processed.
    I.e. all FASTQ and FASTA files in this direcory will be processed;\n""")
-    print("""-p (--packet-size) --- size of the packet, i.e. number of sequence to align in one blastn launching.
+    print("""-p (--packet-size) --- size of the packet, i.e. number of sequences, results of which
+   are written to classification file at once. Queries are streamed to a single blastn process,
+   so packet size does not affect speed much. Packets are also units of work distributed
+   among threads, and interrupted runs are resumed packet-wise.
    Value: positive integer number. Default value is 100;\n""")
     print("""-a (--algorithm) --- BLASTn algorithm to use for aligning.
    Available values: 0 for megaBlast, 1 for discoMegablast, 2 for blastn.
@@ -77,6 +83,18 @@ if "-h" in sys.argv[1:] or "--help" in sys.argv[1:]:
     print("-i (--use-index) --- whether to use BLAST index to accelerate searches.")
     print("  However, creating index may be memory-consuming.")
     print("  Values: `1` (do use index), `0` (do not use index).\n")
+    print("""-x (--taxdump) --- directory with NCBI taxonomy dump: files `nodes.dmp`, `names.dmp`
+   (from `taxdump.tar.gz`) and `nucl_gb.accession2taxid` (it can be gzipped).
+   If specified, taxonomy is retrieved from these files instead of NCBI servers.
+   Files are indexed once; index is stored in the same directory;\n""")
+    print("""-f (--blast-outfmt) --- format of blastn output to parse.
+   Available values: 5 for XML, 7 for tabular. Tabular output is parsed faster,
+   but E-values in classification file are rounded by blastn (e.g. `1e-100` instead of `1.02345e-100`).
+   Default is 5 (XML);\n""")
+    print("""-I (--index-reads) --- flag option. If specified, a read index (`.bpidx` file)
+   is built beside each input file, unless it is already built. Threads read their parts of
+   indexed files themselves, and interrupted runs are resumed without reading classified sequences.
+   Uncompressed and BGZF (compressed by `bgzip`) files can be indexed;\n""")
 
     if "--help" in sys.argv[1:]:
         print("----------------------------------------------------------\n")
@@ -116,9 +134,10 @@ from re import search as re_search
 import getopt
 
 try:
-    opts, args = getopt.gnu_getopt(sys.argv[1:], "hvd:p:a:r:l:t:s:i:",
+    opts, args = getopt.gnu_getopt(sys.argv[1:], "hvd:p:a:r:l:t:s:i:x:f:I",
         ["help", "version", "indir=", "packet-size=", "algorithm=", "taxannot-resdir=",
-        "local-fasta-to-bd=", "threads=", "accession=", "use-index="])
+        "local-fasta-to-bd=", "threads=", "accession=", "use-index=", "taxdump=", "blast-outfmt=",
+        "index-reads"])
 except getopt.GetoptError as gerr:
     print( str(gerr) )
     platf_depend_exit(2)
@@ -136,6 +155,9 @@ your_own_fasta_lst = list() # list os user's fasta files to be included in datab
 accs_to_download = list() # list of accessions of GenBank records to download
 n_thr = 1 # number of threads
 use_index = "true"
+taxdump_dir = None # directory with NCBI taxonomy dump
+outfmt = 5 # format of blastn output
+index_reads = False # flag indicating whether to build read indices of input files
 
 # Add positional arguments to fq_fa_list
 for arg in args:
@@ -246,6 +268,25 @@ for opt, arg in opts:
             print("Available values: `1` (use index) and `0` (do not use index).")
             platf_depend_exit(1)
         # end if
+
+    elif opt in ("-x", "--taxdump"):
+        if not os.path.isdir(arg):
+            print("Error: directory `{}` does not exist!".format(arg))
+            platf_depend_exit(1)
+        # end if
+        taxdump_dir = os.path.abspath(arg)
+
+    elif opt in ("-f", "--blast-outfmt"):
+        if not arg in ("5", "7"):
+            print("Error: invalid value specified by `{}` option!".format(opt))
+            print("Available values: 5 for XML, 7 for tabular")
+            print("Your value: `{}`".format(arg))
+            platf_depend_exit(1)
+        # end if
+        outfmt = int(arg)
+
+    elif opt in ("-I", "--index-reads"):
+        index_reads = True
     # end if
 # end for
 
@@ -390,7 +431,7 @@ del db_exists, acc_file_exists
 from src.platform import get_logfile_path
 
 from src.printlog import get_full_time, printn, printlog_info, printlog_info_time
-from src.printlog import printlog_error, printlog_error_time, log_info, printlog_warning
+from src.printlog import printlog_error_time, log_info, printlog_warning
 import logging
 logging.basicConfig(filename=get_logfile_path("barapost-local", tax_annot_res_dir),
     format='%(levelname)s: %(asctime)s %(message)s', datefmt='%Y-%m-%d %H:%M:%S',
@@ -411,7 +452,14 @@ printlog_info(" - Logging to `{}`".format(logging.getLoggerClass().root.handlers
 printlog_info(" - Output directory: `{}`;".format(tax_annot_res_dir))
 printlog_info(" - Packet size: {} sequences;".format(packet_size))
 printlog_info(" - BLAST algorithm: {};".format(blast_algorithm))
+printlog_info(" - blastn output format: {};".format("XML" if outfmt == 5 else "tabular"))
 printlog_info(" - Threads: {};".format(n_thr))
+if not taxdump_dir is None:
+    printlog_info(" - Offline taxonomy: `{}`;".format(taxdump_dir))
+# end if
+if index_reads:
+    printlog_info(" - Input files are indexed (read index);")
+# end if
 print()
 
 s_letter = '' if len(fq_fa_list) == 1 else 's'
@@ -470,6 +518,11 @@ taxonomy_path = os.path.join(taxonomy_dir, "taxonomy.tsv")
 # Check if there is legacy taxonomy file and, if so, reformat it to new (TSV) format
 legacy_taxonomy_handling.check_deprecated_taxonomy(tax_annot_res_dir)
 
+if not taxdump_dir is None:
+    import src.offline_taxonomy as offline_taxonomy
+    offline_taxonomy.init_offline_taxonomy(taxdump_dir)
+# end if
+
 from src.barapost_local_modules.build_local_db import build_local_db
 
 # Indexed discontiguous searches are not supported:
@@ -498,93 +551,49 @@ if use_index == "true" and len(glob(os.path.join(tax_annot_res_dir, "local_datab
 # end if
 
 
-# Create temporary directory for query files:
-queries_tmp_dir = os.path.join(tax_annot_res_dir, "queries-tmp")
-if not os.path.isdir(queries_tmp_dir):
-    try:
-        os.makedirs(queries_tmp_dir)
-    except OSError as oserr:
-        printlog_error_time("unable to create directory for queries:")
-        printlog_error("  `{}`".format(queries_tmp_dir))
-        printlog_error("Reason: {}".format(str(oserr) ))
-        platf_depend_exit(1)
-    # end try
-# end if
-
-
 # Proceeding.
 # The main goal of multiprocessing is to isolate processes from one another.
 #
-# Two situations are available:
-#   1. Number of threads <= number of files meant to be processed ('many_files'-parallel mode):
-#      Files will be distribured equally among processes.
-#      Processes interact with one another only while printing things to the console
-#      for user's entertainment.
-#   2. Number of threads > number of files meant to be processed ('few_files'-parallel mode):
-#      Files will be processed one by one. They will be divided into equal blocks,
-#      and these blocks will be distributed among processes.
-#      Processes interact with one another while writing to result file and
-#      while printing things to the console.
+# All files are divided into chunks of `packet_size` sequences.
+# The main process reads files one by one and puts chunks to a queue,
+#   and each process takes the next chunk as soon as it has classified the previous one.
+# Processes interact with one another while writing to result files and
+#   while printing things to the console.
+# If a single thread is used, chunks are classified in the main process.
+
+# Build read indices
+if index_reads:
+    from src.read_index import get_read_index
+    print()
+    for fq_fa_path in fq_fa_list:
+        printlog_info_time("Indexing `{}`...".format(os.path.basename(fq_fa_path)))
+        try:
+            read_index = get_read_index(fq_fa_path)
+        except OSError as oserr:
+            printlog_warning("Warning: cannot index file `{}`: {}".format(fq_fa_path, str(oserr)))
+            continue
+        # end try
+        if read_index is None:
+            printlog_warning("Warning: file `{}` cannot be indexed: it is gzipped, but not in BGZF format."\
+                .format(fq_fa_path))
+        # end if
+    # end for
+# end if
 
 print()
 printlog_info_time("Starting classification.")
 printn("  Working...")
 
-if n_thr <= len(fq_fa_list):
-    if n_thr != 1:
-
-        # Proceed 'many_files'-parallel processing
-
-        from src.barapost_local_modules.parallel_mult_files import process
-
-        process(fq_fa_list,
-            n_thr,
-            packet_size,
-            tax_annot_res_dir,
-            blast_algorithm,
-            use_index,
-            db_path)
-
-    else:
-
-        # Proceed single-thread processing
+from src.barapost_local_modules.chunk_scheduler import process
 
-        from src.barapost_local_modules.single_thread_mult_files import process
-
-        process(fq_fa_list,
-            packet_size,
-            tax_annot_res_dir,
-            blast_algorithm,
-            use_index,
-            db_path)
-    # end if
-else:
-
-    # Proceed 'few_files'-parallel processing
-
-    from src.barapost_local_modules.parallel_single_file import process
-
-    process(fq_fa_list,
-        n_thr,
-        packet_size,
-        tax_annot_res_dir,
-        blast_algorithm,
-        use_index,
-        db_path)
-# end if
-
-# Remove everything in 'queries_tmp_dir'
-try:
-    for qpath in glob( os.path.join(queries_tmp_dir, '*') ):
-        os.unlink(qpath)
-    # end for
-    os.rmdir(queries_tmp_dir)
-except OSError as oserr:
-    printlog_error_time("unable to remove directory `{}`".format(queries_tmp_dir))
-    printlog_error( str(oserr) )
-    printlog_error("Don't worry -- barapost-local has completed it's job just fine,")
-    printlog_error("   the only thing that some temporary files are left in the directory mentioned above.\n")
-# end try
+process(fq_fa_list,
+    n_thr,
+    packet_size,
+    tax_annot_res_dir,
+    blast_algorithm,
+    use_index,
+    db_path,
+    outfmt)
 
 print("\r{}".format(' ' * len("Working...")))
 print("{} - Task is completed!".format(get_full_time()))
@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-__version__ = "1.24.b"
+__version__ = "1.25.a"
 # Year, month, day
-__last_update_date__ = "2025-02-05"
+__last_update_date__ = "2026-10-18"
 __author__ = "Maxim Sikolenko"
 __author_email__ = "maximdeynonih" + "@" + "gmail" + ".com"
 
@@ -58,6 +58,8 @@ if "-h" in sys.argv[1:] or "--help" in sys.argv[1:]:
    nested in working directory;""")
         print("""- prober sends sequences intact
    (i.e. does not prune them before submission (see `-x` option));""")
+        print("""- number of requests in flight (see `-n` option): 1,
+   i.e. the next packet is submitted after results for the previous one are retrieved;""")
         print("----------------------------------------------------------\n")
     # end if
 
@@ -100,7 +102,12 @@ if "-h" in sys.argv[1:] or "--help" in sys.argv[1:]:
    Default value is 200;\n""")
     print("""-x (--max-seq-len) --- maximum length of a sequence that prober subits to NCBI BLAST service.
    It means that prober can prune your sequences before submission in order to spare NCBI servers.
-   This feature is disabled by default;""")
+   This feature is disabled by default;\n""")
+    print("""-n (--requests-in-flight) --- number of requests (packets) that prober keeps
+   in flight simultaneously. Results are retrieved and saved in order of sequences in input file.
+   According to NCBI usage policy, requests are submitted at least 10 seconds apart.
+   Value: integer number from 1 to 5.
+   Default value is 1;""")
 
     if "--help" in sys.argv[1:]:
         print("----------------------------------------------------------\n")
@@ -133,10 +140,10 @@ from glob import glob
 import getopt
 
 try:
-    opts, args = getopt.gnu_getopt(sys.argv[1:], "hvd:o:p:c:a:g:b:x:",
+    opts, args = getopt.gnu_getopt(sys.argv[1:], "hvd:o:p:c:a:g:b:x:n:",
         ["help", "version", "indir=", "outdir=", "packet-size=", "packet-mode=",
         "algorithm=", "organisms=", "probing-batch-size=",
-        "max-seq-len="])
+        "max-seq-len=", "requests-in-flight="])
 except getopt.GetoptError as gerr:
     print( str(gerr) )
     platf_depend_exit(2)
@@ -155,6 +162,7 @@ blast_algorithm = "megaBlast"
 taxid_list = list() # list of TaxIDs to perform database slices
 max_seq_len = float("inf") # maximum length of a sequence sent to NCBI
 packet_mode = 0 # mode of packet forming. `numseqs` is default
+max_in_flight = 1 # number of requests in flight
 
 # Add positional arguments to fq_fa_list
 for arg in args:
@@ -250,6 +258,22 @@ for opt, arg in opts:
             platf_depend_exit(1)
         # end try
 
+    elif opt in ("-n", "--requests-in-flight"):
+
+        from src.prober_modules.kernel import MAX_REQUESTS_IN_FLIGHT
+
+        try:
+            max_in_flight = int(arg)
+            if max_in_flight < 1 or max_in_flight > MAX_REQUESTS_IN_FLIGHT:
+                raise ValueError
+            # end if
+        except ValueError:
+            print("Argument error: number of requests in flight (`-n` option) must be integer number from 1 to {}."\
+                .format(MAX_REQUESTS_IN_FLIGHT))
+            print("Your value: `{}`".format(arg))
+            platf_depend_exit(1)
+        # end try
+
     elif opt in ("-d", "--indir"):
         if not os.path.isdir(arg):
             print("Argument error: directory `{}` does not exist!".format(arg))
@@ -391,7 +415,8 @@ log_info("Start working.")
 
 from src.prober_modules.prober_spec import look_around
 from src.prober_modules.networking import verify_taxids
-from src.prober_modules.kernel import submit, retrieve_ready_job
+from functools import partial
+from src.prober_modules.kernel import submit, retrieve_ready_job, submit_pipelined, keep_in_flight
 
 # Make sure that TaxIDs specified by user actually exist
 organisms = verify_taxids(taxid_list)
@@ -417,6 +442,9 @@ if max_seq_len < float("inf"):
     printlog_info(" - Maximum length of a sequence to submit: {} bp;".format(max_seq_len))
 # end if
 printlog_info(" - BLAST algorithm: {};".format(blast_algorithm))
+if max_in_flight > 1:
+    printlog_info(" - Requests in flight: up to {};".format(max_in_flight))
+# end if
 printlog_info(" - Database: nr/nt;")
 if len(organisms) > 0:
     for db_slice in organisms:
@@ -470,19 +498,20 @@ stop = False
 # Further:
 # 1. 'previous_data' is a dict of the following structure:
 # {
-#     "RID": saved_RID <str>,
-#     "packet_size_save": saved packet size <int>,
-#     "packet_size_mode": saved packet mode <int>,
+#     "saved_requests": requests in flight saved in tmp file: tuples
+#         (<Request ID or None>, <packet size or None>, <packet mode or None>) <list<tuple<str, int, int>>>,
 #     "tsv_respath": path_to_tsv_file_from_previous_run <str>,
 #     "n_done_reads": number_of_successfull_requests_from_currenrt_FASTA_file <int>,
 #     "tmp_fpath": path_to_pemporary_file <str>,
-#     "decr_pb": valuse decreasing size of probing batch (see below, where this variable is used) <int>
+#     "decr_pb": valuse decreasing size of probing batch (see below, where this variable is used) <int>,
+#     "resume_point": resume point from previous run (see `src.resume_point`) <dict> or None
 # }
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # 2. 'packet' is a dict of the following structure:
 #    {
 #        "fasta": FASTA_data_containing_query_sequences (str),
-#        "qual": dictionary {seq_id: quality}
+#        "qual": dictionary {seq_id: quality},
+#        "resume_point": resume point of the last sequence in packet (see `src.resume_point`)
 #    }
 #    quality is '-' for fasta files
 
@@ -509,16 +538,16 @@ for i, fq_fa_path in enumerate(fq_fa_list):
             "classification")) # form path of result tsv file
         tmp_fpath = "{}_{}_temp.txt".format(os.path.join(new_dpath,
             infile_hname), blast_algorithm) # form path to temporary file
-        saved_RID = None
-        saved_packet_size = None
-        saved_packet_mode = None
+        saved_requests = list()
+        resume_point = None
     else: # if there is data from previous run
         num_done_seqs = previous_data["n_done_reads"] # get number of successfully processed sequences
         tsv_res_path = previous_data["tsv_respath"] # result tsv file should be the same as during previous run
         tmp_fpath = previous_data["tmp_fpath"] # temporary file should be the same as during previous run
-        saved_RID = previous_data["RID"] # having this RID we can try to get response for last request without resending
-        saved_packet_size = previous_data["packet_size_save"]
-        saved_packet_mode = previous_data["packet_mode_save"]
+        # Having these RIDs we can try to get responses for last requests without resending
+        saved_requests = list(previous_data["saved_requests"])
+        # Resume point allows to start reading input file right after processed sequences
+        resume_point = previous_data["resume_point"]
         # Let's assume that a user won't modify his/her brobing_batch size between erroneous runs:
         #   subtract num_done_reads if probing_batch_size > num_done_reads.
         probing_batch_size -= previous_data["decr_pb"]
@@ -547,33 +576,59 @@ for i, fq_fa_path in enumerate(fq_fa_list):
     # Choose appropriate record generator:
     packet_generator = fastq_packets if is_fastq(fq_fa_path) else fasta_packets
 
-    # Iterate over packets in current file
-    for packet in packet_generator(fq_fa_path, packet_size, num_done_seqs, packet_mode,
-        saved_packet_size, saved_packet_mode, max_seq_len, probing_batch_size):
-
-        # Assumption that we need to submit current packet (that we cannot just request for results)
-        send = True
+    # Packets saved in tmp file are formed with saved sizes and modes
+    packets = packet_generator(fq_fa_path, packet_size, num_done_seqs, packet_mode,
+        [(size, mode) for _, size, mode in saved_requests], max_seq_len, probing_batch_size, resume_point)
 
-        # If current packet has been already send, we can try just to request for results
-        if not saved_RID is None:
-            send = retrieve_ready_job(saved_RID, packet, packet_size, packet_mode, pack_to_send, seqs_processed,
-                fq_fa_path, tmp_fpath, taxonomy_path, tsv_res_path, acc_fpath,
-                blast_algorithm, __author_email__, organisms, acc_dict, out_of_n)
-            saved_RID = None
-        # end if
-
-        # Submit current packet to BLAST server
-        if send:
-            submit(packet, packet_size, packet_mode, pack_to_send, seqs_processed,
-                fq_fa_path, tmp_fpath, taxonomy_path, tsv_res_path, acc_fpath,
-                blast_algorithm, __author_email__, organisms, acc_dict, out_of_n)
-        # end if
+    if max_in_flight > 1:
+        # Keep several requests in flight
+        submit_pipelined(packets, max_in_flight, saved_requests, packet_size, packet_mode,
+            pack_to_send, seqs_processed,
+            fq_fa_path, tmp_fpath, taxonomy_path, tsv_res_path, acc_fpath,
+            blast_algorithm, __author_email__, organisms, acc_dict, out_of_n, probing_batch_size)
 
         if not send_all and seqs_processed[0] >= probing_batch_size: # probing batch is processed -- finish work
             stop = True
-            break
         # end if
-    # end for
+    else:
+        # Iterate over packets in current file
+        for packet in packets:
+
+            # Assumption that we need to submit current packet (that we cannot just request for results)
+            send = True
+
+            # Packets saved in tmp file might have non-standard size and mode
+            rid, size, mode = saved_requests.pop(0) if len(saved_requests) != 0 else (None, None, None)
+            if size is None:
+                size, mode = packet_size, packet_mode
+            # end if
+
+            # Requests, which are still to be retrieved, are kept in tmp file
+            #   when results of current packet are written
+            save_in_flight = partial(keep_in_flight, tmp_fpath, saved_requests)
+
+            # If current packet has been already send, we can try just to request for results
+            if not rid is None:
+                send = retrieve_ready_job(rid, packet, size, mode, pack_to_send, seqs_processed,
+                    fq_fa_path, tmp_fpath, taxonomy_path, tsv_res_path, acc_fpath,
+                    blast_algorithm, __author_email__, organisms, acc_dict, out_of_n, save_in_flight,
+                    saved_requests)
+            # end if
+
+            # Submit current packet to BLAST server
+            if send:
+                submit(packet, size, mode, pack_to_send, seqs_processed,
+                    fq_fa_path, tmp_fpath, taxonomy_path, tsv_res_path, acc_fpath,
+                    blast_algorithm, __author_email__, organisms, acc_dict, out_of_n, saved_requests,
+                    save_in_flight)
+            # end if
+
+            if not send_all and seqs_processed[0] >= probing_batch_size: # probing batch is processed -- finish work
+                stop = True
+                break
+            # end if
+        # end for
+    # end if
     if stop:
         break
     # end if
@@ -7,17 +7,34 @@ import sys
 
 from xml.etree import ElementTree # for retrieving information from XML BLAST report
 import subprocess as sp
+import tempfile
+import threading
+import queue
+from time import time
 
-from src.printlog import printlog_error, printlog_error_time
+from src.printlog import printlog_error, printlog_error_time, log_info
 from src.platform import platf_depend_exit
 from src.filesystem import remove_bad_chars
 from src.filesystem import rename_file_verbosely
+from src.resume_point import truncate_partial_line
 
 # Pattern for GenBank accession number
 # See https://www.ncbi.nlm.nih.gov/genbank/acc_prefix/
 #   and maybe https://www.ncbi.nlm.nih.gov/books/NBK21091/table/ch18.T.refseq_accession_numbers_and_mole/?report=objectonly/
 GB_ACC_PATTERN = r"([A-Z]{2}_)?([A-Z]{1,2})?[0-9]{5,8}(\.[0-9]+)?"
 
+# Tags of XML elements containing alignments (they are not used)
+_ALIGNMENT_TAGS = ("Hsp_qseq", "Hsp_hseq", "Hsp_midline")
+
+# Columns of tabular blastn output (`-outfmt 7`).
+# Raw score is used instead of bitscore to find hits with equal scores:
+#   tabular output contains rounded bitscores, but raw scores are integers.
+TAB_OUTFMT_FIELDS = "qlen sacc stitle length nident gaps evalue score"
+
+# Name of checkpoint file placed beside classification file
+#   (see src/barapost_local_modules/chunk_scheduler.py)
+CHECKPOINT_FNAME = "classification_checkpoint.tsv"
+
 
 def look_around(new_dpath, fq_fa_path):
     # Function looks around in order to check if there are results from previous runs of this script.
@@ -26,31 +43,85 @@ def look_around(new_dpath, fq_fa_path):
     # If there are results from previous run, returns a dict of the following structure:
     # {
     #     "tsv_respath": path_to_tsv_file_from_previous_run (str),
-    #     "n_done_reads": number_of_successfull_requests_from_currenrt_FASTA_file (int),
+    #     "complete": whether the file is completely processed (bool),
+    #     "chunk_size": number of sequences in a chunk (int or None if there is no checkpoint file),
+    #     "n_passed_reads": number of sequences passed before the first chunk (int),
+    #     "done_chunks": numbers of classified chunks (set<int>),
     # }
+    # If checkpoint file exists, classification file is truncated to the size recorded last:
+    #   results of a chunk, which is not recorded in checkpoint file, might be written partially.
+    # Classification files written without checkpoint file (by previous versions of barapost-local)
+    #   are considered to contain results of sequences from the beginning of the file.
     #
     # :param new_dpath: path to current (corresponding to fq_fa_path file) result directory;
     # :type new_dpath: str;
     # :param fq_fa_path: path to current (corresponding to fq_fa_path file) FASTA file;
     # :type fq_fa_path: str;
 
-    # "hname" means human readable name (i.e. without file path and extention)
-    fasta_hname = os.path.basename(fq_fa_path) # get rid of absolute path
-    fasta_hname = re.search(r"(.*)\.(m)?f(ast)?a", fasta_hname).group(1) # get rid of '.fasta' extention
-
     # Form path to result file
     tsv_res_fpath = os.path.join(new_dpath, "classification.tsv")
+    checkpoint_fpath = os.path.join(new_dpath, CHECKPOINT_FNAME)
+
+    if not os.path.exists(tsv_res_fpath) and not os.path.exists(checkpoint_fpath):
+        return None
+    # end if
 
-    num_done_reads = 0 # variable to keep number of succeffdully processed sequences
+    previous_data = {
+        "tsv_respath": tsv_res_fpath,
+        "complete": False,
+        "chunk_size": None,
+        "n_passed_reads": 0,
+        "done_chunks": set(),
+    }
 
-    if os.path.exists(tsv_res_fpath):
+    if os.path.exists(checkpoint_fpath):
 
+        try:
+            with open(checkpoint_fpath, 'r') as checkpoint_file:
+                chunk_size, n_passed_reads, tsv_size = map(int, checkpoint_file.readline().split('\t'))
+                for line in checkpoint_file:
+                    if line.strip() == "complete":
+                        previous_data["complete"] = True
+                        break
+                    # end if
+                    chunk_index, tsv_size_after = map(int, line.split('\t'))
+                    previous_data["done_chunks"].add(chunk_index)
+                    tsv_size = max(tsv_size, tsv_size_after)
+                # end for
+            # end with
+        except (OSError, ValueError) as err:
+            printlog_error_time("Data in checkpoint file `{}` is broken. Reason:"\
+                .format(checkpoint_fpath))
+            printlog_error( str(err) )
+            printlog_error("Starting from the beginning.")
+            rename_file_verbosely(checkpoint_fpath)
+            if os.path.exists(tsv_res_fpath):
+                rename_file_verbosely(tsv_res_fpath)
+            # end if
+            return None
+        # end try
+
+        previous_data["chunk_size"] = chunk_size
+        previous_data["n_passed_reads"] = n_passed_reads
+
+        # Discard results of the chunk, which was being written during interruption
+        if os.path.exists(tsv_res_fpath) and os.path.getsize(tsv_res_fpath) > tsv_size:
+            if tsv_size == 0:
+                os.unlink(tsv_res_fpath)
+            else:
+                with open(tsv_res_fpath, 'r+b') as res_file:
+                    res_file.truncate(tsv_size)
+                # end with
+            # end if
+        # end if
+    else:
+        # The last line might have been written partially
+        truncate_partial_line(tsv_res_fpath)
         with open(tsv_res_fpath, 'r') as res_file:
             # There can be invalid information in result file
             try:
-                lines = res_file.readlines()
-                num_done_reads = len(lines) - 1 # the first line is a head
-            except OSError as err:
+                previous_data["n_passed_reads"] = sum(1 for _ in res_file) - 1 # the first line is a head
+            except (OSError, UnicodeDecodeError) as err:
                 printlog_error_time("Data in classification file `{}` is broken. Reason:"\
                     .format(tsv_res_fpath))
                 printlog_error( str(err) )
@@ -59,61 +130,272 @@ def look_around(new_dpath, fq_fa_path):
                 return None
             # end try
         # end with
-    else:
-        return None
+        previous_data["n_passed_reads"] = max(previous_data["n_passed_reads"], 0)
     # end if
 
-    return {
-        "tsv_respath": tsv_res_fpath,
-        "n_done_reads": num_done_reads,
-    }
+    return previous_data
 # end def look_around
 
 
-def launch_blastn(packet, blast_algorithm, use_index, queries_tmp_dir, db_path):
+def launch_blastn(blast_algorithm, use_index, db_path, outfmt=5):
     """
-    Function launches 'blastn' utility from "BLAST+" toolkit and returns it's response.
+    Function launches 'blastn' utility from "BLAST+" toolkit and returns it's process.
+    'blastn' reads queries from it's stdin, and alignment results should be read from it's stdout.
+    Therefore, a single 'blastn' process can classify any number of packets:
+      it starts and loads the database only once.
+    Stderr of 'blastn' is redirected to a temporary file, which is available as `pipe.stderr_file`.
 
-    :param pacekt: FASTA data meant to be processend by 'blastn';
-    :type packet: str;
     :param blast_algorithm: blastn algorithm to use;
     :type blast_algorithm: str;
     :param use_index: logic value inddicating whether to use index;
     :type use_index: bool:
-    :param queries_tmp_dir: path to directory with query files;
-    :type queries_tmp_dir: str:
     :param db_path: path to database;
     :type db_path: str:
+    :param outfmt: format of output: 5 (XML) or 7 (tabular with comments, see `TAB_OUTFMT_FIELDS`);
+    :type outfmt: int:
     """
 
-    # PID of current process won't change, so we can use it to mark query files.
-    # 'paket's are too large to pass them to 'subprocess.Popen' as stdin,
-    #    therefore we need to use these query files.
-    query_path = os.path.join(queries_tmp_dir, "query{}_tmp.fasta".format(os.getpid()))
-
-    with open(query_path, 'w') as query_file:
-        query_file.write(packet)
-    # end with
+    if outfmt == 7:
+        outfmt_arg = "7 {}".format(TAB_OUTFMT_FIELDS)
+    else:
+        outfmt_arg = "5"
+    # end if
 
     # Configure command line
-    blast_cmd = "blastn -query {} -db {} -outfmt 5 -task {} -max_target_seqs 10 -max_hsps 1 -use_index {}"\
-        .format(query_path, db_path, blast_algorithm, use_index)
+    blast_cmd = ["blastn", "-query", "-", "-db", db_path, "-outfmt", outfmt_arg,
+        "-task", blast_algorithm, "-max_target_seqs", "10", "-max_hsps", "1", "-use_index", use_index]
+
+    # Stderr is not piped: if blastn writes much to it while we are reading stdout,
+    #   pipe would be filled and blastn would hang.
+    stderr_file = tempfile.TemporaryFile()
+    pipe = sp.Popen(blast_cmd, stdin=sp.PIPE, stdout=sp.PIPE, stderr=stderr_file)
+    pipe.stderr_file = stderr_file
+
+    return pipe
+# end def launch_blastn
 
-    pipe = sp.Popen(blast_cmd, shell=True, stdout=sp.PIPE, stderr=sp.PIPE)
-    stdout_stderr = pipe.communicate()
+
+def _check_blastn_exit(pipe):
+    # Function waits for 'blastn' to finish and exits if 'blastn' has failed.
+    #
+    # :param pipe: 'blastn' process returned by function `launch_blastn`;
+    # :type pipe: subprocess.Popen;
+
+    pipe.stdout.close()
+    pipe.wait()
 
     if pipe.returncode != 0:
+        pipe.stderr_file.seek(0)
         printlog_error_time("Error occured while aligning a sequence against local database")
-        printlog_error(stdout_stderr[1].decode("utf-8"))
+        printlog_error(pipe.stderr_file.read().decode("utf-8"))
+        pipe.stderr_file.close()
         platf_depend_exit(pipe.returncode)
     # end if
 
-    return stdout_stderr[0].decode("utf-8")
-# end def launch_blastn
+    pipe.stderr_file.close()
+# end def _check_blastn_exit
+
+
+def _feed_blastn(pipe, packets, packet_queue, feed_errors):
+    # Function writes packets to stdin of 'blastn'. It is run in a separate thread.
+    # Before a packet is written, information about it is put to `packet_queue`:
+    #   results of it's queries will be available only after that.
+    # None is put to `packet_queue` after the last packet.
+    #
+    # :param pipe: 'blastn' process returned by function `launch_blastn`;
+    # :type pipe: subprocess.Popen;
+    # :param packets: packets meant to be classified (see `align_packets`);
+    # :type packets: iterable<dict>;
+    # :param packet_queue: queue for information about packets;
+    # :type packet_queue: queue.Queue;
+    # :param feed_errors: list for exceptions raised in this thread;
+    # :type feed_errors: list;
+
+    try:
+        for packet in packets:
+            fasta = packet["fasta"]
+            if not fasta.endswith('\n'):
+                fasta += '\n'
+            # end if
+            packet_queue.put( (packet, _get_query_lens(fasta)) )
+            pipe.stdin.write(fasta.encode("utf-8"))
+            pipe.stdin.flush()
+        # end for
+    except BrokenPipeError:
+        # 'blastn' has crashed -- it's error will be reported by the main thread
+        pass
+    except BaseException as err:
+        # Errors (and exit requests) must be reraised in the main thread
+        feed_errors.append(err)
+    finally:
+        packet_queue.put(None)
+        try:
+            pipe.stdin.close()
+        except BrokenPipeError:
+            pass
+        # end try
+    # end try
+# end def _feed_blastn
+
+
+def align_packets(packets, write_results, blast_algorithm, use_index, db_path, outfmt=5):
+    # Function classifies packets with a single 'blastn' process and passes results
+    #   (lines of TSV file, see function `_result_line`) to 'write_results' packet by packet.
+    # Packets are streamed to stdin of 'blastn' in a separate thread,
+    #   while results are parsed in current thread as soon as 'blastn' writes them.
+    # Time spent on each packet is written to log file.
+    #
+    # :param packets: packets meant to be classified. Each packet is a dict:
+    #     {"fasta": FASTA data (str), "qual": {sequence ID: quality}};
+    # :type packets: iterable<dict>;
+    # :param write_results: function, which writes results of a packet. It takes two arguments:
+    #   the packet itself and list of result TSV lines;
+    # :type write_results: function;
+    # :param blast_algorithm: blastn algorithm to use;
+    # :type blast_algorithm: str;
+    # :param use_index: logic value inddicating whether to use index;
+    # :type use_index: bool:
+    # :param db_path: path to database;
+    # :type db_path: str:
+    # :param outfmt: format of blastn output: 5 (XML) or 7 (tabular);
+    # :type outfmt: int;
+
+    pipe = launch_blastn(blast_algorithm, use_index, db_path, outfmt)
+
+    packet_queue = queue.Queue()
+    feed_errors = list()
+    feeder = threading.Thread(target=_feed_blastn,
+        args=(pipe, packets, packet_queue, feed_errors), daemon=True)
+    feeder.start()
+
+    if outfmt == 7:
+        results = iter_align_results_tab(pipe.stdout)
+    else:
+        results = iter_align_results_xml(pipe.stdout)
+    # end if
+
+    # Information about current packet: (packet, query_lens)
+    curr_packet = packet_queue.get()
+    result_tsv_lines = list()
+    packet_start = time()
+
+    def flush_packet():
+        # Function writes results of current packet and switches to the next one.
+        nonlocal curr_packet, result_tsv_lines, packet_start
+
+        write_results(curr_packet[0], result_tsv_lines)
+
+        log_info("Packet of {} sequences is classified in {} s.".format(len(result_tsv_lines),
+            round(time() - packet_start, 2)))
+
+        curr_packet = packet_queue.get()
+        result_tsv_lines = list()
+        packet_start = time()
+    # end def flush_packet
+
+    try:
+        for query_name, query_len, hit_fields in results:
+
+            # Result may belong to the next packet if 'blastn' has omitted some query
+            while not curr_packet is None and not query_name in curr_packet[1]:
+                flush_packet()
+            # end while
+            if curr_packet is None:
+                break
+            # end if
+
+            packet, query_lens = curr_packet
+            if query_len is None:
+                query_len = query_lens[query_name]
+            # end if
+            result_tsv_lines.append(_result_line(query_name, query_len, hit_fields,
+                packet["qual"][query_name]))
+
+            if len(result_tsv_lines) == len(query_lens):
+                flush_packet()
+            # end if
+        # end for
+    except (ElementTree.ParseError, IndexError, ValueError) as err:
+        # Output is broken most likely because 'blastn' has crashed -- then it's error will be printed.
+        _check_blastn_exit(pipe)
+        printlog_error_time("Error: cannot parse results of alignment.")
+        printlog_error(str(err))
+        platf_depend_exit(1)
+    # end try
+
+    # Write results of the last packet, if 'blastn' has omitted some of it's queries
+    while not curr_packet is None:
+        if len(result_tsv_lines) != 0:
+            flush_packet()
+        else:
+            curr_packet = packet_queue.get()
+        # end if
+    # end while
+
+    feeder.join()
+    _check_blastn_exit(pipe)
+
+    if len(feed_errors) != 0:
+        raise feed_errors[0]
+    # end if
+# end def align_packets
+
+
+def _get_accuracy(avg_quality):
+    # Function returns quality of a read and expected percent of correctly called bases
+    #   formatted for result TSV file.
+    #
+    # :param avg_quality: average quality of a read or '-' if it is unknown;
+    # :type avg_quality: float or str;
+
+    if avg_quality != '-':
+        miscall_prop = round(10**(avg_quality/-10), 3)
+        accuracy = round( 100*(1 - miscall_prop), 2 ) # expected percent of correctly called bases
+    else:
+        # If FASTA file is processing, print dashed in quality columns
+        avg_quality = "-"
+        accuracy = "-" # expected percent of correctly called bases
+    # end if
+
+    return avg_quality, accuracy
+# end def _get_accuracy
+
+
+def _get_query_lens(packet):
+    # Function returns lengths of sequences in a packet.
+    # Tabular output of blastn does not contain lengths of queries having no hits.
+    #
+    # :param packet: FASTA data meant to be processed by 'blastn';
+    # :type packet: str;
+    #
+    # Returns dict<str: str> -- lengths are already formatted for result TSV file.
+    # Sequences are in the same order as in the packet.
+
+    query_lens = dict()
+    query_name = None
+    curr_len = 0
+
+    for line in packet.splitlines():
+        if line.startswith('>'):
+            if not query_name is None:
+                query_lens[query_name] = str(curr_len)
+            # end if
+            query_name = line[1:].strip()
+            curr_len = 0
+        else:
+            curr_len += len(line.strip())
+        # end if
+    # end for
+    if not query_name is None:
+        query_lens[query_name] = str(curr_len)
+    # end if
+
+    return query_lens
+# end def _get_query_lens
 
 
-def parse_align_results_xml(xml_text, qual_dict):
-    # Function parses BLAST xml response and returns tsv lines containing gathered information:
+def _result_line(query_name, query_len, hit_fields, avg_quality):
+    # Function forms result TSV line containing following information:
     #     1. Query name.
     #     2. Hit name formatted by 'format_taxonomy_name()' function.
     #     3. Hit accession.
@@ -125,43 +407,73 @@ def parse_align_results_xml(xml_text, qual_dict):
     #     9. Average Phred33 quality of a read (if source file is FASTQ).
     #     10. Read accuracy (%) (if source file is FASTQ).
     #
-    # :param xml_text: XML text with results of alignment;
-    # :type xml_text: str;
-    # :param qual_dict: dict, which maps sequence IDs to their quality;
-    # :type qual_dict: dict<str: float>;
-    #
-    # Returns list<str>.
+    # :param query_name: name of the query;
+    # :type query_name: str;
+    # :param query_len: length of the query;
+    # :type query_len: str;
+    # :param hit_fields: tuple (annotations, hit_accs, align_len, pident, gaps, evalue)
+    #     or None if there are no hits;
+    # :type hit_fields: tuple<str>;
+    # :param avg_quality: average quality of the query or '-' if it is unknown;
+    # :type avg_quality: float or str;
+
+    avg_quality, accuracy = _get_accuracy(avg_quality)
+
+    if hit_fields is None:
+        # If there is no hit for current sequence
+        return '\t'.join( (query_name, "No significant similarity found", "-", query_len,
+            "-", "-", "-", "-", str(avg_quality), str(accuracy)) )
+    # end if
 
-    result_tsv_lines = list()
+    annotations, hit_accs, align_len, pident, gaps, evalue = hit_fields
 
-    # /=== Parse BLAST XML response ===/
+    return '\t'.join( (query_name, annotations, hit_accs, query_len,
+        align_len, pident, gaps, evalue, str(avg_quality), str(accuracy)) )
+# end def _result_line
 
-    root = ElementTree.fromstring(xml_text) # get tree instance
 
-    # Iterate over "Iteration" and "Iteration_hits" nodes
-    for iter_elem, iter_hit in zip(root.iter("Iteration"), root.iter("Iteration_hits")):
+def iter_align_results_xml(xml_source):
+    # Generator parses BLAST XML output and yields results for each query:
+    #   tuples (query_name, query_len, hit_fields), where `hit_fields` is
+    #   a tuple (annotations, hit_accs, align_len, pident, gaps, evalue) or None if there are no hits
+    #   (see function `_result_line`).
+    #
+    # XML is parsed incrementally: each "Iteration" element (it corresponds to a query)
+    #   is discarded right after it is processed, so memory usage is bounded per query.
+    #
+    # :param xml_source: file object with results of alignment in XML format (e.g. stdout of 'blastn');
+    # :type xml_source: file object;
 
-        # "Iteration" node contains query name information
-        query_name = iter_elem.find("Iteration_query-def").text
-        query_len = iter_elem.find("Iteration_query-len").text
+    # /=== Parse BLAST XML response ===/
 
-        avg_quality = qual_dict[query_name]
-        if avg_quality != '-':
-            miscall_prop = round(10**(avg_quality/-10), 3)
-            accuracy = round( 100*(1 - miscall_prop), 2 ) # expected percent of correctly called bases
-        else:
-            # If FASTA file is processing, print dashed in quality columns
-            avg_quality = "-"
-            accuracy = "-" # expected percent of correctly called bases
+    parent_elem = None # element "BlastOutput_iterations"
+
+    for event, elem in ElementTree.iterparse(xml_source, events=("start", "end")):
+
+        if event == "start":
+            if elem.tag == "BlastOutput_iterations":
+                parent_elem = elem
+            # end if
+            continue
+        elif elem.tag in _ALIGNMENT_TAGS:
+            # We do not need alignments themselves, and they are as long as reads
+            elem.text = None
+            continue
+        elif elem.tag != "Iteration":
+            continue
         # end if
 
+        # "Iteration" node contains query name information
+        query_name = elem.find("Iteration_query-def").text
+        query_len = elem.find("Iteration_query-len").text
+
         # Check if there are any hits
-        chck_h = iter_hit.find("Hit")
+        iter_hit = elem.find("Iteration_hits")
+        chck_h = None if iter_hit is None else iter_hit.find("Hit")
 
         if chck_h is None:
             # If there is no hit for current sequence
-            result_tsv_lines.append('\t'.join( (query_name, "No significant similarity found", "-", query_len,
-                "-", "-", "-", "-", str(avg_quality), str(accuracy)) ))
+            hit_fields = None
         else:
             # If there are any hits, node "Iteration_hits" contains at least one "Hit" child
             # Get first-best bitscore and iterato over hits that have the save (i.e. the highest bitscore):
@@ -194,17 +506,85 @@ def parse_align_results_xml(xml_text, qual_dict):
             # end for
 
             # Divide annotations and accessions with '&&'
-            annotations = '&&'.join(annotations)
-            hit_accs = '&&'.join(hit_accs)
+            hit_fields = ('&&'.join(annotations), '&&'.join(hit_accs),
+                align_len, pident, gaps, evalue)
+        # end if
 
-            # Append new tsv line containing recently collected information
-            result_tsv_lines.append( '\t'.join( (query_name, annotations, hit_accs, query_len,
-                align_len, pident, gaps, evalue, str(avg_quality), str(accuracy)) ))
+        # Discard processed query
+        elem.clear()
+        if not parent_elem is None:
+            parent_elem.clear()
         # end if
+
+        yield query_name, query_len, hit_fields
     # end for
+# end def iter_align_results_xml
+
+
+def _tab_hit_fields(rows):
+    # Function forms hit fields (see function `_result_line`)
+    #   from tabular blastn output for a single query.
+    #
+    # :param rows: rows of tabular output for a query splitted by tabs (see `TAB_OUTFMT_FIELDS`);
+    # :type rows: list<list<str>>;
+
+    if len(rows) == 0:
+        return None
+    # end if
+
+    # Hits are sorted by score: take all hits having the highest score
+    top_score = rows[0][7]
 
-    return result_tsv_lines
-# end def parse_align_results_xml
+    annotations = list()
+    hit_accs = list()
+
+    for row in rows:
+
+        if row[7] != top_score:
+            break
+        # end if
+
+        qlen, sacc, stitle, align_len, pident, gaps, evalue, score = row
+        hit_accs.append( sys.intern(sacc) )
+        annotations.append( remove_bad_chars(stitle) )
+    # end for
+
+    # Divide annotations and accessions with '&&'
+    return ('&&'.join(annotations), '&&'.join(hit_accs), align_len, pident, gaps, evalue)
+# end def _tab_hit_fields
+
+
+def iter_align_results_tab(tab_source):
+    # Generator parses tabular blastn output (`-outfmt 7` with columns `TAB_OUTFMT_FIELDS`)
+    #   and yields results for each query in the same format as `iter_align_results_xml` does.
+    # Query length is None for queries having no hits: tabular output does not contain it.
+    # Output is parsed line by line, so only rows of a single query are kept in memory.
+    #
+    # :param tab_source: file object with tabular output (e.g. stdout of 'blastn');
+    # :type tab_source: binary file object;
+
+    query_name = None
+    rows = list()
+
+    for line in tab_source:
+        line = line.decode("utf-8").rstrip("\r\n")
+
+        # Each query begins with comment lines, including "# Query: <query_name>"
+        if line.startswith("# Query: "):
+            if not query_name is None:
+                yield query_name, rows[0][0] if len(rows) != 0 else None, _tab_hit_fields(rows)
+            # end if
+            query_name = line[9:].strip()
+            rows = list()
+        elif line != "" and not line.startswith('#'):
+            rows.append(line.split('\t'))
+        # end if
+    # end for
+
+    if not query_name is None:
+        yield query_name, rows[0][0] if len(rows) != 0 else None, _tab_hit_fields(rows)
+    # end if
+# end def iter_align_results_tab
 
 
 def configure_acc_dict(acc_fpath, your_own_fasta_lst, accs_to_download):
@@ -275,3 +655,4 @@ def configure_acc_dict(acc_fpath, your_own_fasta_lst, accs_to_download):
 
     return acc_dict
 # end def configure_acc_dict
+
@@ -369,12 +369,13 @@ on your local machine:")
         search_for_related_replicons(acc_dict)
 
         printlog_info_time("Completing taxonomy file...")
-        for i, acc in enumerate(acc_dict.keys()):
-            if not acc in tax_exist_accs:
-                taxonomy.find_taxonomy(acc, acc_dict[acc][1], taxonomy_path)
-            # end if
-            # Accessions can be of different length
-            printn("\r{} - {}: {}/{}".format(getwt(), acc, i+1, len(acc_dict)) + " "*10 + "\b"*10)
+        acc_def_pairs = [(acc, acc_dict[acc]) for acc in acc_dict.keys() if not acc in tax_exist_accs]
+        batch_size = taxonomy.EUTILS_BATCH_SIZE
+        # Taxonomy is downloaded in batches: it takes few requests to NCBI
+        for i in range(0, len(acc_def_pairs), batch_size):
+            taxonomy.find_taxonomy_batch(acc_def_pairs[i : i+batch_size], taxonomy_path)
+            printn("\r{} - {}/{}".format(getwt(), min(i+batch_size, len(acc_def_pairs)),
+                len(acc_def_pairs)) + " "*10 + "\b"*10)
         # end for
         print()
         printlog_info_time("Taxonomy file is consistent.")
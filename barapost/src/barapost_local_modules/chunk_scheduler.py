@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+# This module defines scheduler of classification performed by barapost-local.py.
+#
+# All input files are split into chunks of 'packet_size' sequences (a chunk is a packet).
+# The main process reads input files one by one and puts chunks to a shared queue,
+#   and each worker process takes the next chunk as soon as it has classified the previous one.
+# Thus all workers stay busy till the very end of a run, whatever the sizes of input files are.
+# Each worker classifies all it's chunks with a single 'blastn' process.
+# If an input file is indexed (see src/fai_index.py and src/read_index.py), the main process
+#   does not read it at all: it puts only offsets of chunks to the queue, and workers read chunks themselves.
+#
+# Results of a chunk are written to classification file at once, and then the chunk
+#   is recorded in checkpoint file (see `CHECKPOINT_FNAME`) along with size of
+#   classification file. If a run is interrupted, next run passes recorded chunks and
+#   truncates classification file to the size recorded last (see `look_around`).
+# Checkpoint file has the following structure:
+#   - the first line: <chunk size>\t<number of sequences passed before the first chunk>\t<size of classification file>;
+#   - a line for each classified chunk: <chunk number>\t<size of classification file>;
+#   - the last line (only if the whole file is classified): "complete".
+
+import os
+import sys
+import queue
+import multiprocessing as mp
+
+from src.fasta import fasta_packets, fasta_packets_from_str
+from src.fastq import fastq_packets, fastq_packets_from_str
+from src.fai_index import get_record_offsets, read_records
+from src.read_index import load_read_index, read_range
+from src.resume_point import read_resume_point
+
+from src.platform import platf_depend_exit
+from src.printlog import printlog_info, printlog_info_time, printn, printlog_error, printlog_error_time
+from src.filesystem import create_result_directory, is_fastq
+from src.write_classification import write_classification
+
+from src.barapost_local_modules.barapost_spec import look_around, align_packets, CHECKPOINT_FNAME
+
+
+COMPLETE_MARK = "complete"
+
+
+def init_process(print_lock_buff, write_lock_buff, counter_lock_buff,
+    file_counter_buff, chunks_done_buff, chunks_total_buff, nfiles_buff):
+    # Function initializes global variables that all processes shoud have access to.
+    # This function is called in the main process and in each worker process (see `work`).
+    #
+    # :param print_lock_buff: lock that synchronizes printing to the console;
+    # :type print_lock_buff: multiprocessing.Lock;
+    # :param write_lock_buff: lock that synchronizes writing to result and checkpoint files;
+    # :type write_lock_buff: multiprocessing.Lock;
+    # :param counter_lock_buff: lock that synchronizes access to counters below;
+    # :type counter_lock_buff: multiprocessing.Lock;
+    # :param file_counter_buff: variable for counting processed files;
+    # :type file_counter_buff: mp.Value('i');
+    # :param chunks_done_buff: numbers of chunks of each file classified during current run;
+    # :type chunks_done_buff: mp.Array('i');
+    # :param chunks_total_buff: numbers of chunks of each file queued during current run
+    #   (-1 if the file is not read completely yet);
+    # :type chunks_total_buff: mp.Array('i');
+    # :param nfiles_buff: total number of files;
+    # :type nfiles_buff: int;
+
+    global print_lock
+    print_lock = print_lock_buff
+
+    global write_lock
+    write_lock = write_lock_buff
+
+    global counter_lock
+    counter_lock = counter_lock_buff
+
+    global file_counter
+    file_counter = file_counter_buff
+
+    global chunks_done
+    chunks_done = chunks_done_buff
+
+    global chunks_total
+    chunks_total = chunks_total_buff
+
+    global nfiles
+    nfiles = nfiles_buff
+# end def init_process
+
+
+def _finish_file(file_info):
+    # Function marks file as completely classified and reports it.
+    #
+    # :param file_info: information about file (see `_file_info`);
+    # :type file_info: dict;
+
+    with write_lock:
+        with open(file_info["checkpoint_path"], 'a') as checkpoint_file:
+            checkpoint_file.write(COMPLETE_MARK + '\n')
+        # end with
+    # end with
+
+    with counter_lock:
+        file_counter.value += 1
+        i = file_counter.value # save to local var and release lock
+    # end with
+    with print_lock:
+        sys.stdout.write('\r')
+        printlog_info_time("File #{}/{} (`{}`) is processed.".\
+            format(i, nfiles, os.path.basename(file_info["fq_fa_path"])))
+        printn("Working...")
+    # end with
+# end def _finish_file
+
+
+def _count_chunk(file_index, n_total=None):
+    # Function counts classified chunk of a file or sets total number of chunks of a file.
+    # Returns True if all chunks of the file are classified.
+    #
+    # :param file_index: index of file in list of input files;
+    # :type file_index: int;
+    # :param n_total: total number of chunks queued. If it is None, a classified chunk is counted;
+    # :type n_total: int;
+
+    with counter_lock:
+        if n_total is None:
+            chunks_done[file_index] += 1
+        else:
+            chunks_total[file_index] = n_total
+        # end if
+        return chunks_done[file_index] == chunks_total[file_index]
+    # end with
+# end def _count_chunk
+
+
+def write_chunk_results(chunk, result_tsv_lines):
+    # Function writes results of a chunk to classification file and records the chunk
+    #   in checkpoint file. It is passed to `align_packets` as 'write_results'.
+    #
+    # :param chunk: classified chunk (see `_iter_chunks`);
+    # :type chunk: dict;
+    # :param result_tsv_lines: lines of classification file;
+    # :type result_tsv_lines: list<str>;
+
+    file_info = chunk["file"]
+
+    with write_lock:
+        write_classification(result_tsv_lines, file_info["tsv_res_path"])
+        tsv_size = os.path.getsize(file_info["tsv_res_path"])
+        with open(file_info["checkpoint_path"], 'a') as checkpoint_file:
+            checkpoint_file.write("{}\t{}\n".format(chunk["chunk_index"], tsv_size))
+        # end with
+    # end with
+
+    if _count_chunk(file_info["file_index"]):
+        _finish_file(file_info)
+    # end if
+# end def write_chunk_results
+
+
+def _file_info(file_index, fq_fa_path, new_dpath):
+    # Function returns information about input file, which is necessary for writing results.
+    #
+    # :param file_index: index of file in list of input files;
+    # :type file_index: int;
+    # :param fq_fa_path: path to input file;
+    # :type fq_fa_path: str;
+    # :param new_dpath: path to result directory of this file;
+    # :type new_dpath: str;
+
+    return {
+        "file_index": file_index,
+        "fq_fa_path": fq_fa_path,
+        "tsv_res_path": os.path.join(new_dpath, "classification.tsv"),
+        "checkpoint_path": os.path.join(new_dpath, CHECKPOINT_FNAME),
+    }
+# end def _file_info
+
+
+def _read_chunks(fq_fa_path, chunk_size, num_passed_seqs, resume_point=None):
+    # Generator yields chunks of a file.
+    # If the file is indexed, chunks contain only offsets (key "byte_range" for `.fai` index,
+    #   key "index_range" for read index): they are read by `load_chunk`. Otherwise the file is read here.
+    #
+    # :param fq_fa_path: path to input file;
+    # :type fq_fa_path: str;
+    # :param chunk_size: number of sequences in a chunk;
+    # :type chunk_size: int;
+    # :param num_passed_seqs: number of sequences passed before the first chunk;
+    # :type num_passed_seqs: int;
+    # :param resume_point: resume point saved by barapost-prober (see `src.resume_point`).
+    #   It allows not to read passed sequences if the file is not indexed;
+    # :type resume_point: dict;
+
+    record_offsets = get_record_offsets(fq_fa_path)
+
+    if not record_offsets is None:
+        for start in range(num_passed_seqs, len(record_offsets) - 1, chunk_size):
+            end = min(start + chunk_size, len(record_offsets) - 1)
+            yield {"byte_range": (record_offsets[start], record_offsets[end])}
+        # end for
+        return
+    # end if
+
+    read_index = load_read_index(fq_fa_path)
+
+    if not read_index is None:
+        for start in range(num_passed_seqs, len(read_index), chunk_size):
+            end = min(start + chunk_size, len(read_index))
+            yield {"index_range": read_index.locate(start, end)}
+        # end for
+        return
+    # end if
+
+    if is_fastq(fq_fa_path):
+        packet_generator = fastq_packets
+    else:
+        packet_generator = fasta_packets
+    # end if
+
+    for packet in packet_generator(fq_fa_path, chunk_size, num_passed_seqs, resume_point=resume_point):
+        # Empty packets are yielded if all sequences are passed
+        if len(packet["qual"]) != 0:
+            yield packet
+        # end if
+    # end for
+# end def _read_chunks
+
+
+def load_chunk(chunk):
+    # Function reads chunk, which contains only offsets, from input file.
+    # Other chunks are returned as they are.
+    #
+    # :param chunk: chunk (see `_iter_chunks`);
+    # :type chunk: dict;
+
+    if "byte_range" in chunk or "index_range" in chunk:
+        fq_fa_path = chunk["file"]["fq_fa_path"]
+        if "byte_range" in chunk:
+            data = read_records(fq_fa_path, *chunk["byte_range"])
+        else:
+            data = read_range(fq_fa_path, *chunk["index_range"])
+        # end if
+        if is_fastq(fq_fa_path):
+            packet_generator = fastq_packets_from_str
+        else:
+            packet_generator = fasta_packets_from_str
+        # end if
+        chunk.update(next(packet_generator(data, float("inf"))))
+    # end if
+
+    return chunk
+# end def load_chunk
+
+
+def _iter_chunks(fq_fa_list, packet_size, tax_annot_res_dir):
+    # Generator yields chunks of all input files meant to be classified.
+    # Chunks recorded in checkpoint files are passed.
+    # Each chunk is a packet (see `align_packets`) with additional keys:
+    #   "file" -- information about file (see `_file_info`), "chunk_index" -- number of chunk in file.
+    #
+    # :param fq_fa_list: list of paths to files meant to be processed;
+    # :type fq_fa_list: list<str>;
+    # :param packet_size: number of sequences in a chunk;
+    # :type packet_size: int;
+    # :param tax_annot_res_dir: path to ouput directory that contains taxonomic annotation;
+    # :type tax_annot_res_dir: str;
+
+    for i, fq_fa_path in enumerate(fq_fa_list):
+
+        # Create the result directory with the name of FASTQ of FASTA file being processed:
+        new_dpath = create_result_directory(fq_fa_path, tax_annot_res_dir)
+        file_info = _file_info(i, fq_fa_path, new_dpath)
+
+        # Look around and ckeck if there are results of previous runs of this script
+        # If 'look_around' is None -- there is no data from previous run
+        previous_data = look_around(new_dpath, fq_fa_path)
+
+        if previous_data is None: # If there is no data from previous run
+            chunk_size, num_passed_seqs, done_chunks = packet_size, 0, set()
+        elif previous_data["complete"]:
+            with counter_lock:
+                file_counter.value += 1
+                file_num = file_counter.value # save to local var and release lock
+            # end with
+            with print_lock:
+                sys.stdout.write('\r')
+                printlog_info_time("File #{}/{} (`{}`) has been already completely processed."\
+                    .format(file_num, nfiles, fq_fa_path))
+                printlog_info("Omitting it.")
+                printn("Working...")
+            # end with
+            continue
+        else: # if there is data from previous run
+            # Classification file may be written without checkpoint file
+            chunk_size = previous_data["chunk_size"] or packet_size
+            num_passed_seqs = previous_data["n_passed_reads"]
+            done_chunks = previous_data["done_chunks"]
+        # end if
+
+        if previous_data is None or previous_data["chunk_size"] is None:
+            # Start new checkpoint file
+            tsv_size = 0
+            if os.path.exists(file_info["tsv_res_path"]):
+                tsv_size = os.path.getsize(file_info["tsv_res_path"])
+            # end if
+            with open(file_info["checkpoint_path"], 'w') as checkpoint_file:
+                checkpoint_file.write("{}\t{}\t{}\n".format(chunk_size, num_passed_seqs, tsv_size))
+            # end with
+        # end if
+
+        n_queued = 0
+        # Sequences passed before the first chunk might have been classified by barapost-prober
+        resume_point = read_resume_point(file_info["tsv_res_path"])
+
+        for chunk_index, chunk in enumerate(_read_chunks(fq_fa_path, chunk_size, num_passed_seqs, resume_point)):
+            if not chunk_index in done_chunks:
+                chunk["file"] = file_info
+                chunk["chunk_index"] = chunk_index
+                n_queued += 1
+                yield chunk
+            # end if
+        # end for
+
+        # Chunks may be already classified, or there may be no chunks left at all
+        if _count_chunk(i, n_queued):
+            _finish_file(file_info)
+        # end if
+    # end for
+# end def _iter_chunks
+
+
+def classify_chunks(chunk_queue, blast_algorithm, use_index, db_path, outfmt):
+    # Function classifies chunks taken from the queue till it gets None.
+    #
+    # :param chunk_queue: queue of chunks (see `_iter_chunks`);
+    # :type chunk_queue: multiprocessing.Queue;
+    # :param blast_algorithm: blast algorithm to use;
+    # :type blast_algorithm: str;
+    # :param use_index: logic value indicationg whether to use indes;
+    # :type use_index: bool;
+    # :param db_path: path to database;
+    # :type db_path: str;
+    # :param outfmt: format of blastn output: 5 (XML) or 7 (tabular);
+    # :type outfmt: int;
+
+    align_packets(map(load_chunk, iter(chunk_queue.get, None)), write_chunk_results,
+        blast_algorithm, use_index, db_path, outfmt)
+# end def classify_chunks
+
+
+def work(chunk_queue, shared_args, blast_algorithm, use_index, db_path, outfmt):
+    # Function is run by worker processes: it classifies chunks from the shared queue.
+    #
+    # :param chunk_queue: queue of chunks;
+    # :type chunk_queue: multiprocessing.Queue;
+    # :param shared_args: arguments passed to `init_process`;
+    # :type shared_args: tuple;
+    # Other arguments are the same as of `classify_chunks`.
+
+    init_process(*shared_args)
+    classify_chunks(chunk_queue, blast_algorithm, use_index, db_path, outfmt)
+# end def work
+
+
+def _check_workers(workers):
+    # Function terminates classification if any of worker processes has failed
+    #   (e.g. it has exited via `platf_depend_exit` because blastn failed).
+    # Otherwise the main process would wait forever for the queue or the workers.
+    #
+    # :param workers: worker processes;
+    # :type workers: list<multiprocessing.Process>;
+
+    if any(not proc.is_alive() and proc.exitcode != 0 for proc in workers):
+        for proc in workers:
+            proc.terminate()
+        # end for
+        printlog_error_time("Error occured while classifying sequences in parallel")
+        printlog_error("See error messages above.")
+        platf_depend_exit(1)
+    # end if
+# end def _check_workers
+
+
+def _put(chunk_queue, item, workers):
+    # Function puts 'item' to 'chunk_queue' checking if worker processes are alive.
+    #
+    # :param chunk_queue: queue of chunks;
+    # :type chunk_queue: multiprocessing.Queue;
+    # :param item: item to put;
+    # :param workers: worker processes;
+    # :type workers: list<multiprocessing.Process>;
+
+    while True:
+        try:
+            chunk_queue.put(item, timeout=1)
+        except queue.Full:
+            _check_workers(workers)
+        else:
+            return
+        # end try
+    # end while
+# end def _put
+
+
+def process(fq_fa_list, n_thr, packet_size, tax_annot_res_dir,
+    blast_algorithm, use_index, db_path, outfmt):
+    # Function launches classification by barapost-local.py.
+    #
+    # :param fq_fa_list: list of paths to files meant to be processed;
+    # :type fq_fa_list: list<str>;
+    # :param n_thr: number of threads to launch;
+    # :type n_thr: int;
+    # :param packet_size: number of sequences processed by blast in a single launching;
+    # :type packet_size: int;
+    # :param tax_annot_res_dir: path to ouput directory that contains taxonomic annotation;
+    # :type tax_annot_res_dir: str;
+    # :param blast_algorithm: blast algorithm to use;
+    # :type blast_algorithm: str;
+    # :param use_index: logic value indicationg whether to use indes;
+    # :type use_index: bool;
+    # :param db_path: path to database;
+    # :type db_path: str;
+    # :param outfmt: format of blastn output: 5 (XML) or 7 (tabular);
+    # :type outfmt: int;
+
+    nfiles = len(fq_fa_list)
+    shared_args = (mp.Lock(), mp.Lock(), mp.Lock(), mp.Value('i', 0),
+        mp.Array('i', [0] * nfiles), mp.Array('i', [-1] * nfiles), nfiles)
+
+    # Main process reads input files in any case
+    init_process(*shared_args)
+
+    if n_thr == 1:
+        # Chunks are read and classified in the same process
+        align_packets(map(load_chunk, _iter_chunks(fq_fa_list, packet_size, tax_annot_res_dir)),
+            write_chunk_results, blast_algorithm, use_index, db_path, outfmt)
+        return
+    # end if
+
+    # Queue is bounded: only a few chunks are kept in memory
+    chunk_queue = mp.Queue(maxsize=2 * n_thr)
+
+    workers = [mp.Process(target=work, args=(chunk_queue, shared_args,
+        blast_algorithm, use_index, db_path, outfmt)) for _ in range(n_thr)]
+    for proc in workers:
+        proc.start()
+    # end for
+
+    for chunk in _iter_chunks(fq_fa_list, packet_size, tax_annot_res_dir):
+        _put(chunk_queue, chunk, workers)
+    # end for
+
+    # Stop workers
+    for _ in range(n_thr):
+        _put(chunk_queue, None, workers)
+    # end for
+
+    # Wait for workers checking if they have not failed
+    for proc in workers:
+        while proc.is_alive():
+            proc.join(timeout=1)
+            _check_workers(workers)
+        # end while
+    # end for
+    _check_workers(workers)
+# end def process
@@ -5,14 +5,10 @@ import re
 import sys
 from xml.etree import ElementTree
 
-import socket
-import http.client
-from time import sleep
-
 from src.platform import platf_depend_exit
 from src.printlog import printlog_info, printlog_info_time, printlog_error, log_info
 from src.printlog import printlog_warning, printlog_error_time, getwt
-from src.lingering_https_get_request import lingering_https_get_request
+from src.lingering_https_get_request import lingering_https_get_request, lingering_https_request
 
 
 def _get_record_title(record_id):
@@ -145,11 +141,6 @@ def _is_redundant(nc_acc, accs):
 # end def _is_redundant
 
 
-class _DoesNotRedirectError(Exception):
-    pass
-# end class _DoesNotRedirectError
-
-
 def _ling_https_getreq_handl_301(server, url, request_for=None, acc=None):
     # Name stands for "Lingering Https Get Request Handling 301".
     # Function performs a "lingering" HTTPS request.
@@ -168,45 +159,18 @@ def _ling_https_getreq_handl_301(server, url, request_for=None, acc=None):
     #
     # Returns obtained response coded in UTF-8 ('str').
 
-    error = True
-    while error:
-        try:
-            conn = http.client.HTTPSConnection(server, timeout=10) # create connection
-            conn.request("GET", url) # ask for if there areresults
-            response = conn.getresponse() # get the resonse
-
-            # Handle redirection
-            if response.code == 301:
-                # Link to identical GenBank record is in "Location" header:
-                redirect_url = response.getheader("Location")+"?report=accnlist&log$=seqview&format=text"
-            else:
-                raise _DoesNotRedirectError("NCBI does not redirect, although it must!")
-            # end if
+    response = lingering_https_request("GET", server, url,
+        request_for=request_for, acc=acc, timeout=10, allowed_codes=(200, 301))[0]
 
-        except (OSError, http.client.RemoteDisconnected, socket.gaierror, http.client.CannotSendRequest) as err:
-            comment_str = ""
-            if not request_for is None:
-                comment_str += " requesting for {}".format(request_for)
-                if not acc is None:
-                    comment_str += " (accession: '{}')".format(acc)
-                # end if
-                comment_str += '.'
-            # end if
-            print()
-            printlog_warning("Can't connect to `{}`{}".format(server + url, comment_str))
-            printlog_warning(str(err) )
-            printlog_warning("the program will sleep for 30 seconds and try to connect again.")
-            sleep(30)
-        except _DoesNotRedirectError as err:
-            printlog_error_time(str(err))
-            printlog_error("Please, contact the developer.")
-            platf_depend_exit(1)
-        else:
-            error = False # if no exception ocured, get out of the loop
-        finally:
-            conn.close()
-        # end try
-    # end while
+    # Handle redirection
+    if response.status == 301:
+        # Link to identical GenBank record is in "Location" header:
+        redirect_url = response.getheader("Location")+"?report=accnlist&log$=seqview&format=text"
+    else:
+        printlog_error_time("NCBI does not redirect, although it must!")
+        printlog_error("Please, contact the developer.")
+        platf_depend_exit(1)
+    # end if
 
     # And here goes simple "lingering_https_get_request",
     #   which will retrieve content from redirected location
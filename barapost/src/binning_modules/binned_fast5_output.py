@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+# Module defines output layer for binned FAST5 files.
+#
+# Reads are not copied to output files one by one as they are binned: names of reads are gathered
+#   per output file, and reads are copied when the input file is binned (see `BinnedFast5Output.close`).
+# Each output file is opened once, all it's reads are copied in a row, and it is closed.
+#   Thus only one output file is open at a time.
+#
+# Reads are copied with HDF5 object copy (H5Ocopy) using property lists created once.
+#   Chunks of datasets are copied as they are stored, i.e. compressed data (e.g. VBZ-compressed signal)
+#   is neither decompressed nor recompressed, and filters are preserved.
+
+import time
+
+import h5py
+
+from src.binning_modules.fast5 import open_binned_fast5
+from src.printlog import printlog_error, printlog_error_time, log_info
+
+
+def _copy_plists():
+    # Function returns property lists for copying reads: (<object copy plist>, <link creation plist>).
+    # Intermediate groups are created, so that a read can be copied to a path like "read_<ID>/Raw".
+
+    ocpypl = h5py.h5p.create(h5py.h5p.OBJECT_COPY)
+    lcpl = h5py.h5p.create(h5py.h5p.LINK_CREATE)
+    lcpl.set_create_intermediate_group(True)
+    return ocpypl, lcpl
+# end def _copy_plists
+
+
+def _single_f5_paths(from_f5, read_name):
+    # Function returns list of pairs (<path in source file>, <path in destination file>)
+    #   for copying a read from singleFAST5 file to multiFAST5 one.
+    # The read is stored in group 'read_name'; "UniqueGlobalKey" group is unpacked into it,
+    #   and group "Raw/Reads/Read_<N>" becomes "<read_name>/Raw", as it is in multiFAST5 files.
+    #
+    # :param from_f5: singleFAST5 file;
+    # :type from_f5: h5py.File;
+    # :param read_name: name of a read in multiFAST5 file;
+    # :type read_name: str;
+
+    paths = list()
+
+    for ugk_subgr in from_f5["UniqueGlobalKey"]:
+        paths.append( ("UniqueGlobalKey/" + ugk_subgr, read_name + '/' + ugk_subgr) )
+    # end for
+
+    read_number_group = "Raw/Reads/" + next(iter(from_f5["Raw"]["Reads"]))
+    paths.append( (read_number_group, read_name + "/Raw") )
+
+    for group in from_f5:
+        if group != "Raw" and group != "UniqueGlobalKey":
+            paths.append( (group, read_name + '/' + group) )
+        # end if
+    # end for
+
+    return paths
+# end def _single_f5_paths
+
+
+class BinnedFast5Output:
+    # Output of reads of a FAST5 file to binned FAST5 files.
+    # Usage:
+    #   binned_output = BinnedFast5Output(from_f5)
+    #   binned_output.write(fpath, read_name)
+    #   binned_output.close()
+
+    def __init__(self, from_f5):
+        # :param from_f5: FAST5 file, reads of which are binned (singleFAST5 or multiFAST5);
+        # :type from_f5: h5py.File;
+
+        self._from_f5 = from_f5
+        # "Raw" group always in singleFAST5 root and never in multiFAST5 root
+        self._single = "Raw" in from_f5.keys()
+        self._reads = dict() # {<path to output file>: <list of names of reads>}
+    # end def __init__
+
+    def write(self, fpath, read_name):
+        # Function schedules copying of a read to file 'fpath'.
+        #
+        # :param fpath: path to output file (None if read should not be written);
+        # :type fpath: str;
+        # :param read_name: name of a read (e.g. "read_<ID>");
+        # :type read_name: str;
+
+        if fpath is None:
+            return
+        # end if
+
+        try:
+            self._reads[fpath].append(read_name)
+        except KeyError:
+            self._reads[fpath] = [read_name]
+        # end try
+    # end def write
+
+    def _copy_reads(self, fpath, read_names, ocpypl, lcpl):
+        # Function copies reads to a single output file.
+        # Returns number of copied reads.
+
+        from_f5 = self._from_f5
+        n_copied = 0
+
+        with open_binned_fast5(fpath) as to_f5:
+            for read_name in read_names:
+                try:
+                    if self._single:
+                        paths = _single_f5_paths(from_f5, read_name)
+                    else:
+                        paths = ( (read_name, read_name), )
+                    # end if
+                    for src_path, dest_path in paths:
+                        h5py.h5o.copy(from_f5.id, src_path.encode(), to_f5.id, dest_path.encode(),
+                            copypl=ocpypl, lcpl=lcpl)
+                    # end for
+                except (ValueError, KeyError, RuntimeError) as err:
+                    printlog_error_time("Error: `{}`".format( str(err) ))
+                    printlog_error("Reason is probably the following:")
+                    printlog_error("  read that is copying to the result file is already in this file.")
+                    printlog_error("ID of the read: `{}`".format(read_name))
+                    printlog_error("File: `{}`".format(fpath))
+                    continue
+                # end try
+                n_copied += 1
+            # end for
+        # end with
+
+        return n_copied
+    # end def _copy_reads
+
+    def close(self):
+        # Function copies all scheduled reads: output files are opened one by one.
+        # Throughput is written to log file.
+
+        start_time = time.time()
+        ocpypl, lcpl = _copy_plists()
+        n_copied = 0
+
+        for fpath, read_names in self._reads.items():
+            n_copied += self._copy_reads(fpath, read_names, ocpypl, lcpl)
+        # end for
+
+        elapsed = time.time() - start_time
+        log_info("Reads of `{}`: {} copied to {} files in {:.2f} s ({:.0f} reads/s)."\
+            .format(self._from_f5.filename, n_copied, len(self._reads), elapsed,
+                n_copied / elapsed if elapsed > 0 else 0))
+        self._reads.clear()
+    # end def close
+# end class BinnedFast5Output
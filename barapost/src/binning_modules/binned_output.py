@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# Module defines output layer for binned FASTA and FASTQ files.
+#
+# Records are not written to output files one by one: they are buffered in memory
+#   per output file, and buffers are flushed to files by large blocks (see `FLUSH_SIZE`).
+# Output files are kept open between flushes, but no more than 'max_open_files' of them
+#   (see src/binning_modules/handle_cache.py).
+#
+# If files are binned in parallel, each process has it's own output layer.
+#   Buffers are flushed under a lock shared by all processes, and each output file is flushed
+#   after it's block is written. Files are opened in append mode (O_APPEND), so blocks
+#   written by different processes do not overwrite each other.
+
+import sys
+
+from src.filesystem import is_gzipped, OPEN_FUNCS
+from src.binning_modules.handle_cache import HandleCache, MAX_OPEN_FILES
+
+# Total size of buffered records (in characters), at which buffers are flushed
+FLUSH_SIZE = 4 * 1024 * 1024
+
+
+def _open_binned_file(fpath):
+    # Function opens binned FASTA or FASTQ file in append mode.
+    #
+    # :param fpath: path to binned file;
+    # :type fpath: str;
+
+    how_to_open = OPEN_FUNCS[ is_gzipped(fpath) ]
+    return how_to_open(fpath, 'a')
+# end def _open_binned_file
+
+
+def fastq_record_text(fastq_record):
+    # Function returns text of FASTQ record meant to be written to binned file.
+    #
+    # :param fastq_record: FASTQ record;
+    # :type fastq_record: FastqRecord;
+
+    return "{}\n{}\n{}\n{}\n".format(fastq_record.seq_id, fastq_record.seq,
+        fastq_record.opt_id, fastq_record.qual_line)
+# end def fastq_record_text
+
+
+def fasta_record_text(fasta_record):
+    # Function returns text of FASTA record meant to be written to binned file.
+    #
+    # :param fasta_record: FASTA record;
+    # :type fasta_record: FastaRecord;
+
+    return "{}\n{}\n".format(fasta_record.seq_id, fasta_record.seq)
+# end def fasta_record_text
+
+
+class BinnedOutput:
+    # Buffered output to binned files.
+    # Usage:
+    #   with BinnedOutput(write_lock) as binned_output:
+    #       binned_output.write(fpath, text)
+
+    def __init__(self, lock=None, flush_size=FLUSH_SIZE, max_open_files=MAX_OPEN_FILES):
+        # :param lock: lock, under which buffers are flushed (None for single-thread binning);
+        # :type lock: multiprocessing.Lock;
+        # :param flush_size: total size of buffered records, at which buffers are flushed;
+        # :type flush_size: int;
+        # :param max_open_files: maximum number of output files open simultaneously (see `HandleCache`);
+        # :type max_open_files: int;
+
+        self._lock = lock
+        self._flush_size = flush_size
+        self._buffers = dict() # {<path to output file>: <list of texts of records>}
+        self._buffered_size = 0
+        self.handle_cache = HandleCache(_open_binned_file, max_open_files)
+    # end def __init__
+
+    def write(self, fpath, text):
+        # Function buffers text of a record meant to be written to file 'fpath'.
+        #
+        # :param fpath: path to output file (None if record should not be written);
+        # :type fpath: str;
+        # :param text: text of a record (see `fastq_record_text` and `fasta_record_text`);
+        # :type text: str;
+
+        if fpath is None:
+            return
+        # end if
+
+        try:
+            self._buffers[fpath].append(text)
+        except KeyError:
+            self._buffers[sys.intern(fpath)] = [text]
+        # end try
+
+        self._buffered_size += len(text)
+        if self._buffered_size >= self._flush_size:
+            self.flush()
+        # end if
+    # end def write
+
+    def _flush(self):
+        # Function writes buffers to output files: a single block per file.
+        for fpath, texts in self._buffers.items():
+            binned_file = self.handle_cache.get(fpath)
+            binned_file.write("".join(texts))
+            if not self._lock is None:
+                binned_file.flush()
+            # end if
+        # end for
+        self._buffers.clear()
+        self._buffered_size = 0
+    # end def _flush
+
+    def flush(self):
+        # Function writes all buffered records to output files.
+
+        if self._lock is None:
+            self._flush()
+        else:
+            with self._lock:
+                self._flush()
+            # end with
+        # end if
+    # end def flush
+
+    def close(self):
+        # Function writes all buffered records to output files and closes them.
+
+        self.flush()
+        if self._lock is None:
+            self.handle_cache.close()
+        else:
+            with self._lock:
+                self.handle_cache.close()
+            # end with
+        # end if
+    # end def close
+
+    def __enter__(self):
+        return self
+    # end def __enter__
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    # end def __exit__
+# end class BinnedOutput
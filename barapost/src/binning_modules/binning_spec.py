@@ -3,11 +3,11 @@
 
 import os
 import re
-import sys
 from glob import glob
 
 
 import src.taxonomy
+from src.binning_modules.classif_table import ClassifTable
 from src.platform import platf_depend_exit
 from src.filesystem import remove_bad_chars
 from src.printlog import printlog_warning, printlog_info, printlog_error, printlog_error_time
@@ -167,9 +167,41 @@ def format_taxonomy_name(hit_acc, hit_def, sens, tax_dict):
 # end def format_taxonomy_name
 
 
-def configure_resfile_lines(tsv_res_fpath, sens, taxonomy_path):
-    # Function returns dictionary, where keys are sequence (i.e. sequences meant to be binned) IDs,
-    #     and values are corresponding hit names.
+def _read_resfile_lines(tsv_res_fpath, offsets=None):
+    # Generator yields informative lines of TSV file containing taxonomic annotation.
+    # If 'offsets' are specified, only lines starting at these offsets (in bytes) are read
+    #   (see src/binning_modules/fast5_index.py). Otherwise all lines are read.
+    #
+    # :param tsv_res_fpath: path to TSV file;
+    # :type tsv_res_fpath: str;
+    # :param offsets: offsets of lines to read;
+    # :type offsets: list<int>;
+
+    if offsets is None:
+        with open(tsv_res_fpath, 'r') as brpst_resfile:
+            brpst_resfile.readline() # pass the head of the table
+            line = brpst_resfile.readline().strip() # get the first informative line
+
+            while line != "":
+                yield line
+                line = brpst_resfile.readline().strip() # get next line
+            # end while
+        # end with
+    else:
+        with open(tsv_res_fpath, 'rb') as brpst_resfile:
+            for offset in offsets:
+                brpst_resfile.seek(offset)
+                yield brpst_resfile.readline().decode("utf-8").strip()
+            # end for
+        # end with
+    # end if
+# end def _read_resfile_lines
+
+
+def configure_resfile_lines(tsv_res_fpath, sens, taxonomy_path, offsets=None):
+    # Function returns table of classification (see src/binning_modules/classif_table.py),
+    #     which maps sequence (i.e. sequences meant to be binned) IDs
+    #     to corresponding hit names, quality, length, identity and coverage.
     #
     # :param tsv_res_fpath: path to current TSV file. Binning will be performed accorfing to this TSV file;
     # :type tsv_res_fpath: str;
@@ -177,102 +209,96 @@ def configure_resfile_lines(tsv_res_fpath, sens, taxonomy_path):
     # :type sens: str;
     # :parm taxonomy_path: path to taxonomy file;
     # :type taxonomy_file: str;
+    # :param offsets: offsets of lines to read (see `_read_resfile_lines`). All lines are read if it is None;
+    # :type offsets: list<int>;
 
-    resfile_lines = dict()
+    resfile_lines = ClassifTable()
 
     tax_dict = src.taxonomy.get_tax_dict(taxonomy_path)
 
-    with open(tsv_res_fpath, 'r') as brpst_resfile:
-
-        brpst_resfile.readline() # pass the head of the table
-        line = brpst_resfile.readline().strip() # get the first informative line
-
-        while line != "":
-            splt = line.split('\t')
-            read_name = sys.intern(splt[0])
-            hit_name = splt[1]
-            hit_accs = splt[2]
-
-            try:
-                quality = float(splt[8]) # we will filter by quality
-            except ValueError as verr:
-                if splt[8] == '-':
-                    # Keep minus as quality if there is no quality information.
-                    # Error will not be raised.
-                    quality = splt[8]
-                else:
-                    printlog_error_time("query quality parsing error")
-                    printlog_error( str(verr) )
-                    printlog_error("Please, contact the developer.")
-                    platf_depend_exit(1)
-                # end if
-            # end try
+    for line in _read_resfile_lines(tsv_res_fpath, offsets):
+        splt = line.split('\t')
+        read_name = splt[0]
+        hit_name = splt[1]
+        hit_accs = splt[2]
 
-            try:
-                query_len = int(splt[3])  # we will filter by length
-            except ValueError as verr:
-                printlog_error_time("query length parsing error")
+        try:
+            quality = float(splt[8]) # we will filter by quality
+        except ValueError as verr:
+            if splt[8] == '-':
+                # Keep minus as quality if there is no quality information.
+                # Error will not be raised.
+                quality = splt[8]
+            else:
+                printlog_error_time("query quality parsing error")
                 printlog_error( str(verr) )
                 printlog_error("Please, contact the developer.")
                 platf_depend_exit(1)
-            # end try
-
-            try:
-                pident = float(splt[5]) # we will filter by identity
-            except ValueError as verr:
-                if splt[5] == '-':
-                    # Keep minus as quality if there is no quality information.
-                    # Error will not be raised.
-                    pident = splt[5]
-                else:
-                    printlog_error_time("Alignment percent of identity parsing error")
-                    printlog_error( str(verr) )
-                    printlog_error("Please, contact the developer.")
-                    platf_depend_exit(1)
-                # end if
-            # end try
-
-            try:
-                coverage = float(splt[4]) # we will filter by coverage
-            except ValueError as verr:
-                if splt[4] == '-':
-                    # Keep minus as quality if there is no quality information.
-                    # Error will not be raised.
-                    coverage = splt[4]
-                else:
-                    printlog_error_time("alignment coverage parsing error")
-                    printlog_error( str(verr) )
-                    printlog_error("Please, contact the developer.")
-                    platf_depend_exit(1)
-                # end if
-            # end try
-
-            try:
-                resfile_lines[read_name] = [format_taxonomy_name(hit_accs, hit_name, sens, tax_dict),
-                    quality, query_len, pident, coverage]
-            except NoTaxonomyError:
-                printlog_warning("Can't find taxonomy for reference sequence `{}`".format(hit_accs))
-                printlog_warning("Trying to recover taxonomy.")
-
-                # Recover
-                for acc, annotation in zip(hit_accs.split('&&'), hit_name.split('&&')):
-                    src.taxonomy.recover_taxonomy(acc, annotation, taxonomy_path)
-                    printlog_info("Taxonomy for {} is recovered.".format(acc))
-
-                    # Update tax_dict
-                    tax_dict = src.taxonomy.get_tax_dict(taxonomy_path)
-
-                    # Format again -- with new tax_dict
-                    resfile_lines[read_name] = [
-                        format_taxonomy_name(acc, annotation, sens, tax_dict),
-                        quality, query_len, pident, coverage
-                    ]
-                # end for
-            # end try
-
-            line = brpst_resfile.readline().strip() # get next line
-        # end while
-    # end with
+            # end if
+        # end try
+
+        try:
+            query_len = int(splt[3])  # we will filter by length
+        except ValueError as verr:
+            printlog_error_time("query length parsing error")
+            printlog_error( str(verr) )
+            printlog_error("Please, contact the developer.")
+            platf_depend_exit(1)
+        # end try
+
+        try:
+            pident = float(splt[5]) # we will filter by identity
+        except ValueError as verr:
+            if splt[5] == '-':
+                # Keep minus as quality if there is no quality information.
+                # Error will not be raised.
+                pident = splt[5]
+            else:
+                printlog_error_time("Alignment percent of identity parsing error")
+                printlog_error( str(verr) )
+                printlog_error("Please, contact the developer.")
+                platf_depend_exit(1)
+            # end if
+        # end try
+
+        try:
+            coverage = float(splt[4]) # we will filter by coverage
+        except ValueError as verr:
+            if splt[4] == '-':
+                # Keep minus as quality if there is no quality information.
+                # Error will not be raised.
+                coverage = splt[4]
+            else:
+                printlog_error_time("alignment coverage parsing error")
+                printlog_error( str(verr) )
+                printlog_error("Please, contact the developer.")
+                platf_depend_exit(1)
+            # end if
+        # end try
+
+        try:
+            bin_name = format_taxonomy_name(hit_accs, hit_name, sens, tax_dict)
+        except NoTaxonomyError:
+            printlog_warning("Can't find taxonomy for reference sequence `{}`".format(hit_accs))
+            printlog_warning("Trying to recover taxonomy.")
+
+            # Recover
+            for acc, annotation in zip(hit_accs.split('&&'), hit_name.split('&&')):
+                src.taxonomy.recover_taxonomy(acc, annotation, taxonomy_path)
+                printlog_info("Taxonomy for {} is recovered.".format(acc))
+            # end for
+
+            # Update tax_dict (only recovered lines are read from taxonomy file)
+            tax_dict = src.taxonomy.get_tax_dict(taxonomy_path)
+
+            # Format again -- with new tax_dict
+            bin_name = format_taxonomy_name(hit_accs, hit_name, sens, tax_dict)
+        # end try
+
+        resfile_lines.append(read_name, bin_name, quality, query_len, pident, coverage)
+    # end for
+
+    resfile_lines.build_index()
 
     return resfile_lines
 # end def configure_resfile_lines
@@ -295,7 +321,7 @@ def get_checkstr(fast5_fpath):
     #
     # If no such distinctive string is found in FAST5 file name
     #     (file can be renamed by the user after sequensing)
-    #     whole file name (except of the '.fast5' extention) is returned as checksting.
+    #     whole file name (except of the '.fast5' or '.pod5' extention) is returned as checksting.
     #
     # :param fast5_fpath: path to FAST5 file meant to be processed;
     # :type fast5_fpath: str;
@@ -306,7 +332,7 @@ def get_checkstr(fast5_fpath):
         # I'll lower the 40-character barrier down to 30 just in case.
         filename_payload = re.search(r"([a-zA-Z0-9]{30,}_[0-9]+)", fast5_fpath).group(1)
     except AttributeError:
-        return os.path.basename(fast5_fpath).replace(".fast5", "")
+        return os.path.basename(fast5_fpath).replace(".fast5", "").replace(".pod5", "")
     else:
         return filename_payload
     # end try
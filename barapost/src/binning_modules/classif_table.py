@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+# Module defines compact table of classification used by barapost-binning.
+#
+# Keeping classification in a dict of lists (a key, a list and four numbers per read)
+#   costs several hundreds of bytes per read. This table keeps it in columns:
+#   - IDs of reads are concatenated into a single bytes object;
+#   - names of bins are stored once, and the table keeps indices of them;
+#   - numbers are stored in arrays ('-' is stored as NaN);
+#   - reads are found by their IDs with a hash index (open addressing, CRC32 of ID).
+# Thus a read costs about a hundred of bytes.
+#
+# The table can be dumped to a file and loaded from it with `mmap` (see `dump` and `load`),
+#   so that several processes share a single copy of it.
+
+import sys
+import mmap
+import zlib
+import struct
+from array import array
+
+# Signature of dumped table
+_MAGIC = b"BRPCTBL1"
+# Header of dumped table: signature, number of rows, number of slots in hash index,
+#   size of bin names, size of read IDs
+_HEADER = struct.Struct("<8sQQQQ")
+
+# Value of empty slot in hash index
+_EMPTY = -1
+
+# Columns of numbers: (<name of attribute>, <typecode>)
+_COLUMNS = (
+    ("_id_offsets", 'q'),
+    ("_slots", 'q'),
+    ("_bin_idxs", 'i'),
+    ("_quality", 'd'),
+    ("_query_len", 'q'),
+    ("_pident", 'd'),
+    ("_coverage", 'd'),
+)
+
+
+def _to_float(val):
+    # Function converts '-' (no value) to NaN.
+    return float("nan") if val == '-' else val
+# end def _to_float
+
+
+class ClassifTable:
+    # Table of classification: maps read IDs to tuples
+    #   (<name of bin>, <quality>, <query length>, <identity>, <coverage>).
+    # Usage:
+    #   table = ClassifTable()
+    #   table.append(read_name, bin_name, quality, query_len, pident, coverage)
+    #   table.build_index()
+    #   hit_names, *vals_to_filter = table[read_name]
+
+    def __init__(self):
+        self._ids = bytearray() # concatenated IDs of reads (UTF-8)
+        self._id_offsets = array('q', [0]) # i-th ID is self._ids[self._id_offsets[i]:self._id_offsets[i+1]]
+        self._slots = array('q') # hash index: slot contains number of row or `_EMPTY`
+        self._mask = 0
+        self._bin_names = list()
+        self._bin_dict = dict() # {<name of bin>: <index of bin>}; it is needed only for appending
+        self._bin_idxs = array('i')
+        self._quality = array('d')
+        self._query_len = array('q')
+        self._pident = array('d')
+        self._coverage = array('d')
+        self._mmap = None # if table is loaded from file
+    # end def __init__
+
+    def append(self, read_name, bin_name, quality, query_len, pident, coverage):
+        # Function appends a row to the table. If there are several rows with the same read ID,
+        #   the last one is kept. Index should be built (see `build_index`) after all rows are appended.
+        #
+        # :param read_name: ID of read;
+        # :type read_name: str;
+        # :param bin_name: name of bin (or several names separated by "&&");
+        # :type bin_name: str;
+        # :param quality: mean quality of read or '-';
+        # :type quality: float or str;
+        # :param query_len: length of read;
+        # :type query_len: int;
+        # :param pident: identity of alignment or '-';
+        # :type pident: float or str;
+        # :param coverage: coverage of alignment or '-';
+        # :type coverage: float or str;
+
+        self._ids.extend(read_name.encode("utf-8"))
+        self._id_offsets.append(len(self._ids))
+
+        try:
+            bin_idx = self._bin_dict[bin_name]
+        except KeyError:
+            bin_idx = len(self._bin_names)
+            self._bin_names.append(sys.intern(bin_name))
+            self._bin_dict[bin_name] = bin_idx
+        # end try
+        self._bin_idxs.append(bin_idx)
+
+        self._quality.append(_to_float(quality))
+        self._query_len.append(query_len)
+        self._pident.append(_to_float(pident))
+        self._coverage.append(_to_float(coverage))
+    # end def append
+
+    def _get_id(self, row):
+        # Function returns ID of read in row 'row' (UTF-8 encoded).
+        return self._ids[self._id_offsets[row]:self._id_offsets[row+1]]
+    # end def _get_id
+
+    def build_index(self):
+        # Function builds hash index of read IDs. The index is at most half-full.
+
+        n_rows = len(self._bin_idxs)
+        n_slots = 1
+        while n_slots < 2 * n_rows:
+            n_slots *= 2
+        # end while
+
+        self._slots = array('q', [_EMPTY]) * n_slots
+        self._mask = n_slots - 1
+        self._bin_dict = dict()
+
+        for row in range(n_rows):
+            read_id = self._get_id(row)
+            slot = zlib.crc32(read_id) & self._mask
+            while self._slots[slot] != _EMPTY and self._get_id(self._slots[slot]) != read_id:
+                slot = (slot + 1) & self._mask
+            # end while
+            self._slots[slot] = row # the last row with the same ID replaces previous ones
+        # end for
+    # end def build_index
+
+    def _find_row(self, read_name):
+        # Function returns number of row containing read 'read_name' or `_EMPTY` if there is no such row.
+        #
+        # :param read_name: ID of read;
+        # :type read_name: str;
+
+        read_id = read_name.encode("utf-8")
+        ids, id_offsets, slots, mask = self._ids, self._id_offsets, self._slots, self._mask
+        slot = zlib.crc32(read_id) & mask
+        row = slots[slot]
+        while row != _EMPTY and ids[id_offsets[row]:id_offsets[row+1]] != read_id:
+            slot = (slot + 1) & mask
+            row = slots[slot]
+        # end while
+        return row
+    # end def _find_row
+
+    def __getitem__(self, read_name):
+        row = self._find_row(read_name)
+        if row == _EMPTY:
+            raise KeyError(read_name)
+        # end if
+        quality, pident, coverage = self._quality[row], self._pident[row], self._coverage[row]
+        return (self._bin_names[self._bin_idxs[row]],
+            quality if quality == quality else '-', # NaN is not equal to itself
+            self._query_len[row],
+            pident if pident == pident else '-',
+            coverage if coverage == coverage else '-')
+    # end def __getitem__
+
+    def __contains__(self, read_name):
+        return self._find_row(read_name) != _EMPTY
+    # end def __contains__
+
+    def __len__(self):
+        return len(self._bin_idxs)
+    # end def __len__
+
+    def dump(self, fpath):
+        # Function writes the table to file, which can be loaded by `load`.
+        # Columns are aligned to 8 bytes.
+        #
+        # :param fpath: path to file;
+        # :type fpath: str;
+
+        bin_names = "\n".join(self._bin_names).encode("utf-8")
+        bin_names += b"\0" * (-len(bin_names) % 8)
+
+        with open(fpath, 'wb') as outfile:
+            outfile.write(_HEADER.pack(_MAGIC, len(self), len(self._slots),
+                len(bin_names), len(self._ids)))
+            outfile.write(bin_names)
+            for attr, _ in _COLUMNS:
+                column = getattr(self, attr)
+                column.tofile(outfile)
+                outfile.write(b"\0" * (-len(column) * column.itemsize % 8))
+            # end for
+            outfile.write(self._ids)
+        # end with
+    # end def dump
+
+    @classmethod
+    def load(cls, fpath):
+        # Function loads the table dumped by `dump`. The file is mapped to memory,
+        #   so processes loading the same file share memory.
+        # The loaded table is read-only.
+        #
+        # :param fpath: path to file;
+        # :type fpath: str;
+
+        table = cls()
+        with open(fpath, 'rb') as infile:
+            table._mmap = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        # end with
+        buf = memoryview(table._mmap)
+
+        magic, n_rows, n_slots, bin_names_size, ids_size = _HEADER.unpack_from(buf)
+        if magic != _MAGIC:
+            raise ValueError("file `{}` is not a classification table".format(fpath))
+        # end if
+        pos = _HEADER.size
+
+        bin_names = bytes(buf[pos : pos + bin_names_size]).rstrip(b"\0").decode("utf-8")
+        table._bin_names = list(map(sys.intern, bin_names.split('\n')))
+        pos += bin_names_size
+
+        lengths = {"_id_offsets": n_rows + 1, "_slots": n_slots}
+        for attr, typecode in _COLUMNS:
+            size = lengths.get(attr, n_rows) * array(typecode).itemsize
+            setattr(table, attr, buf[pos : pos + size].cast(typecode))
+            pos += size + (-size % 8)
+        # end for
+
+        table._ids = buf[pos : pos + ids_size]
+        table._mask = n_slots - 1
+        return table
+    # end def load
+
+    def close(self):
+        # Function releases the file mapped to memory (if the table is loaded from file).
+
+        if not self._mmap is None:
+            for attr, _ in _COLUMNS:
+                getattr(self, attr).release()
+            # end for
+            self._ids.release()
+            self._mmap.close()
+            self._mmap = None
+        # end if
+    # end def close
+# end class ClassifTable
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+# Module defines index of "FAST5 untwisting". It maps reads stored in FAST5 files
+#   to lines of TSV files containing their taxonomic annotation.
+#
+# The index is an SQLite database stored in directory `fast5_to_tsvtaxann_idx`
+#   inside the directory with taxonomic annotation. Structure of the index:
+#   - tables `fast5_files` and `tsv_files`: paths to indexed files, their sizes and modification times;
+#   - table `reads`: (<FAST5 file>, <read name>) -> (<TSV file>, <offset of line in TSV file>).
+#     TSV file is NULL for reads, for which classification is not found.
+#
+# Sizes and modification times of files are checked before untwisting (see `get_outdated_fast5_files`),
+#   so that only new and changed FAST5 files are (re)indexed, and entries depending on
+#   changed TSV files are dropped.
+# The database is in WAL mode: several processes can read it while another one writes to it.
+#   Each FAST5 file is added to the index in a single transaction (see `add_fast5_file`).
+
+import os
+import sqlite3
+
+from src.binning_modules.fast5_untwist import NOT_FOUND_KEY
+
+INDEX_DIRNAME = "fast5_to_tsvtaxann_idx"
+INDEX_FNAME = "fast5_to_tsvtaxann_idx.sqlite"
+
+# Version of index format. Index of other version is rebuilt
+_INDEX_VERSION = "1"
+
+# Time (in seconds) to wait for a lock held by another process
+_TIMEOUT = 600
+
+
+def get_index_path(tax_annot_res_dir):
+    # Function returns path to the index.
+    #
+    # :param tax_annot_res_dir: path to directory containing taxonomic annotation;
+    # :type tax_annot_res_dir: str;
+
+    return os.path.join(tax_annot_res_dir, INDEX_DIRNAME, INDEX_FNAME)
+# end def get_index_path
+
+
+def _get_signature(fpath):
+    # Function returns tuple (<size>, <modification time in ns>) of a file.
+    #
+    # :param fpath: path to file;
+    # :type fpath: str;
+
+    stat = os.stat(fpath)
+    return stat.st_size, stat.st_mtime_ns
+# end def _get_signature
+
+
+def _connect(index_path):
+    # Function opens connection to the index.
+    #
+    # :param index_path: path to the index;
+    # :type index_path: str;
+
+    return sqlite3.connect(index_path, timeout=_TIMEOUT)
+# end def _connect
+
+
+def _create_index(index_path):
+    # Function creates empty index (removes the old one, if any).
+    #
+    # :param index_path: path to the index;
+    # :type index_path: str;
+
+    for path in (index_path, index_path + "-wal", index_path + "-shm"):
+        if os.path.exists(path):
+            os.unlink(path)
+        # end if
+    # end for
+
+    conn = _connect(index_path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    with conn:
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute("""CREATE TABLE fast5_files (fast5_id INTEGER PRIMARY KEY,
+            path TEXT UNIQUE, size INTEGER, mtime INTEGER)""")
+        conn.execute("""CREATE TABLE tsv_files (tsv_id INTEGER PRIMARY KEY,
+            path TEXT UNIQUE, size INTEGER, mtime INTEGER)""")
+        conn.execute("""CREATE TABLE reads (fast5_id INTEGER, read_name TEXT,
+            tsv_id INTEGER, row_offset INTEGER,
+            PRIMARY KEY (fast5_id, read_name)) WITHOUT ROWID""")
+        conn.execute("INSERT INTO meta (key, value) VALUES ('version', ?)", (_INDEX_VERSION,))
+    # end with
+    return conn
+# end def _create_index
+
+
+def _open_index(index_path):
+    # Function opens the index. If it does not exist, or it is broken,
+    #   or it is of another format, new empty index is created.
+    #
+    # :param index_path: path to the index;
+    # :type index_path: str;
+
+    if os.path.exists(index_path):
+        try:
+            conn = _connect(index_path)
+            version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if not version is None and version[0] == _INDEX_VERSION:
+                return conn
+            # end if
+            conn.close()
+        except sqlite3.DatabaseError:
+            pass
+        # end try
+    # end if
+
+    return _create_index(index_path)
+# end def _open_index
+
+
+def _drop_fast5_files(conn, fast5_ids):
+    # Function removes FAST5 files from the index.
+    #
+    # :param conn: connection to the index;
+    # :type conn: sqlite3.Connection;
+    # :param fast5_ids: IDs of FAST5 files in the index;
+    # :type fast5_ids: iterable<int>;
+
+    fast5_ids = [(fast5_id,) for fast5_id in fast5_ids]
+    conn.executemany("DELETE FROM reads WHERE fast5_id = ?", fast5_ids)
+    conn.executemany("DELETE FROM fast5_files WHERE fast5_id = ?", fast5_ids)
+# end def _drop_fast5_files
+
+
+def get_outdated_fast5_files(index_path, fast5_list, tsv_taxann_lst):
+    # Function checks the index against current FAST5 and TSV files
+    #   and returns list of FAST5 files, which should be (re)indexed.
+    # Entries of changed FAST5 files, entries of FAST5 files referring to changed or removed
+    #   TSV files, and entries of FAST5 files with not-found reads (if new TSV files appear)
+    #   are removed from the index.
+    #
+    # :param index_path: path to the index;
+    # :type index_path: str;
+    # :param fast5_list: list of paths to FAST5 files meant to be binned;
+    # :type fast5_list: list<str>;
+    # :param tsv_taxann_lst: list of path to TSV files that contain taxonomic annotation;
+    # :type tsv_taxann_lst: list<str>;
+
+    conn = _open_index(index_path)
+
+    with conn:
+        # Check TSV files
+        tsv_signatures = {path: _get_signature(path) for path in tsv_taxann_lst}
+        for tsv_id, path, size, mtime in conn.execute("SELECT * FROM tsv_files").fetchall():
+            if tsv_signatures.get(path) == (size, mtime):
+                del tsv_signatures[path] # TSV file is not changed
+            else:
+                _drop_fast5_files(conn, [row[0] for row in
+                    conn.execute("SELECT DISTINCT fast5_id FROM reads WHERE tsv_id = ?", (tsv_id,))])
+                conn.execute("DELETE FROM tsv_files WHERE tsv_id = ?", (tsv_id,))
+            # end if
+        # end for
+
+        # Now 'tsv_signatures' contains only new and changed TSV files:
+        #   reads, which were not found previously, may be found in them
+        if len(tsv_signatures) != 0:
+            _drop_fast5_files(conn, [row[0] for row in
+                conn.execute("SELECT DISTINCT fast5_id FROM reads WHERE tsv_id IS NULL")])
+        # end if
+        conn.executemany("INSERT INTO tsv_files (path, size, mtime) VALUES (?, ?, ?)",
+            ((path, size, mtime) for path, (size, mtime) in tsv_signatures.items()))
+
+        # Check FAST5 files
+        indexed_fast5 = {path: (fast5_id, (size, mtime)) for fast5_id, path, size, mtime
+            in conn.execute("SELECT * FROM fast5_files")}
+        outdated_fast5_list = list()
+        for f5_path in fast5_list:
+            fast5_id, signature = indexed_fast5.get(f5_path, (None, None))
+            if signature != _get_signature(f5_path):
+                if not fast5_id is None:
+                    _drop_fast5_files(conn, [fast5_id])
+                # end if
+                outdated_fast5_list.append(f5_path)
+            # end if
+        # end for
+    # end with
+    conn.close()
+
+    return outdated_fast5_list
+# end def get_outdated_fast5_files
+
+
+def add_fast5_file(index_path, f5_path, read_rows):
+    # Function adds reads of a FAST5 file to the index in a single transaction.
+    #
+    # :param index_path: path to the index;
+    # :type index_path: str;
+    # :param f5_path: path to FAST5 file;
+    # :type f5_path: str;
+    # :param read_rows: rows (<read name>, <path to TSV file or None>, <offset of line in TSV file>)
+    #   (see `src.binning_modules.fast5_untwist.map_fast5_reads`);
+    # :type read_rows: list<tuple<str, str, int>>;
+
+    size, mtime = _get_signature(f5_path)
+    conn = _connect(index_path)
+
+    with conn:
+        tsv_ids = dict(conn.execute("SELECT path, tsv_id FROM tsv_files"))
+        old_id = conn.execute("SELECT fast5_id FROM fast5_files WHERE path = ?", (f5_path,)).fetchone()
+        if not old_id is None:
+            _drop_fast5_files(conn, old_id)
+        # end if
+        fast5_id = conn.execute("INSERT INTO fast5_files (path, size, mtime) VALUES (?, ?, ?)",
+            (f5_path, size, mtime)).lastrowid
+        conn.executemany("""INSERT OR REPLACE INTO reads (fast5_id, read_name, tsv_id, row_offset)
+            VALUES (?, ?, ?, ?)""",
+            ((fast5_id, read_name, tsv_ids.get(tsv_path), row_offset)
+                for read_name, tsv_path, row_offset in read_rows))
+    # end with
+    conn.close()
+# end def add_fast5_file
+
+
+def get_fast5_reads(index_path, f5_path):
+    # Function returns reads of a FAST5 file grouped by TSV files:
+    #   dictionary {<path to TSV file>: <list of tuples (<read name>, <offset of line in TSV file>)>}.
+    # Reads, for which classification is not found, are listed under key `NOT_FOUND_KEY`.
+    # Reads are sorted by offsets, so that TSV files are read sequentially.
+    # Function returns None if the FAST5 file is not indexed.
+    #
+    # :param index_path: path to the index;
+    # :type index_path: str;
+    # :param f5_path: path to FAST5 file;
+    # :type f5_path: str;
+
+    conn = sqlite3.connect("file:{}?mode=ro".format(index_path), uri=True, timeout=_TIMEOUT)
+
+    fast5_id = conn.execute("SELECT fast5_id FROM fast5_files WHERE path = ?", (f5_path,)).fetchone()
+    if fast5_id is None:
+        conn.close()
+        return None
+    # end if
+
+    reads_by_tsv = dict()
+    for read_name, tsv_path, row_offset in conn.execute("""SELECT read_name, path, row_offset
+        FROM reads LEFT JOIN tsv_files ON reads.tsv_id = tsv_files.tsv_id
+        WHERE fast5_id = ? ORDER BY reads.tsv_id, row_offset""", fast5_id):
+        if tsv_path is None:
+            tsv_path = NOT_FOUND_KEY
+        # end if
+        try:
+            reads_by_tsv[tsv_path].append((read_name, row_offset)) # append to existing list
+        except KeyError:
+            reads_by_tsv[tsv_path] = [(read_name, row_offset)] # create a new list
+        # end try
+    # end for
+    conn.close()
+
+    return reads_by_tsv
+# end def get_fast5_reads
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# Module defines engine of "FAST5 untwisting": it maps reads stored in FAST5 files
+#   to TSV files containing their taxonomic annotation.
+#
+# All TSV files are read once, and IDs of all classified reads are put to a hash index
+#   {<read ID>: (<path to TSV file>, <offset of line>)} (see `build_readid_index`).
+# Then each read of each FAST5 file is found in this index at once (see `map_fast5_reads`),
+#   instead of looking through all TSV files for each FAST5 file.
+# This engine is shared by single-thread and parallel untwisting modules.
+#   POD5 files are untwisted by it as well (see `map_file_reads`).
+# Results are stored in the index defined in src/binning_modules/fast5_index.py.
+
+import sys
+
+from src.fmt_read_id import fmt_read_id
+from src.filesystem import is_pod5
+
+# Key of index entry containing reads, for which classification is not found
+NOT_FOUND_KEY = "CLASSIF_NOT_FOUND"
+
+
+def build_readid_index(tsv_taxann_lst):
+    # Function reads all TSV files containing taxonomic annotation and returns dictionary
+    #   {<read ID>: (<path to TSV file>, <offset of line in TSV file>)}.
+    # If a read is present in several TSV files, the first one of them is kept.
+    # If a read is present in a TSV file several times, the last line is kept
+    #   (like in `src.binning_modules.binning_spec.configure_resfile_lines`).
+    #
+    # :param tsv_taxann_lst: list of path to TSV files that contain taxonomic annotation;
+    # :type tsv_taxann_lst: list<str>;
+
+    readid_index = dict()
+
+    for tsv_taxann_fpath in tsv_taxann_lst:
+        # All values are references to the same string
+        tsv_taxann_fpath = sys.intern(tsv_taxann_fpath)
+        tsv_offsets = dict()
+        with open(tsv_taxann_fpath, 'rb') as taxann_file:
+            offset = len(taxann_file.readline()) # pass the head of the table
+            for line in taxann_file:
+                tsv_offsets[line.partition(b'\t')[0].decode("utf-8")] = offset
+                offset += len(line)
+            # end for
+        # end with
+        for readid, offset in tsv_offsets.items():
+            readid_index.setdefault(readid, (tsv_taxann_fpath, offset))
+        # end for
+    # end for
+
+    return readid_index
+# end def build_readid_index
+
+
+def map_readids(readids, readid_index, read_name_prefix=""):
+    # Function maps reads to TSV files containing their taxonomic annotation.
+    # Returns tuple of two items:
+    #   1) list of tuples (<read name>, <path to TSV file>, <offset of line in TSV file>).
+    #      Path and offset are None for reads, for which classification is not found;
+    #   2) list of IDs of reads, for which classification is not found.
+    #
+    # :param readids: IDs of reads;
+    # :type readids: iterable<str>;
+    # :param readid_index: index returned by `build_readid_index`;
+    # :type readid_index: dict<str: tuple<str, int>>;
+    # :param read_name_prefix: prefix of read names (e.g. "read_" for multiFAST5 files);
+    # :type read_name_prefix: str;
+
+    read_rows = list()
+    missing_readids = list()
+
+    for readid in readids:
+        fmt_id = fmt_read_id(readid)[1:]
+        tsv_taxann_fpath, offset = readid_index.get(fmt_id, (None, None))
+        if tsv_taxann_fpath is None:
+            # Classification if not found in any of classification files
+            missing_readids.append(readid)
+        # end if
+        read_rows.append((read_name_prefix + fmt_id, tsv_taxann_fpath, offset))
+    # end for
+
+    return read_rows, missing_readids
+# end def map_readids
+
+
+def map_fast5_reads(f5_file, readid_index):
+    # Function maps reads stored in FAST5 file to TSV files containing their taxonomic annotation.
+    # Returns the same tuple as `map_readids`. Names of reads are names of their groups: "read_<ID>".
+    #
+    # :param f5_file: FAST5 file;
+    # :type f5_file: h5py.File;
+    # :param readid_index: index returned by `build_readid_index`;
+    # :type readid_index: dict<str: tuple<str, int>>;
+
+    # h5py is not necessary for binning POD5 files, so it is imported here
+    from src.binning_modules.fast5 import fast5_readids
+    return map_readids(fast5_readids(f5_file), readid_index, "read_")
+# end def map_fast5_reads
+
+
+def map_file_reads(fpath, readid_index):
+    # Function maps reads stored in FAST5 or POD5 file to TSV files containing their taxonomic annotation.
+    # Returns the same tuple as `map_readids`.
+    # RuntimeError is raised if the file is broken.
+    #
+    # :param fpath: path to FAST5 or POD5 file;
+    # :type fpath: str;
+    # :param readid_index: index returned by `build_readid_index`;
+    # :type readid_index: dict<str: tuple<str, int>>;
+
+    if is_pod5(fpath):
+        from src.binning_modules.pod5_io import map_pod5_reads
+        return map_pod5_reads(fpath, readid_index)
+    # end if
+
+    import h5py
+
+    # File existance checking is performed while parsing CL arguments.
+    # Therefore, this if-statement will trigger only if fpath's file is not a valid HDF5 file.
+    if not h5py.is_hdf5(fpath):
+        raise RuntimeError("file is not of HDF5 (i.e. not FAST5) format")
+    # end if
+
+    with h5py.File(fpath, 'r') as f5_file:
+        return map_fast5_reads(f5_file, readid_index)
+    # end with
+# end def map_file_reads
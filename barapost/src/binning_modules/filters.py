@@ -102,8 +102,8 @@ def get_align_filter(pident, coverage):
 # end def get_align_filter
 
 
-# Pattern will match .fasta, .fastq and .fast5 extentions without '.gz'
-ext_pattern = r".*(\.(m)?f(ast)?(q|a|5))(\.gz)?$"
+# Pattern will match .fasta, .fastq, .fast5 and .pod5 extentions without '.gz'
+ext_pattern = r".*(\.(m)?f(ast)?(q|a|5)|\.pod5)(\.gz)?$"
 
 
 def get_QL_trash_fpath(fpath, outdir_path, quality, length):
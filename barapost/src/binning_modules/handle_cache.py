@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# Module defines cache of open output files for barapost-binning.
+#
+# There can be thousands of output files (e.g. binning by species), and keeping all of them open
+#   exceeds limit of open file descriptors (and HDF5 files keep their caches in memory).
+# Thus at most 'max_open_files' files are kept open: if one more file is needed,
+#   the least recently used one is closed. Closed files are reopened in append mode when they are needed again.
+
+import sys
+from collections import OrderedDict
+
+from src.platform import platf_depend_exit
+from src.printlog import printlog_error, printlog_error_time, log_info
+
+# Default maximum number of output files open simultaneously (see option `-f`)
+MAX_OPEN_FILES = 128
+
+
+class HandleCache:
+    # LRU cache of open output files.
+    # Usage:
+    #   with HandleCache(lambda fpath: open(fpath, 'a')) as handle_cache:
+    #       handle_cache.get(fpath).write(text)
+
+    def __init__(self, open_fun, max_open_files=MAX_OPEN_FILES):
+        # :param open_fun: function, which opens file in append mode. It takes path to file;
+        # :type open_fun: function;
+        # :param max_open_files: maximum number of files open simultaneously;
+        # :type max_open_files: int;
+
+        self._open_fun = open_fun
+        self._max_open_files = max(1, max_open_files)
+        self._files = OrderedDict() # open files, the least recently used one is the first
+        self._ever_opened = set() # paths to all files opened by this cache
+
+        # Statistics
+        self.hits = 0 # file is open
+        self.misses = 0 # file should be opened (or reopened)
+        self.reopens = 0 # file should be reopened after it was closed
+    # end def __init__
+
+    def get(self, fpath):
+        # Function returns open file. It opens file if necessary.
+        # Returns None if 'fpath' is None (i.e. nothing should be written).
+        #
+        # :param fpath: path to file;
+        # :type fpath: str;
+
+        if fpath is None:
+            return None
+        # end if
+
+        try:
+            self._files.move_to_end(fpath)
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            return self._files[fpath]
+        # end try
+
+        self.misses += 1
+        if fpath in self._ever_opened:
+            self.reopens += 1
+        # end if
+
+        if len(self._files) >= self._max_open_files:
+            self._files.popitem(last=False)[1].close()
+        # end if
+
+        try:
+            file_obj = self._open_fun(fpath)
+        except OSError as oserr:
+            printlog_error_time("Error occured while opening one of result files")
+            printlog_error("Errorneous file: `{}`".format(fpath))
+            printlog_error( str(oserr) )
+            platf_depend_exit(1)
+        # end try
+
+        fpath = sys.intern(fpath)
+        self._files[fpath] = file_obj
+        self._ever_opened.add(fpath)
+        return file_obj
+    # end def get
+
+    def close(self):
+        # Function closes all open files.
+
+        for file_obj in self._files.values():
+            file_obj.close()
+        # end for
+        self._files.clear()
+    # end def close
+
+    def log_stats(self, infile_path):
+        # Function writes statistics of the cache to log file.
+        #
+        # :param infile_path: path to input file, which is binned to the files;
+        # :type infile_path: str;
+
+        log_info("Output files of `{}`: {} written, {} hits, {} misses ({} reopened)."\
+            .format(infile_path, len(self._ever_opened), self.hits, self.misses, self.reopens))
+    # end def log_stats
+
+    def __enter__(self):
+        return self
+    # end def __enter__
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    # end def __exit__
+# end class HandleCache
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# Module defines functions for binning FASTA and FASTQ files, which have an up-to-date read index
+#   (see src/read_index.py).
+#
+# Such a file is not read from the beginning to the end. Reads are routed to binned files by their IDs
+#   only: classification and values for filters are taken from the classification table.
+#   Then reads of each binned file are fetched from the input file at once (in order of the file),
+#   so contents of binned files are the same as if the file was read sequentially.
+#   Reads, which are not written anywhere (e.g. trash reads if trash files are disabled), are not read at all.
+
+import sys
+
+
+def route_reads(read_ids, resfile_lines, QL_filter, align_filter,
+    classif_not_found_fpath, QL_trash_fpath, align_trash_fpath, get_binned_fpath):
+    # Function routes reads to binned files by their IDs.
+    # Returns tuple of four elements: (<dict {<path to binned file>: <list of read IDs>}>,
+    #   <number of sequences, which pass filters>, <number of too short or too low-quality sequences>,
+    #   <number of sequences, which align with too low identity or coverage>).
+    #
+    # :param read_ids: IDs of reads in order of the file (see `ReadIndex.read_ids`);
+    # :type read_ids: list<str>;
+    # :param resfile_lines: classification returned by `configure_resfile_lines`;
+    # :type resfile_lines: ClassifTable;
+    # :param QL_filter: filter for quality and length;
+    # :type QL_filter: function;
+    # :param align_filter: filter for identity and coverage;
+    # :type align_filter: function;
+    # :param classif_not_found_fpath: path to "classification not found" file;
+    # :type classif_not_found_fpath: str;
+    # :param QL_trash_fpath: path to QL trash file (None if trash files are disabled);
+    # :type QL_trash_fpath: str;
+    # :param align_trash_fpath: path to align trash file (None if trash files are disabled);
+    # :type align_trash_fpath: str;
+    # :param get_binned_fpath: function returning path to binned file by name of a hit;
+    # :type get_binned_fpath: function;
+
+    routes = dict()
+    seqs_pass = 0 # counter for sequences, which pass filters
+    QL_seqs_fail = 0 # counter for too short or too low-quality sequences
+    align_seqs_fail = 0 # counter for sequences, which align to their best hit with too low identity or coverage
+
+    def route(fpath, read_name):
+        if fpath is None:
+            return
+        # end if
+        try:
+            routes[fpath].append(read_name)
+        except KeyError:
+            routes[fpath] = [read_name]
+        # end try
+    # end def route
+
+    for read_name in read_ids:
+
+        read_name = sys.intern(read_name)
+
+        try:
+            hit_names, *vals_to_filter = resfile_lines[read_name]  # find hit corresponding to this sequence
+        except KeyError:
+            # Place this sequence into the "classification not found" file
+            route(classif_not_found_fpath, read_name)
+            continue
+        # end try
+
+        # Apply filters
+        if not QL_filter(vals_to_filter):
+            QL_seqs_fail += 1
+            route(QL_trash_fpath, read_name)
+        elif not align_filter(vals_to_filter):
+            align_seqs_fail += 1
+            route(align_trash_fpath, read_name)
+        else:
+            for hit_name in hit_names.split("&&"): # there can be multiple hits for single query sequence
+                route(get_binned_fpath(hit_name), read_name)
+            # end for
+            seqs_pass += 1
+        # end if
+    # end for
+
+    return routes, seqs_pass, QL_seqs_fail, align_seqs_fail
+# end def route_reads
+
+
+def write_routed_reads(read_index, routes, binned_output, record_text):
+    # Function fetches reads of each binned file from indexed input file and writes them.
+    #
+    # :param read_index: read index of input file;
+    # :type read_index: ReadIndex;
+    # :param routes: reads routed to binned files (see `route_reads`);
+    # :type routes: dict<str: list<str>>;
+    # :param binned_output: output of binned files;
+    # :type binned_output: BinnedOutput;
+    # :param record_text: function formatting records;
+    # :type record_text: function;
+
+    with read_index:
+        for fpath, read_names in routes.items():
+            for record in read_index.fetch(read_names):
+                binned_output.write(fpath, record_text(record))
+            # end for
+        # end for
+    # end with
+# end def write_routed_reads
@@ -9,6 +9,7 @@ from functools import partial
 from src.spread_files_equally import spread_files_equally
 from src.binning_modules.parallel_QA import init_paral_binning
 from src.printlog import printn, printlog_info_time
+from src.https_client import make_shared_limits, init_shared_limits
 
 
 def launch_single_thread_binning(fpath_list, binning_func, tax_annot_res_dir, sens,
@@ -60,8 +61,23 @@ def launch_single_thread_binning(fpath_list, binning_func, tax_annot_res_dir, se
 # end def launch_single_thread_binning
 
 
+def _init_binning_process(shared_limits, init_func, *initargs):
+    # Function initializes a binning process.
+    # Processes may request NCBI while recovering missing taxonomy,
+    #   so they share rate limits of requests (see src/https_client.py).
+    #
+    # :param shared_limits: objects returned by `src.https_client.make_shared_limits`;
+    # :type shared_limits: tuple;
+    # :param init_func: function initializing global locks of binning module;
+    # :type init_func: function;
+
+    init_shared_limits(*shared_limits)
+    init_func(*initargs)
+# end def _init_binning_process
+
+
 def launch_parallel_binning(fpath_list, binning_func, tax_annot_res_dir, sens, n_thr,
-    min_qual, min_qlen, min_pident, min_coverage, no_trash):
+    min_qual, min_qlen, min_pident, min_coverage, no_trash, init_func=init_paral_binning):
     # Function launches single-thread binning, performed by finction 'srt_func'.
     #
     # :param fpath_list: list of path to files to process;
@@ -83,14 +99,16 @@ def launch_parallel_binning(fpath_list, binning_func, tax_annot_res_dir, sens, n
     # :type min_coverage: float (or None, if this filter is disabled);
     # :param no_trash: loical value. True if user does NOT want to output trash files;
     # :type no_trash: bool;
+    # :param init_func: function initializing global locks of module, which defines 'binning_func';
+    # :type init_func: function;
 
     # trick
     n_thr = min(n_thr, len(fpath_list))
 
     num_files_total = len(fpath_list)
 
-    pool = mp.Pool(n_thr, initializer=init_paral_binning,
-        initargs=(mp.Lock(), mp.Lock(), mp.Value('i', 0), mp.Lock()))
+    pool = mp.Pool(n_thr, initializer=_init_binning_process,
+        initargs=(make_shared_limits(), init_func, mp.Lock(), mp.Lock(), mp.Value('i', 0), mp.Lock()))
 
     res_stats = pool.starmap(partial(binning_func,
             tax_annot_res_dir=tax_annot_res_dir,
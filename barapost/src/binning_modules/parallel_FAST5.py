@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+# Module defines functions necessary for binning FAST5 files in parallel.
+
+# HDF5 files cannot be written by several processes simultaneously.
+# Therefore each process bins it's FAST5 files to it's own directory (shard) inside the output directory,
+#   and shards are merged afterwards (see `merge_shards`). All shards of a binned file
+#   are merged by a single process, and different binned files are merged in parallel.
+
+import os
+import sys
+import h5py
+import logging
+import multiprocessing as mp
+from glob import glob
+
+from src.printlog import printn, printlog_info_time
+from src.binning_modules.binned_fast5_output import BinnedFast5Output
+
+# Prefix of names of directories, to which processes write binned files
+SHARD_PREFIX = ".fast5_shard_"
+
+
+def init_paral_binning(print_lock_buff, write_lock_buff, fcounter_buff, fcounter_lock_buff):
+    # Function initializes global locks for parallel binning of FAST5 files.
+    # :param print_lock_buff: lock for printing to console;
+    # :type print_lock_buff: multiprocessing.Lock;
+    # :param write_lock_buff: lock for writing to binned files. It is not used: each process writes to it's own shard;
+    # :type write_lock_buff: multiprocessing.Lock;
+
+    global print_lock
+    print_lock = print_lock_buff
+
+    global fcounter
+    fcounter = fcounter_buff
+
+    global fcounter_lock
+    fcounter_lock = fcounter_lock_buff
+# end def init_paral_binning
+
+
+def bin_fast5_files(f5_lst, tax_annot_res_dir, sens, n_thr, min_qual, min_qlen,
+    min_pident, min_coverage, num_files_total, no_trash, bin_fast5_file=None):
+    # Function for parallel binning FAST5 files.
+    # Actually bins multiple files to the shard of current process.
+    #
+    # :param f5_lst: list of paths to FAST5 files meant to be processed;
+    # :type f5_lst: list<str>;
+    # :param min_qual: threshold for quality filter;
+    # :type min_qual: float;
+    # :param min_qlen: threshold for length filter;
+    # :type min_qlen: int (or None, if this filter is disabled);
+    # :param min_pident: threshold for alignment identity filter;
+    # :type min_pident: float (or None, if this filter is disabled);
+    # :param min_coverage: threshold for alignment coverage filter;
+    # :type min_coverage: float (or None, if this filter is disabled);
+    # :param num_files_total: total number of files to process. Needed for printing;
+    # :type num_files_total: int;
+    # :param no_trash: loical value. True if user does NOT want to output trash files;
+    # :type no_trash: bool;
+    # :param bin_fast5_file: function binning a single FAST5 file (with untwisting or not);
+    # :type bin_fast5_file: function;
+
+    outdir_path = os.path.dirname(logging.getLoggerClass().root.handlers[0].baseFilename)
+    shard_dpath = os.path.join(outdir_path, "{}{}".format(SHARD_PREFIX, os.getpid()))
+    if not os.path.isdir(shard_dpath):
+        os.makedirs(shard_dpath)
+    # end if
+
+    seqs_pass = 0 # counter for sequences, which pass filters
+    QL_seqs_fail = 0 # counter for too short or too low-quality sequences
+    align_seqs_fail = 0 # counter for sequences, which align to their best hit with too low identity or coverage
+
+    for f5_path in f5_lst:
+
+        file_stats = bin_fast5_file(f5_path, tax_annot_res_dir, sens, min_qual, min_qlen,
+            min_pident, min_coverage, no_trash, outdir_path=shard_dpath)
+
+        seqs_pass += file_stats[0]
+        QL_seqs_fail += file_stats[1]
+        align_seqs_fail += file_stats[2]
+
+        with fcounter_lock:
+            fcounter.value += 1
+            sys.stdout.write('\r')
+            printlog_info_time("File #{}/{} `{}` is binned."\
+                .format(fcounter.value, num_files_total, os.path.basename(f5_path)))
+            printn(" Working...")
+        # end with
+    # end for
+
+    return (seqs_pass, QL_seqs_fail, align_seqs_fail)
+# end def bin_fast5_files
+
+
+def _merge_binned_file(binned_fpath, shard_fpaths):
+    # Function merges shards of a binned file into the binned file and removes them.
+    # If the binned file does not exist, the largest shard is merely moved to it's place.
+    #
+    # :param binned_fpath: path to binned file;
+    # :type binned_fpath: str;
+    # :param shard_fpaths: paths to files with the same name in shards;
+    # :type shard_fpaths: list<str>;
+
+    # The largest shard is moved, the other ones are copied
+    shard_fpaths = sorted(shard_fpaths, key=os.path.getsize, reverse=True)
+
+    if not os.path.exists(binned_fpath):
+        os.replace(shard_fpaths[0], binned_fpath)
+        shard_fpaths = shard_fpaths[1:]
+    # end if
+
+    if len(shard_fpaths) == 0:
+        return
+    # end if
+
+    # Shards are multiFAST5 files: their reads are copied in bulk like reads of input files
+    for shard_fpath in shard_fpaths:
+        with h5py.File(shard_fpath, 'r') as shard_file:
+            binned_output = BinnedFast5Output(shard_file)
+            for read_name in shard_file:
+                binned_output.write(binned_fpath, read_name)
+            # end for
+            binned_output.close()
+        # end with
+        os.unlink(shard_fpath)
+    # end for
+# end def _merge_binned_file
+
+
+def merge_shards(outdir_path, n_thr):
+    # Function merges shards written by `bin_fast5_files` into output directory and removes them.
+    #
+    # :param outdir_path: path to output directory;
+    # :type outdir_path: str;
+    # :param n_thr: number of threads to launch;
+    # :type n_thr: int;
+
+    shard_dpaths = glob(os.path.join(outdir_path, SHARD_PREFIX + '*'))
+
+    # Group files in shards by names: {<name of binned file>: <list of paths to it's shards>}
+    shards_by_name = dict()
+    for shard_dpath in shard_dpaths:
+        for fname in os.listdir(shard_dpath):
+            try:
+                shards_by_name[fname].append(os.path.join(shard_dpath, fname))
+            except KeyError:
+                shards_by_name[fname] = [os.path.join(shard_dpath, fname)]
+            # end try
+        # end for
+    # end for
+
+    if len(shards_by_name) != 0:
+        pool = mp.Pool(min(n_thr, len(shards_by_name)))
+        pool.starmap(_merge_binned_file,
+            [(os.path.join(outdir_path, fname), shard_fpaths)
+                for fname, shard_fpaths in shards_by_name.items()])
+        pool.close()
+        pool.join()
+    # end if
+
+    for shard_dpath in shard_dpaths:
+        os.rmdir(shard_dpath)
+    # end for
+# end def merge_shards
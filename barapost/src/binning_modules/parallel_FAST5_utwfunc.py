@@ -4,95 +4,54 @@
 
 import os
 import sys
-import h5py
+import sqlite3
 from glob import glob
 
-from shelve import open as open_shelve
-
 from src.fmt_read_id import fmt_read_id
 from src.platform import platf_depend_exit
-from src.binning_modules.fast5 import fast5_readids
+from src.binning_modules.fast5_untwist import map_file_reads
+from src.binning_modules.fast5_index import add_fast5_file, get_index_path
 from src.printlog import printn, printlog_info_time, printlog_error, printlog_error_time
 
-index_name = "fast5_to_tsvtaxann_idx"
-
 
-def init_paral_utw(write_lock_buff, print_lock_buff):
+def init_paral_utw(print_lock_buff, readid_index_buff):
     # Function initializes global locks for funciton 'map_f5reads_2_taxann'.
-    # :param write_lock_buff: lock for writing to output file(s);
-    # :type write_lock_buff: mp.Lock;
+    # The index is written without lock: it is an SQLite database, and SQLite serializes writers itself.
     # :param print_lock_buff: lock for printing to console;
     # :type print_lock_buff: mp.Lock;
-
-    global write_lock
-    write_lock = write_lock_buff
+    # :param readid_index_buff: index mapping read IDs to TSV files that contain taxonomic annotation
+    #   (see `src.binning_modules.fast5_untwist.build_readid_index`).
+    #   It is built once and inherited by all processes;
+    # :type readid_index_buff: dict<str: tuple<str, int>>;
 
     global print_lock
     print_lock = print_lock_buff
-# end def init_paral_binning
-
-
-#   Structure of index:
-# Generally speaking, reads from one FAST5 are spread between several
-# FASTQ (and hence, TSV-taxann) files.
-# Structure of our index allows to minimize times needed to read plain
-# (i.e. sequential access) TSV files.
-# Well, structure of our index is following:
 
-# <DBM file>:
-# {
-#     <path_to_FAST5_1>: {
-#         <path_to_TSV_1.1>: [<read_ID_1.1.1>, <read_ID_1.1.2>, ..., <read_ID_1.1.N>],
-#         <path_to_TSV_1.2>: [<read_ID_1.2.1>, <read_ID_1.2.2>, ..., <read_ID_1.2.N>],
-#         ...
-#         <path_to_TSV_1.M>: [<read_ID_1.M.1>, <read_ID_1.M.2>, ..., <read_ID_1.M.N>]
-#         },
-#     <path_to_FAST5_2>: {
-#         <path_to_TSV_1.1>: [<read_ID_1.1.1>, <read_ID_1.1.2>, ..., <read_ID_1.1.N>],
-#         <path_to_TSV_1.2>: [<read_ID_1.2.1>, <read_ID_1.2.2>, ..., <read_ID_1.2.N>],
-#         ...
-#         <path_to_TSV_2.M>: [<read_ID_2.M.1>, <read_ID_2.M.2>, ..., <read_ID_2.M.N>]
-#         },
-#     ...
-#     <path_to_FAST5_K>: {
-#         <path_to_TSV_K.1>: [<read_ID_K.1.1>, <read_ID_K.1.2>, ..., <read_ID_K.1.N>],
-#         <path_to_TSV_K.2>: [<read_ID_K.2.1>, <read_ID_K.2.2>, ..., <read_ID_K.2.N>],
-#         ...
-#         <path_to_TSV_K.M>: [<read_ID_K.M.1>, <read_ID_K.M.2>, ..., <read_ID_K.M.N>]
-#         }
-# }
+    global readid_index
+    readid_index = readid_index_buff
+# end def init_paral_binning
 
 
-def map_f5reads_2_taxann(f5_fpaths, tsv_taxann_lst, tax_annot_res_dir):
+def map_f5reads_2_taxann(f5_fpaths, tax_annot_res_dir):
     # Function perform mapping of all reads stored in input FAST5 files
     #     to existing TSV files containing taxonomic annotation info.
     #
-    # It creates an DBM index file.
+    # It adds FAST5 files to the index (see src/binning_modules/fast5_index.py).
     #
     # :param f5_fpaths: list of paths to current FAST5 file;
     # :type f5_fpaths: list<str>;
-    # :param tsv_taxann_lst: list of path to TSV files that contain taxonomic annotation;
-    # :type tsv_taxann_lst: list<str>;
     # :param tax_annot_res_dir: path to directory containing taxonomic annotation;
     # :type tax_annot_res_dir: str;
 
-    index_dirpath = os.path.join(tax_annot_res_dir, index_name) # name of directory that will contain indicies
+    index_path = get_index_path(tax_annot_res_dir)
+    index_dirpath = os.path.dirname(index_path)
 
     for f5_path in f5_fpaths:
         # File validation:
-        #   RuntimeError will be raised if FAST5 file is broken.
+        #   RuntimeError will be raised if FAST5 (or POD5) file is broken.
         try:
-            # File existance checking is performed while parsing CL arguments.
-            # Therefore, this if-statement will trigger only if f5_path's file is not a valid HDF5 file.
-            if not h5py.is_hdf5(f5_path):
-                raise RuntimeError("file is not of HDF5 (i.e. not FAST5) format")
-            # end if
-
-            f5_file = h5py.File(f5_path, 'r')
-
-            for _ in f5_file:
-                break
-            # end for
+            # Find all reads of this file in the index
+            read_rows, readids_to_seek = map_file_reads(f5_path, readid_index)
         except RuntimeError as runterr:
             with print_lock:
                 printlog_error_time("Error: FAST5 file is broken")
@@ -104,57 +63,9 @@ def map_f5reads_2_taxann(f5_fpaths, tsv_taxann_lst, tax_annot_res_dir):
             return
         # end try
 
-        readids_to_seek = list(fast5_readids(f5_file))
-        idx_dict = dict() # dictionary for index
-
-        # This saving is needed to compare with 'len(readids_to_seek)'
-        #    after all TSV will be looked through in order to
-        #    determine if some reads miss taxonomic annotation.
-        len_before = len(readids_to_seek)
-
-        # Iterate over TSV-taxann file
-        for tsv_taxann_fpath in tsv_taxann_lst:
-
-            with open(tsv_taxann_fpath, 'r') as taxann_file:
-
-                # Get all read IDs in current TSV
-                readids_in_tsv = list( map(lambda l: l.split('\t')[0], taxann_file.readlines()) )
-
-                # Iterate over all other reads in current FAST5
-                #    ('reversed' is necessary because we remove items from list in this loop)
-                for readid in reversed(readids_to_seek):
-                    fmt_id = fmt_read_id(readid)[1:]
-                    if fmt_id in readids_in_tsv:
-                        # If not first -- write data to dict (and to index later)
-                        try:
-                            idx_dict[tsv_taxann_fpath].append("read_"+fmt_id) # append to existing list
-                        except KeyError:
-                            idx_dict[tsv_taxann_fpath] = ["read_" + fmt_id] # create a new list
-                        finally:
-                            readids_to_seek.remove(readid)
-                        # end try
-                    # end if
-                # end for
-            # end with
-            if len(readids_to_seek) == 0:
-                break
-            # end if
-        # end for
-
-        # Save info about reads, for which classification if not found
-        #   in any of classification files
-        if len(readids_to_seek) != 0:
-            not_fount_key = 'CLASSIF_NOT_FOUND'
-            idx_dict[not_fount_key] = list()
-            for readid in readids_to_seek:
-                fmt_id = fmt_read_id(readid)[1:]
-                idx_dict[not_fount_key].append("read_" + fmt_id)
-            # end for
-        # end if
-
-        # If after all TSV is checked but nothing have changed -- we miss taxonomic annotation
+        # If no read is found in TSV files -- we miss taxonomic annotation
         #     for some reads! And we will write their IDs to 'missing_reads_lst.txt' file.
-        if len(readids_to_seek) == len_before:
+        if len(readids_to_seek) == len(read_rows):
             with print_lock:
                 printlog_error_time("Error: some reads from FAST5 file not found")
                 printlog_error("This FAST5 file: `{}`".format(f5_path))
@@ -179,19 +90,16 @@ def map_f5reads_2_taxann(f5_fpaths, tsv_taxann_lst, tax_annot_res_dir):
             # end with
         # end if
 
-        with write_lock:
-            try:
-                # Open index files appending to existing data ('c' parameter)
-                with open_shelve( os.path.join(index_dirpath, index_name), 'c' ) as index_f5_2_tsv:
-                    # Update index
-                    index_f5_2_tsv[f5_path] = idx_dict
-                # end with
-            except OSError as oserr:
-                printlog_error_time("Error: cannot create index file `{}`".format(os.path.join(index_dirpath, index_name)))
-                printlog_error( str(oserr) )
-                platf_depend_exit(1)
-            # end try
-        # end with
+        try:
+            # Update index
+            add_fast5_file(index_path, f5_path, read_rows)
+        except (OSError, sqlite3.Error) as err:
+            with print_lock:
+                printlog_error_time("Error: cannot update index file `{}`".format(index_path))
+                printlog_error( str(err) )
+            # end with
+            platf_depend_exit(1)
+        # end try
 
         sys.stdout.write('\r')
         printlog_info_time("File `{}` is processed.".format(os.path.basename(f5_path)))
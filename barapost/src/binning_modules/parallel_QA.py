@@ -1,10 +1,9 @@
 # -*- coding: utf-8 -*-
 # Module defines functions necessary for binning FASTA and FASTQ files in parallel.
 
-# If we process files in parallel, we need to open output files each time we need to write to it,
-#    because different processed cannot correctly write to the same file and have their own file descriptors:
-#    it will produce broken files.
-# Thus we will open these files each time and descriptors will be up-to-date.
+# If we process files in parallel, different processes write to the same output files.
+# Each process buffers records and writes them to output files by large blocks under the shared lock
+#   (see src/binning_modules/binned_output.py).
 
 import os
 import sys
@@ -17,44 +16,15 @@ from src.platform import platf_depend_exit
 from src.printlog import printn, printlog_error, printlog_error_time, printlog_info_time
 from src.filesystem import get_curr_res_dpath, is_fastq
 
-from src.binning_modules.fastq_records import fastq_records
-from src.binning_modules.fasta_records import fasta_records
+from src.seq_records import fastq_records, fasta_records
 
 from src.binning_modules.filters import get_QL_filter, get_QL_trash_fpath
 from src.binning_modules.filters import get_align_filter, get_align_trash_fpath
 from src.binning_modules.filters import get_classif_not_found_fpath
-
-
-def write_fastq_record(binned_fpath, fastq_record):
-    # :param binned_fpath: path to file, in which data from fastq_record is oing to be written;
-    # :type binned_fpath: str;
-    # :param fastq_record: dict of 4 elements. Elements are four corresponding lines of FASTQ;
-    # :type fastq_record: dict<str: str>;
-
-    if not binned_fpath is None:
-        with open(binned_fpath, 'a') as binned_file:
-            binned_file.write(fastq_record["seq_id"]+'\n')
-            binned_file.write(fastq_record["seq"]+'\n')
-            binned_file.write(fastq_record["opt_id"]+'\n')
-            binned_file.write(fastq_record["qual_line"]+'\n')
-        # end with
-    # end if
-# end def write_fastq_record
-
-
-def write_fasta_record(binned_fpath, fasta_record):
-    # :param binned_file: file, which data from fasta_record is written in
-    # :type binned_file: _io.TextIOWrapper
-    # :param fasta_record: dict of 2 elements. Elements are four corresponding lines of FASTA
-    # :type fasta_record: dict<str: str>
-
-    if not binned_fpath is None:
-        with open(binned_fpath, 'a') as binned_file:
-            binned_file.write(fasta_record["seq_id"]+'\n')
-            binned_file.write(fasta_record["seq"]+'\n')
-        # end with
-    # end if
-# end def write_fasta_record
+from src.binning_modules.binned_output import BinnedOutput, fastq_record_text, fasta_record_text
+from src.binning_modules.handle_cache import MAX_OPEN_FILES
+from src.binning_modules.indexed_binning import route_reads, write_routed_reads
+from src.read_index import load_read_index
 
 
 def init_paral_binning(print_lock_buff, write_lock_buff, fcounter_buff, fcounter_lock_buff):
@@ -80,7 +50,8 @@ def init_paral_binning(print_lock_buff, write_lock_buff, fcounter_buff, fcounter
 
 
 def bin_fastqa_file(fq_fa_lst, tax_annot_res_dir, sens, n_thr, min_qual,
-    min_qlen, min_pident, min_coverage, num_files_total, no_trash):
+    min_qlen, min_pident, min_coverage, num_files_total, no_trash, gzip_output=False,
+    max_open_files=MAX_OPEN_FILES):
     # Function for parallel binning FASTQ and FASTA files.
     # Actually bins multiple files.
     #
@@ -98,8 +69,13 @@ def bin_fastqa_file(fq_fa_lst, tax_annot_res_dir, sens, n_thr, min_qual,
     # :type num_files_total: int;
     # :param no_trash: loical value. True if user does NOT want to output trash files;
     # :type no_trash: bool;
+    # :param gzip_output: loical value. True if output files should be gzipped;
+    # :type gzip_output: bool;
+    # :param max_open_files: maximum number of output files open simultaneously in each process;
+    # :type max_open_files: int;
 
     outdir_path = os.path.dirname(logging.getLoggerClass().root.handlers[0].baseFilename)
+    out_ext = ".gz" if gzip_output else "" # extention of output files
 
     seqs_pass = 0 # counter for sequences, which pass filters
     QL_seqs_fail = 0 # counter for too short or too low-quality sequences
@@ -112,23 +88,23 @@ def bin_fastqa_file(fq_fa_lst, tax_annot_res_dir, sens, n_thr, min_qual,
         taxonomy_path = os.path.join(tax_annot_res_dir, "taxonomy", "taxonomy.tsv")
         resfile_lines = configure_resfile_lines(tsv_res_fpath, sens, taxonomy_path)
 
-        # Configure path to trash file
+        # Configure generator and function formatting records
         if is_fastq(fq_fa_path):
             seq_records_generator = fastq_records
-            write_fun =  write_fastq_record
+            record_text = fastq_record_text
         else:
             seq_records_generator = fasta_records
-            write_fun = write_fasta_record
+            record_text = fasta_record_text
         # end if
 
         # Configure path to "classification not found" file
-        classif_not_found_fpath = get_classif_not_found_fpath(fq_fa_path, outdir_path)
+        classif_not_found_fpath = get_classif_not_found_fpath(fq_fa_path, outdir_path) + out_ext
 
         # Make filter for quality and length
         QL_filter = get_QL_filter(fq_fa_path, min_qual, min_qlen)
         # Configure path to trash file
         if not no_trash:
-            QL_trash_fpath = get_QL_trash_fpath(fq_fa_path, outdir_path, min_qual, min_qlen,)
+            QL_trash_fpath = get_QL_trash_fpath(fq_fa_path, outdir_path, min_qual, min_qlen,) + out_ext
         else:
             QL_trash_fpath = None
         # end if
@@ -137,76 +113,63 @@ def bin_fastqa_file(fq_fa_lst, tax_annot_res_dir, sens, n_thr, min_qual,
         align_filter = get_align_filter(min_pident, min_coverage)
         # Configure path to this trash file
         if not no_trash:
-            align_trash_fpath = get_align_trash_fpath(fq_fa_path, outdir_path, min_pident, min_coverage)
+            align_trash_fpath = get_align_trash_fpath(fq_fa_path, outdir_path, min_pident, min_coverage) + out_ext
         else:
             align_trash_fpath = None
         # end if
 
-        # Create an iterator that will yield records
-        seq_records_iterator = iter(seq_records_generator(fq_fa_path))
-        # Dict for storing batches of sequences meant to be written to output files:
-        to_write = dict()
-        stop = False # for outer while-loop
-
-        while not stop:
-
-            # Extract batch of records of 'n_thr' size and find their destination paths:
-            for _ in range(n_thr):
-
-                try:
-                    fastqa_rec = next(seq_records_iterator)
-                except StopIteration:
-                    stop = True # for outer while-loop
-                    break
-                # end try
-
-                read_name = sys.intern(fmt_read_id(fastqa_rec["seq_id"])[1:]) # get ID of the sequence
-
-                try:
-                    hit_names, *vals_to_filter = resfile_lines[read_name]  # find hit corresponding to this sequence
-                except KeyError:
-                    # Place this sequence into the "classification not found" file
-                    to_write[read_name] = (fastqa_rec, classif_not_found_fpath)
-                    continue
-                # end try
-
-                # If read is found in TSV file:
-                if not QL_filter(vals_to_filter):
-                    # Place this sequence to QL trash file
-                    to_write[read_name] = (fastqa_rec, QL_trash_fpath)
-                    QL_seqs_fail += 1
-                elif not align_filter(vals_to_filter):
-                    # Place this sequence to QL trash file
-                    to_write[read_name] = (fastqa_rec, align_trash_fpath)
-                    align_seqs_fail += 1
-                else:
-                    for hit_name in hit_names.split("&&"):
-                        # Get name of result FASTQ file to write this read in
-                        binned_file_path = os.path.join(outdir_path, "{}.fast{}".format(hit_name,
-                            'q' if is_fastq(fq_fa_path) else 'a'))
-                        to_write[read_name] = (fastqa_rec, binned_file_path)
-                    # end for
-                    seqs_pass += 1
-                # end if
-            # end for
-
-            # Write batch of records to output files:
-            with write_lock:
-                for record, fpath in to_write.values():
-                    write_fun(fpath, record)
-                # end for
-            # end with
-            to_write.clear()
-        # end while
-
-        with write_lock:
-            # Write the rest of 'uneven' data to output files:
-            if len(to_write) != 0:
-                for record, fpath in to_write.values():
-                    write_fun(fpath, record)
+        # Records are buffered and written to output files by large blocks
+        with BinnedOutput(write_lock, max_open_files=max_open_files) as binned_output:
+
+            read_index = load_read_index(fq_fa_path)
+
+            if not read_index is None:
+                # Reads are routed by their IDs, and reads of each binned file are fetched at once
+                routes, *file_stats = route_reads(read_index.read_ids,
+                    resfile_lines, QL_filter, align_filter, classif_not_found_fpath, QL_trash_fpath, align_trash_fpath,
+                    lambda hit_name: os.path.join(outdir_path, "{}.fast{}{}".format(hit_name,
+                        'q' if is_fastq(fq_fa_path) else 'a', out_ext)))
+                write_routed_reads(read_index, routes, binned_output, record_text)
+                seqs_pass += file_stats[0]
+                QL_seqs_fail += file_stats[1]
+                align_seqs_fail += file_stats[2]
+            else:
+                for fastqa_rec in seq_records_generator(fq_fa_path):
+
+                    read_name = sys.intern(fmt_read_id(fastqa_rec.seq_id)[1:]) # get ID of the sequence
+
+                    try:
+                        hit_names, *vals_to_filter = resfile_lines[read_name]  # find hit corresponding to this sequence
+                    except KeyError:
+                        # Place this sequence into the "classification not found" file
+                        binned_output.write(classif_not_found_fpath, record_text(fastqa_rec))
+                        continue
+                    # end try
+
+                    # If read is found in TSV file:
+                    if not QL_filter(vals_to_filter):
+                        # Place this sequence to QL trash file
+                        binned_output.write(QL_trash_fpath, record_text(fastqa_rec))
+                        QL_seqs_fail += 1
+                    elif not align_filter(vals_to_filter):
+                        # Place this sequence to align_trash file
+                        binned_output.write(align_trash_fpath, record_text(fastqa_rec))
+                        align_seqs_fail += 1
+                    else:
+                        text = record_text(fastqa_rec)
+                        for hit_name in hit_names.split("&&"): # there can be multiple hits for single query sequence
+                            # Get name of result FASTQ file to write this read in
+                            binned_file_path = os.path.join(outdir_path, "{}.fast{}{}".format(hit_name,
+                                'q' if is_fastq(fq_fa_path) else 'a', out_ext))
+                            binned_output.write(binned_file_path, text)
+                        # end for
+                        seqs_pass += 1
+                    # end if
                 # end for
             # end if
         # end with
+        binned_output.handle_cache.log_stats(fq_fa_path)
+
         with fcounter_lock:
             fcounter.value += 1
             sys.stdout.write('\r')
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+# This module defines functions, via which barapost-binning manipulates POD5 data.
+#
+# Input POD5 files are only read: they are never opened in write mode.
+#
+# POD5 files cannot be appended. Therefore binned POD5 files are written by `BinnedPod5Output`:
+#   each binned file is created once (in a temporary file) and is kept open while input files are binned.
+#   If the binned file already exists, it's reads are copied to the new one first.
+#   Binned files are completed and moved to their places, when the output is closed.
+#
+# Reads are copied by pod5 "repacker" (like it is done by `pod5 subset`): compressed signal
+#   is copied as is, without decompression and recompression.
+
+import os
+import time
+
+import pod5
+from pod5.repack import Repacker
+
+from src.printlog import printlog_error, printlog_error_time, log_info
+
+# Suffix of files, to which binned POD5 files are written before they are completed
+TMP_SUFFIX = ".tmp"
+
+
+def pod5_readids(pod5_path):
+    # Function returns list of IDs of all reads in a POD5 file.
+    #
+    # :param pod5_path: path to POD5 file;
+    # :type pod5_path: str;
+
+    with pod5.Reader(pod5_path) as reader:
+        return list(reader.read_ids)
+    # end with
+# end def pod5_readids
+
+
+def map_pod5_reads(pod5_path, readid_index):
+    # Function maps reads stored in POD5 file to TSV files containing their taxonomic annotation.
+    # Returns the same tuple as `src.binning_modules.fast5_untwist.map_fast5_reads`.
+    # Names of reads are their IDs.
+    #
+    # :param pod5_path: path to POD5 file;
+    # :type pod5_path: str;
+    # :param readid_index: index returned by `src.binning_modules.fast5_untwist.build_readid_index`;
+    # :type readid_index: dict<str: tuple<str, int>>;
+
+    from src.binning_modules.fast5_untwist import map_readids
+    return map_readids(pod5_readids(pod5_path), readid_index)
+# end def map_pod5_reads
+
+
+class BinnedPod5Output:
+    # Output of reads to binned POD5 files.
+    # Usage:
+    #   binned_output = BinnedPod5Output()
+    #   for each input file:
+    #     binned_output.write(fpath, read_id)
+    #     binned_output.flush(pod5_path)
+    #   binned_output.close()
+
+    def __init__(self):
+        self._repacker = None
+        self._outputs = dict() # {<path to binned file>: (<writer>, <repacker output>, <set of read IDs>)}
+        self._reads = dict() # {<path to binned file>: <list of IDs of reads to copy>}
+        self._n_copied = 0
+        self._start_time = time.time()
+    # end def __init__
+
+    def _get_output(self, fpath):
+        # Function returns output for a binned file: (<writer>, <repacker output>, <set of read IDs>).
+        # The output is created if necessary.
+
+        try:
+            return self._outputs[fpath]
+        except KeyError:
+            pass
+        # end try
+
+        if self._repacker is None:
+            self._repacker = Repacker()
+        # end if
+
+        tmp_fpath = fpath + TMP_SUFFIX
+        if os.path.exists(tmp_fpath):
+            os.unlink(tmp_fpath) # remains of an interrupted run
+        # end if
+        writer = pod5.Writer(tmp_fpath)
+        repacker_output = self._repacker.add_output(writer)
+        written_readids = set()
+
+        # Binned file is "appended": it's reads are copied to the new one
+        if os.path.exists(fpath):
+            with pod5.Reader(fpath) as reader:
+                written_readids.update(reader.read_ids)
+                self._repacker.add_all_reads_to_output(repacker_output, reader)
+            # end with
+        # end if
+
+        self._outputs[fpath] = (writer, repacker_output, written_readids)
+        return self._outputs[fpath]
+    # end def _get_output
+
+    def write(self, fpath, read_id):
+        # Function schedules copying of a read to file 'fpath'.
+        # Reads are copied by `flush`.
+        #
+        # :param fpath: path to binned file (None if read should not be written);
+        # :type fpath: str;
+        # :param read_id: ID of a read;
+        # :type read_id: str;
+
+        if fpath is None:
+            return
+        # end if
+
+        try:
+            self._reads[fpath].append(read_id)
+        except KeyError:
+            self._reads[fpath] = [read_id]
+        # end try
+    # end def write
+
+    def flush(self, pod5_path):
+        # Function copies scheduled reads from a POD5 file to binned files.
+        #
+        # :param pod5_path: path to POD5 file, reads of which are scheduled;
+        # :type pod5_path: str;
+
+        with pod5.Reader(pod5_path) as reader:
+            for fpath, read_ids in self._reads.items():
+                writer, repacker_output, written_readids = self._get_output(fpath)
+
+                # Duplicated reads would spoil the whole binned file
+                new_read_ids = list()
+                for read_id in read_ids:
+                    if read_id in written_readids:
+                        printlog_error_time("Error: read is already in the binned file.")
+                        printlog_error("ID of the read: `{}`".format(read_id))
+                        printlog_error("File: `{}`".format(fpath))
+                    else:
+                        written_readids.add(read_id)
+                        new_read_ids.append(read_id)
+                    # end if
+                # end for
+
+                if len(new_read_ids) != 0:
+                    self._repacker.add_selected_reads_to_output(repacker_output, reader, new_read_ids)
+                    self._n_copied += len(new_read_ids)
+                # end if
+            # end for
+        # end with
+
+        self._reads.clear()
+    # end def flush
+
+    def add_file(self, fpath, pod5_path):
+        # Function schedules copying of all reads of a POD5 file to file 'fpath'.
+        # Is used for merging binned files.
+        #
+        # :param fpath: path to binned file;
+        # :type fpath: str;
+        # :param pod5_path: path to POD5 file;
+        # :type pod5_path: str;
+
+        self._reads[fpath] = pod5_readids(pod5_path)
+        self.flush(pod5_path)
+    # end def add_file
+
+    def close(self):
+        # Function completes all binned files and moves them to their places.
+        # Throughput is written to log file.
+
+        if self._repacker is None:
+            return
+        # end if
+
+        for writer, repacker_output, _ in self._outputs.values():
+            self._repacker.set_output_finished(repacker_output)
+        # end for
+        self._repacker.finish()
+
+        for fpath, (writer, _, _) in self._outputs.items():
+            writer.close()
+            os.replace(fpath + TMP_SUFFIX, fpath)
+        # end for
+
+        elapsed = time.time() - self._start_time
+        log_info("{} reads are copied to {} binned POD5 files in {:.2f} s ({:.0f} reads/s)."\
+            .format(self._n_copied, len(self._outputs), elapsed,
+                self._n_copied / elapsed if elapsed > 0 else 0))
+
+        self._repacker = None
+        self._outputs.clear()
+        self._n_copied = 0
+    # end def close
+# end class BinnedPod5Output
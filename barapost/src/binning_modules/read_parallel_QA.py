@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+# Module defines functions necessary for binning reads of a single FASTA or FASTQ file in parallel.
+#
+# If there are less input files than threads, binning files in parallel leaves threads idle
+#   (a single huge FASTQ file is binned in a single thread). Thus reads of such file are binned in parallel:
+#   1) the main process reads records and sends them by batches (see `BATCH_SIZE`) to worker processes;
+#   2) worker processes look up classification of reads (the table of classification is built once
+#      and shared by workers via a file mapped to memory, see src/binning_modules/classif_table.py), apply filters and route records to writer processes;
+#   3) each writer process owns a subset of output files (see `_get_writer_idx`) and writes records to them.
+# Since each output file is written by a single process, no lock is needed to write to it.
+# Records in output files may be in order different from order of sequences in input file.
+
+import os
+import sys
+import zlib
+import queue
+import logging
+import multiprocessing as mp
+
+from src.binning_modules.binning_spec import get_res_tsv_fpath, configure_resfile_lines
+from src.binning_modules.classif_table import ClassifTable
+
+from src.fmt_read_id import fmt_read_id
+from src.platform import platf_depend_exit
+from src.printlog import printlog_error, printlog_error_time
+from src.filesystem import get_curr_res_dpath, is_fastq
+
+from src.seq_records import fastq_records, fasta_records
+
+from src.binning_modules.filters import get_QL_filter, get_QL_trash_fpath
+from src.binning_modules.filters import get_align_filter, get_align_trash_fpath
+from src.binning_modules.filters import get_classif_not_found_fpath
+from src.binning_modules.binned_output import BinnedOutput, fastq_record_text, fasta_record_text
+from src.binning_modules.handle_cache import MAX_OPEN_FILES
+
+# Total length of sequences (in characters) in a batch of records sent to a worker process
+BATCH_SIZE = 4 * 1024 * 1024
+
+# Maximum number of batches waiting in a queue per a consumer process
+QUEUE_DEPTH = 2
+
+
+def _get_writer_idx(fpath, n_writers):
+    # Function returns index of the writer process, which owns output file 'fpath'.
+    # CRC32 is used instead of `hash`, since the latter one differs between processes.
+    #
+    # :param fpath: path to output file;
+    # :type fpath: str;
+    # :param n_writers: number of writer processes;
+    # :type n_writers: int;
+
+    return zlib.crc32(fpath.encode("utf-8")) % n_writers
+# end def _get_writer_idx
+
+
+def _check_processes(procs, fq_fa_path):
+    # Function terminates binning if any of processes has failed.
+    # Otherwise consumers of queues would wait forever.
+    #
+    # :param procs: worker and writer processes;
+    # :type procs: list<multiprocessing.Process>;
+    # :param fq_fa_path: path to input file;
+    # :type fq_fa_path: str;
+
+    if any(not proc.is_alive() and proc.exitcode != 0 for proc in procs):
+        for proc in procs:
+            proc.terminate()
+        # end for
+        printlog_error_time("Error occured while binning file `{}` in parallel".format(fq_fa_path))
+        printlog_error("See error messages above.")
+        platf_depend_exit(1)
+    # end if
+# end def _check_processes
+
+
+def _put(dest_queue, item, procs, fq_fa_path):
+    # Function puts 'item' to 'dest_queue' checking if processes consuming it are alive.
+    #
+    # :param dest_queue: queue;
+    # :type dest_queue: multiprocessing.Queue;
+    # :param item: item to put;
+    # :param procs: worker and writer processes;
+    # :type procs: list<multiprocessing.Process>;
+    # :param fq_fa_path: path to input file;
+    # :type fq_fa_path: str;
+
+    while True:
+        try:
+            dest_queue.put(item, timeout=1)
+        except queue.Full:
+            _check_processes(procs, fq_fa_path)
+        else:
+            return
+        # end try
+    # end while
+# end def _put
+
+
+def _split_threads(n_thr):
+    # Function splits threads between worker and writer processes.
+    # Writing is cheaper than filtering, so there is a writer per 4 threads.
+    # Returns tuple (<number of workers>, <number of writers>).
+    #
+    # :param n_thr: number of threads to use;
+    # :type n_thr: int;
+
+    n_writers = max(1, n_thr // 4)
+    n_workers = max(1, n_thr - n_writers)
+    return n_workers, n_writers
+# end def _split_threads
+
+
+def _worker(batch_queue, writer_queues, stats_queue, table_fpath, fq_fa_path, outdir_path,
+    min_qual, min_qlen, min_pident, min_coverage, no_trash, out_ext):
+    # Function is run by a worker process. It takes batches of records from 'batch_queue',
+    #   bins them and sends texts of records to writer processes.
+    # Each writer receives a dict {<path to output file>: <text of records>} per batch.
+    # Statistics (seqs_pass, QL_seqs_fail, align_seqs_fail) is put to 'stats_queue' in the end.
+    #
+    # :param batch_queue: queue of batches of records (None means that there are no more batches);
+    # :type batch_queue: multiprocessing.Queue;
+    # :param writer_queues: queues of writer processes;
+    # :type writer_queues: list<multiprocessing.Queue>;
+    # :param stats_queue: queue to put statistics to;
+    # :type stats_queue: multiprocessing.Queue;
+    # :param table_fpath: path to dumped table of classification (see `configure_resfile_lines`);
+    # :type table_fpath: str;
+    # Other parameters are described in `bin_fastqa_file`.
+
+    n_writers = len(writer_queues)
+    resfile_lines = ClassifTable.load(table_fpath)
+
+    seqs_pass = 0 # counter for sequences, which pass filters
+    QL_seqs_fail = 0 # counter for too short or too low-quality sequences
+    align_seqs_fail = 0 # counter for sequences, which align to their best hit with too low identity or coverage
+
+    record_text = fastq_record_text if is_fastq(fq_fa_path) else fasta_record_text
+    binned_ext = ".fast{}{}".format('q' if is_fastq(fq_fa_path) else 'a', out_ext) # extention of binned files
+
+    classif_not_found_fpath = get_classif_not_found_fpath(fq_fa_path, outdir_path) + out_ext
+
+    QL_filter = get_QL_filter(fq_fa_path, min_qual, min_qlen)
+    align_filter = get_align_filter(min_pident, min_coverage)
+    if not no_trash:
+        QL_trash_fpath = get_QL_trash_fpath(fq_fa_path, outdir_path, min_qual, min_qlen) + out_ext
+        align_trash_fpath = get_align_trash_fpath(fq_fa_path, outdir_path, min_pident, min_coverage) + out_ext
+    else:
+        QL_trash_fpath = None
+        align_trash_fpath = None
+    # end if
+
+    writer_idxs = dict() # {<path to output file>: <index of writer process>}
+
+    batch = batch_queue.get()
+    while not batch is None:
+
+        routed = dict() # {<path to output file>: <list of texts of records>}
+
+        for fastqa_rec in batch:
+
+            read_name = sys.intern(fmt_read_id(fastqa_rec.seq_id)[1:]) # get ID of the sequence
+
+            try:
+                hit_names, *vals_to_filter = resfile_lines[read_name]  # find hit corresponding to this sequence
+            except KeyError:
+                # Place this sequence into the "classification not found" file
+                fpaths = (classif_not_found_fpath,)
+            else:
+                if not QL_filter(vals_to_filter):
+                    fpaths = (QL_trash_fpath,)
+                    QL_seqs_fail += 1
+                elif not align_filter(vals_to_filter):
+                    fpaths = (align_trash_fpath,)
+                    align_seqs_fail += 1
+                else:
+                    # There can be multiple hits for single query sequence
+                    fpaths = (os.path.join(outdir_path, hit_name + binned_ext)
+                        for hit_name in hit_names.split("&&"))
+                    seqs_pass += 1
+                # end if
+            # end try
+
+            text = None
+            for fpath in fpaths:
+                if fpath is None: # trash files are not written
+                    continue
+                # end if
+                if text is None:
+                    text = record_text(fastqa_rec)
+                # end if
+                try:
+                    routed[fpath].append(text)
+                except KeyError:
+                    routed[fpath] = [text]
+                # end try
+            # end for
+        # end for
+
+        # Send records to writers
+        writer_batches = [dict() for _ in range(n_writers)]
+        for fpath, texts in routed.items():
+            try:
+                writer_idx = writer_idxs[fpath]
+            except KeyError:
+                writer_idx = _get_writer_idx(fpath, n_writers)
+                writer_idxs[fpath] = writer_idx
+            # end try
+            writer_batches[writer_idx][fpath] = "".join(texts)
+        # end for
+        for writer_queue, writer_batch in zip(writer_queues, writer_batches):
+            if len(writer_batch) != 0:
+                writer_queue.put(writer_batch)
+            # end if
+        # end for
+
+        batch = batch_queue.get()
+    # end while
+
+    # Tell writers that this worker is done
+    for writer_queue in writer_queues:
+        writer_queue.put(None)
+    # end for
+
+    resfile_lines.close()
+    stats_queue.put((seqs_pass, QL_seqs_fail, align_seqs_fail))
+# end def _worker
+
+
+def _writer(writer_queue, n_workers, fq_fa_path, max_open_files):
+    # Function is run by a writer process. It writes texts of records received from workers
+    #   to it's output files until all workers are done.
+    #
+    # :param writer_queue: queue of dicts {<path to output file>: <text of records>};
+    # :type writer_queue: multiprocessing.Queue;
+    # :param n_workers: number of worker processes;
+    # :type n_workers: int;
+    # :param fq_fa_path: path to input file (for logging);
+    # :type fq_fa_path: str;
+    # :param max_open_files: maximum number of output files open simultaneously;
+    # :type max_open_files: int;
+
+    n_done_workers = 0
+
+    with BinnedOutput(max_open_files=max_open_files) as binned_output:
+        while n_done_workers != n_workers:
+            writer_batch = writer_queue.get()
+            if writer_batch is None:
+                n_done_workers += 1
+                continue
+            # end if
+            for fpath, text in writer_batch.items():
+                binned_output.write(fpath, text)
+            # end for
+        # end while
+    # end with
+    binned_output.handle_cache.log_stats(fq_fa_path)
+# end def _writer
+
+
+def bin_fastqa_file(fq_fa_path, tax_annot_res_dir, sens,
+        min_qual, min_qlen, min_pident, min_coverage, no_trash, n_thr=2, gzip_output=False,
+        max_open_files=MAX_OPEN_FILES):
+    # Function bins reads of a single FASTQ or FASTA file in parallel.
+    #
+    # :param fq_fa_path: path to FASTQ (of FASTA) file meant to be processed;
+    # :type fq_fa_path: str;
+    # :param tax_annot_res_dir: path to directory containing taxonomic annotation;
+    # :type tax_annot_res_dir: str;
+    # :param sens: binning sensitivity;
+    # :type sens: str;
+    # :param min_qual: threshold for quality filter;
+    # :type min_qual: float;
+    # :param min_qlen: threshold for length filter;
+    # :type min_qlen: int (or None, if this filter is disabled);
+    # :param min_pident: threshold for alignment identity filter;
+    # :type min_pident: float (or None, if this filter is disabled);
+    # :param min_coverage: threshold for alignment coverage filter;
+    # :type min_coverage: float (or None, if this filter is disabled);
+    # :param no_trash: loical value. True if user does NOT want to output trash files;
+    # :type no_trash: bool;
+    # :param n_thr: number of worker and writer processes to launch;
+    # :type n_thr: int;
+    # :param gzip_output: loical value. True if output files should be gzipped;
+    # :type gzip_output: bool;
+    # :param max_open_files: maximum number of output files open simultaneously in each writer process;
+    # :type max_open_files: int;
+
+    outdir_path = os.path.dirname(logging.getLoggerClass().root.handlers[0].baseFilename)
+    out_ext = ".gz" if gzip_output else "" # extention of output files
+
+    new_dpath = get_curr_res_dpath(fq_fa_path, tax_annot_res_dir)
+    tsv_res_fpath = get_res_tsv_fpath(new_dpath)
+    taxonomy_path = os.path.join(tax_annot_res_dir, "taxonomy", "taxonomy.tsv")
+    # Classification is configured once and shared by all workers
+    table_fpath = os.path.join(outdir_path, ".classification_table_{}.bin".format(os.getpid()))
+    resfile_lines = configure_resfile_lines(tsv_res_fpath, sens, taxonomy_path)
+    resfile_lines.dump(table_fpath)
+    del resfile_lines
+
+    try:
+        n_workers, n_writers = _split_threads(n_thr)
+
+        batch_queue = mp.Queue(maxsize=QUEUE_DEPTH * n_workers)
+        writer_queues = [mp.Queue(maxsize=QUEUE_DEPTH * n_workers) for _ in range(n_writers)]
+        stats_queue = mp.Queue()
+
+        writers = [mp.Process(target=_writer, args=(writer_queue, n_workers, fq_fa_path, max_open_files))
+            for writer_queue in writer_queues]
+        workers = [mp.Process(target=_worker, args=(batch_queue, writer_queues, stats_queue, table_fpath,
+            fq_fa_path, outdir_path, min_qual, min_qlen, min_pident, min_coverage, no_trash, out_ext))
+            for _ in range(n_workers)]
+        procs = writers + workers
+        for proc in procs:
+            proc.start()
+        # end for
+
+        # Read records and send them to workers
+        seq_records_generator = fastq_records if is_fastq(fq_fa_path) else fasta_records
+        batch = list()
+        batch_size = 0
+        for fastqa_rec in seq_records_generator(fq_fa_path):
+            batch.append(fastqa_rec)
+            batch_size += len(fastqa_rec.seq)
+            if batch_size >= BATCH_SIZE:
+                _put(batch_queue, batch, procs, fq_fa_path)
+                batch = list()
+                batch_size = 0
+            # end if
+        # end for
+        if len(batch) != 0:
+            _put(batch_queue, batch, procs, fq_fa_path)
+        # end if
+        for _ in range(n_workers):
+            _put(batch_queue, None, procs, fq_fa_path)
+        # end for
+
+        # Collect statistics before joining workers: they cannot exit while their queues are not empty
+        stats = list()
+        while len(stats) != n_workers:
+            try:
+                stats.append(stats_queue.get(timeout=1))
+            except queue.Empty:
+                _check_processes(procs, fq_fa_path)
+            # end try
+        # end while
+
+        for proc in procs:
+            proc.join()
+        # end for
+        _check_processes(procs, fq_fa_path)
+    finally:
+        os.unlink(table_fpath)
+    # end try
+
+    return tuple(map(sum, zip(*stats)))
+# end def bin_fastqa_file
@@ -9,8 +9,8 @@ import logging
 from glob import glob
 
 from src.binning_modules.binning_spec import get_checkstr, get_res_tsv_fpath, configure_resfile_lines
-from src.binning_modules.fast5 import update_file_dict
-from src.binning_modules.fast5 import fast5_readids, copy_read_f5_2_f5, copy_single_f5
+from src.binning_modules.fast5 import fast5_readids
+from src.binning_modules.binned_fast5_output import BinnedFast5Output
 
 from src.binning_modules.filters import get_QL_filter, get_QL_trash_fpath
 from src.binning_modules.filters import get_align_filter, get_align_trash_fpath
@@ -22,7 +22,7 @@ from src.fmt_read_id import fmt_read_id
 
 
 def bin_fast5_file(f5_path, tax_annot_res_dir, sens, min_qual, min_qlen,
-    min_pident, min_coverage, no_trash):
+    min_pident, min_coverage, no_trash, outdir_path=None):
     # Function bins FAST5 file without untwisting.
     #
     # :param f5_path: path to FAST5 file meant to be processed;
@@ -41,15 +41,18 @@ def bin_fast5_file(f5_path, tax_annot_res_dir, sens, min_qual, min_qlen,
     # :type min_coverage: float (or None, if this filter is disabled);
     # :param no_trash: loical value. True if user does NOT want to output trash files;
     # :type no_trash: bool;
+    # :param outdir_path: directory, to which binned files are written.
+    #   Default is output directory (the one containing log file);
+    # :type outdir_path: str;
 
-    outdir_path = os.path.dirname(logging.getLoggerClass().root.handlers[0].baseFilename)
+    if outdir_path is None:
+        outdir_path = os.path.dirname(logging.getLoggerClass().root.handlers[0].baseFilename)
+    # end if
 
     seqs_pass = 0 # counter for sequences, which pass filters
     QL_seqs_fail = 0 # counter for too short or too low-quality sequences
     align_seqs_fail = 0 # counter for sequences, which align to their best hit with too low identity or coverage
 
-    srt_file_dict = dict()
-
     new_dpath = glob("{}{}*{}*".format(tax_annot_res_dir, os.sep, get_checkstr(f5_path)))[0]
     tsv_res_fpath = get_res_tsv_fpath(new_dpath)
     taxonomy_path = os.path.join(tax_annot_res_dir, "taxonomy", "taxonomy.tsv")
@@ -100,13 +103,9 @@ def bin_fast5_file(f5_path, tax_annot_res_dir, sens, min_qual, min_qlen,
         return (0, 0, 0)
     # end try
 
-    # singleFAST5 and multiFAST5 files should be processed in different ways
-    # "Raw" group always in singleFAST5 root and never in multiFAST5 root
-    if "Raw" in from_f5.keys():
-        f5_cpy_func = copy_single_f5
-    else:
-        f5_cpy_func = copy_read_f5_2_f5
-    # end if
+    # Reads are copied to binned files after all of them are binned,
+    #   each binned file is opened once (see src/binning_modules/binned_fast5_output.py)
+    binned_output = BinnedFast5Output(from_f5)
 
     for _, read_name in enumerate(fast5_readids(from_f5)):
 
@@ -114,10 +113,7 @@ def bin_fast5_file(f5_path, tax_annot_res_dir, sens, min_qual, min_qlen,
             hit_names, *vals_to_filter = resfile_lines[sys.intern(fmt_read_id(read_name))[1:]] # omit 'read_' in the beginning of FAST5 group's name
         except KeyError:
             # Place this sequence into the "classification not found" file
-            if classif_not_found_fpath not in srt_file_dict.keys():
-                srt_file_dict = update_file_dict(srt_file_dict, classif_not_found_fpath)
-            # end if
-            f5_cpy_func(from_f5, read_name, srt_file_dict[classif_not_found_fpath])
+            binned_output.write(classif_not_found_fpath, read_name)
             continue
         # end try
 
@@ -125,36 +121,24 @@ def bin_fast5_file(f5_path, tax_annot_res_dir, sens, min_qual, min_qlen,
         if not QL_filter(vals_to_filter):
             QL_seqs_fail += 1
             # Get name of result FASTQ file to write this read in
-            if QL_trash_fpath not in srt_file_dict.keys():
-                srt_file_dict = update_file_dict(srt_file_dict, QL_trash_fpath)
-            # end if
-            f5_cpy_func(from_f5, read_name, srt_file_dict[QL_trash_fpath])
+            binned_output.write(QL_trash_fpath, read_name)
         elif not align_filter(vals_to_filter):
             align_seqs_fail += 1
             # Get name of result FASTQ file to write this read in
-            if QL_trash_fpath not in srt_file_dict.keys():
-                srt_file_dict = update_file_dict(srt_file_dict, align_trash_fpath)
-            # end if
-            f5_cpy_func(from_f5, read_name, srt_file_dict[align_trash_fpath])
+            binned_output.write(align_trash_fpath, read_name)
         else:
             for hit_name in hit_names.split("&&"): # there can be multiple hits for single query sequence
                 # Get name of result FASTQ file to write this read in
                 binned_file_path = os.path.join(outdir_path, "{}.fast5".format(hit_name))
-                if binned_file_path not in srt_file_dict.keys():
-                    srt_file_dict = update_file_dict(srt_file_dict, binned_file_path)
-                # end if
-                f5_cpy_func(from_f5, read_name, srt_file_dict[binned_file_path])
+                binned_output.write(binned_file_path, read_name)
             # end for
             seqs_pass += 1
         # end if
     # end for
 
+    # Copy reads to binned files
+    binned_output.close()
     from_f5.close()
 
-    # Close all binned files
-    for file_obj in filter(lambda x: not x is None, srt_file_dict.values()):
-        file_obj.close()
-    # end for
-
     return (seqs_pass, QL_seqs_fail, align_seqs_fail)
 # end def bin_fast5_file
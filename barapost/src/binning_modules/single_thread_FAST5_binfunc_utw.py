@@ -7,8 +7,10 @@ import sys
 import logging
 
 from src.binning_modules.binning_spec import configure_resfile_lines
-from src.binning_modules.fast5 import update_file_dict
-from src.binning_modules.fast5 import fast5_readids, copy_read_f5_2_f5, copy_single_f5
+from src.binning_modules.fast5 import fast5_readids
+from src.binning_modules.binned_fast5_output import BinnedFast5Output
+from src.binning_modules.fast5_untwist import NOT_FOUND_KEY
+from src.binning_modules.fast5_index import get_fast5_reads, get_index_path
 
 from src.binning_modules.filters import get_QL_filter, get_QL_trash_fpath
 from src.binning_modules.filters import get_align_filter, get_align_trash_fpath
@@ -18,13 +20,9 @@ from src.platform import platf_depend_exit
 from src.printlog import printlog_error, printlog_error_time
 from src.fmt_read_id import fmt_read_id
 
-from shelve import open as open_shelve
-
-index_name = "fast5_to_tsvtaxann_idx"
-
 
 def bin_fast5_file(f5_path, tax_annot_res_dir, sens, min_qual, min_qlen,
-    min_pident, min_coverage, no_trash):
+    min_pident, min_coverage, no_trash, outdir_path=None):
     # Function bins FAST5 file with untwisting.
     #
     # :param f5_path: path to FAST5 file meant to be processed;
@@ -43,20 +41,20 @@ def bin_fast5_file(f5_path, tax_annot_res_dir, sens, min_qual, min_qlen,
     # :type min_coverage: float (or None, if this filter is disabled);
     # :param no_trash: loical value. True if user does NOT want to output trash files;
     # :type no_trash: bool;
+    # :param outdir_path: directory, to which binned files are written.
+    #   Default is output directory (the one containing log file);
+    # :type outdir_path: str;
 
-    outdir_path = os.path.dirname(logging.getLoggerClass().root.handlers[0].baseFilename)
+    if outdir_path is None:
+        outdir_path = os.path.dirname(logging.getLoggerClass().root.handlers[0].baseFilename)
+    # end if
 
     seqs_pass = 0 # counter for sequences, which pass filters
     QL_seqs_fail = 0 # counter for too short or too low-quality sequences
     align_seqs_fail = 0 # counter for sequences, which align to their best hit with too low identity or coverage
 
-    srt_file_dict = dict()
-
-    index_dirpath = os.path.join(tax_annot_res_dir, index_name) # name of directory that will contain indicies
-
     # Configure path to "classification not found" file
     classif_not_found_fpath = get_classif_not_found_fpath(f5_path, outdir_path)
-    not_fount_key = 'CLASSIF_NOT_FOUND'
 
     # Make filter for quality and length
     QL_filter = get_QL_filter(f5_path, min_qual, min_qlen)
@@ -100,13 +98,9 @@ def bin_fast5_file(f5_path, tax_annot_res_dir, sens, min_qual, min_qlen,
         return (0, 0, 0)
     # end try
 
-    # singleFAST5 and multiFAST5 files should be processed in different ways
-    # "Raw" group always in singleFAST5 root and never in multiFAST5 root
-    if "Raw" in from_f5.keys():
-        f5_cpy_func = copy_single_f5
-    else:
-        f5_cpy_func = copy_read_f5_2_f5
-    # end if
+    # Reads are copied to binned files after all of them are binned,
+    #   each binned file is opened once (see src/binning_modules/binned_fast5_output.py)
+    binned_output = BinnedFast5Output(from_f5)
 
     readids_to_seek = list(from_f5.keys()) # list of not-binned-yet read IDs
 
@@ -116,79 +110,60 @@ def bin_fast5_file(f5_path, tax_annot_res_dir, sens, min_qual, min_qlen,
         readids_to_seek.append(sys.intern(read_name))
     # end for
 
-    # Walk through the index
-    index_f5_2_tsv = open_shelve( os.path.join(index_dirpath, index_name), 'r' )
+    # Get reads of this FAST5 file from the index
+    reads_by_tsv = get_fast5_reads(get_index_path(tax_annot_res_dir), f5_path)
 
-    if not f5_path in index_f5_2_tsv.keys():
+    if reads_by_tsv is None:
         printlog_error_time("Source FAST5 file `{}` not found in index".format(f5_path))
         # like here: return (seqs_pass, QL_seqs_fail, align_seqs_fail)
         return (0, 0, 0)
     # end if
 
-    for tsv_path in index_f5_2_tsv[f5_path].keys():
-
-        read_names = index_f5_2_tsv[f5_path][tsv_path]
+    for tsv_path, read_rows in reads_by_tsv.items():
 
-        if tsv_path == not_fount_key:
-            for read_name in read_names:
+        if tsv_path == NOT_FOUND_KEY:
+            for read_name, _ in read_rows:
                 # Place this sequence into the "classification not found" file
-                if classif_not_found_fpath not in srt_file_dict.keys():
-                    srt_file_dict = update_file_dict(srt_file_dict, classif_not_found_fpath)
-                # end if
-                f5_cpy_func(from_f5, read_name, srt_file_dict[classif_not_found_fpath])
+                binned_output.write(classif_not_found_fpath, read_name)
             # end for
             continue
         # end if
 
         taxonomy_path = os.path.join(tax_annot_res_dir, "taxonomy", "taxonomy.tsv")
-        resfile_lines = configure_resfile_lines(tsv_path, sens, taxonomy_path)
+        # Only lines of reads from this FAST5 file are read
+        resfile_lines = configure_resfile_lines(tsv_path, sens, taxonomy_path,
+            offsets=[row_offset for _, row_offset in read_rows])
 
-        for read_name in read_names:
+        for read_name, _ in read_rows:
             try:
                 hit_names, *vals_to_filter = resfile_lines[sys.intern(fmt_read_id(read_name)[1:])]
             except KeyError:
                 # Place this sequence into the "classification not found" file
-                if classif_not_found_fpath not in srt_file_dict.keys():
-                    srt_file_dict = update_file_dict(srt_file_dict, classif_not_found_fpath)
-                # end if
-                f5_cpy_func(from_f5, read_name, srt_file_dict[classif_not_found_fpath])
+                binned_output.write(classif_not_found_fpath, read_name)
                 continue
             # end try
 
             if not QL_filter(vals_to_filter):
                 # Get name of result FASTQ file to write this read in
-                if QL_trash_fpath not in srt_file_dict.keys():
-                    srt_file_dict = update_file_dict(srt_file_dict, QL_trash_fpath)
-                # end if
-                f5_cpy_func(from_f5, read_name, srt_file_dict[QL_trash_fpath])
+                binned_output.write(QL_trash_fpath, read_name)
                 QL_seqs_fail += 1
             elif not align_filter(vals_to_filter):
                 # Get name of result FASTQ file to write this read in
-                if align_trash_fpath not in srt_file_dict.keys():
-                    srt_file_dict = update_file_dict(srt_file_dict, align_trash_fpath)
-                # end if
-                f5_cpy_func(from_f5, read_name, srt_file_dict[align_trash_fpath])
+                binned_output.write(align_trash_fpath, read_name)
                 align_seqs_fail += 1
             else:
                 for hit_name in hit_names.split("&&"): # there can be multiple hits for single query sequence
                     # Get name of result FASTQ file to write this read in
                     binned_file_path = os.path.join(outdir_path, "{}.fast5".format(hit_name))
-                    if binned_file_path not in srt_file_dict.keys():
-                        srt_file_dict = update_file_dict(srt_file_dict, binned_file_path)
-                    # end if
-                    f5_cpy_func(from_f5, read_name, srt_file_dict[binned_file_path])
+                    binned_output.write(binned_file_path, read_name)
                 # end for
                 seqs_pass += 1
             # end if
         # end for
 
+    # Copy reads to binned files
+    binned_output.close()
     from_f5.close()
-    index_f5_2_tsv.close()
-
-    # Close all binned files
-    for file_obj in filter(lambda x: not x is None, srt_file_dict.values()):
-        file_obj.close()
-    # end for
 
     return (seqs_pass, QL_seqs_fail, align_seqs_fail)
 # end def bin_fast5_file
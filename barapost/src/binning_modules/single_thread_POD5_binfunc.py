@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# Module defines function necessary for binning POD5 files (with or without untwisting).
+
+import os
+import sys
+import logging
+from glob import glob
+
+from src.binning_modules.binning_spec import get_checkstr, get_res_tsv_fpath, configure_resfile_lines
+from src.binning_modules.pod5_io import pod5_readids, BinnedPod5Output
+from src.binning_modules.fast5_untwist import NOT_FOUND_KEY
+from src.binning_modules.fast5_index import get_fast5_reads, get_index_path
+
+from src.binning_modules.filters import get_QL_filter, get_QL_trash_fpath
+from src.binning_modules.filters import get_align_filter, get_align_trash_fpath
+from src.binning_modules.filters import get_classif_not_found_fpath
+
+from src.printlog import printlog_error, printlog_error_time
+from src.fmt_read_id import fmt_read_id
+
+
+def bin_pod5_file(pod5_path, tax_annot_res_dir, sens, min_qual, min_qlen,
+    min_pident, min_coverage, no_trash, untwist=False, binned_output=None, outdir_path=None):
+    # Function bins POD5 file.
+    #
+    # :param pod5_path: path to POD5 file meant to be processed;
+    # :type pod5_path: str;
+    # :param tax_annot_res_dir: path to directory containing taxonomic annotation;
+    # :type tax_annot_res_dir: str;
+    # :param sens: binning sensitivity;
+    # :type sens: str;
+    # :param min_qual: threshold for quality filter;
+    # :type min_qual: float;
+    # :param min_qlen: threshold for length filter;
+    # :type min_qlen: int (or None, if this filter is disabled);
+    # :param min_pident: threshold for alignment identity filter;
+    # :type min_pident: float (or None, if this filter is disabled);
+    # :param min_coverage: threshold for alignment coverage filter;
+    # :type min_coverage: float (or None, if this filter is disabled);
+    # :param no_trash: loical value. True if user does NOT want to output trash files;
+    # :type no_trash: bool;
+    # :param untwist: logical value. True if classification of reads should be taken from
+    #   the index of "FAST5 untwisting" (see src/binning_modules/fast5_index.py);
+    # :type untwist: bool;
+    # :param binned_output: output, to which binned reads are written. It is not closed here,
+    #   so that binned files are created once for all input files.
+    #   Default is a new output closed after this file is binned;
+    # :type binned_output: BinnedPod5Output;
+    # :param outdir_path: directory, to which binned files are written.
+    #   Default is output directory (the one containing log file);
+    # :type outdir_path: str;
+
+    if outdir_path is None:
+        outdir_path = os.path.dirname(logging.getLoggerClass().root.handlers[0].baseFilename)
+    # end if
+
+    seqs_pass = 0 # counter for sequences, which pass filters
+    QL_seqs_fail = 0 # counter for too short or too low-quality sequences
+    align_seqs_fail = 0 # counter for sequences, which align to their best hit with too low identity or coverage
+
+    # Configure path to "classification not found" file
+    classif_not_found_fpath = get_classif_not_found_fpath(pod5_path, outdir_path)
+
+    # Make filter for quality and length
+    QL_filter = get_QL_filter(pod5_path, min_qual, min_qlen)
+    # Configure path to trash file
+    if not no_trash:
+        QL_trash_fpath = get_QL_trash_fpath(pod5_path, outdir_path, min_qual, min_qlen,)
+    else:
+        QL_trash_fpath = None
+    # end if
+
+    # Make filter for identity and coverage
+    align_filter = get_align_filter(min_pident, min_coverage)
+    # Configure path to this trash file
+    if not no_trash:
+        align_trash_fpath = get_align_trash_fpath(pod5_path, outdir_path, min_pident, min_coverage)
+    else:
+        align_trash_fpath = None
+    # end if
+
+    # File validation:
+    #   RuntimeError will be raised if POD5 file is broken.
+    try:
+        read_ids = pod5_readids(pod5_path)
+    except RuntimeError as runterr:
+        printlog_error_time("POD5 file is broken")
+        printlog_error("Reading the file `{}` crashed.".format(os.path.basename(pod5_path)))
+        printlog_error("Reason: {}".format( str(runterr) ))
+        printlog_error("Omitting this file...")
+        print()
+        # Return zeroes -- inc_val won't be incremented and this file will be omitted
+        return (0, 0, 0)
+    # end try
+
+    own_output = binned_output is None
+    if own_output:
+        binned_output = BinnedPod5Output()
+    # end if
+
+    taxonomy_path = os.path.join(tax_annot_res_dir, "taxonomy", "taxonomy.tsv")
+
+    # List of tuples (<classification of reads>, <IDs of reads>)
+    classif_chunks = list()
+
+    if untwist:
+        # Get reads of this POD5 file from the index
+        reads_by_tsv = get_fast5_reads(get_index_path(tax_annot_res_dir), pod5_path)
+
+        if reads_by_tsv is None:
+            printlog_error_time("Source POD5 file `{}` not found in index".format(pod5_path))
+            return (0, 0, 0)
+        # end if
+
+        for tsv_path, read_rows in reads_by_tsv.items():
+            if tsv_path == NOT_FOUND_KEY:
+                for read_id, _ in read_rows:
+                    # Place this sequence into the "classification not found" file
+                    binned_output.write(classif_not_found_fpath, read_id)
+                # end for
+            else:
+                # Only lines of reads from this POD5 file are read
+                classif_chunks.append( (configure_resfile_lines(tsv_path, sens, taxonomy_path,
+                    offsets=[row_offset for _, row_offset in read_rows]),
+                    [read_id for read_id, _ in read_rows]) )
+            # end if
+        # end for
+    else:
+        new_dpath = glob("{}{}*{}*".format(tax_annot_res_dir, os.sep, get_checkstr(pod5_path)))[0]
+        tsv_res_fpath = get_res_tsv_fpath(new_dpath)
+        classif_chunks.append( (configure_resfile_lines(tsv_res_fpath, sens, taxonomy_path), read_ids) )
+    # end if
+
+    for resfile_lines, chunk_read_ids in classif_chunks:
+        for read_id in chunk_read_ids:
+
+            try:
+                hit_names, *vals_to_filter = resfile_lines[sys.intern(fmt_read_id(read_id)[1:])]
+            except KeyError:
+                # Place this sequence into the "classification not found" file
+                binned_output.write(classif_not_found_fpath, read_id)
+                continue
+            # end try
+
+            # If read is found in TSV file:
+            if not QL_filter(vals_to_filter):
+                QL_seqs_fail += 1
+                # Get name of result POD5 file to write this read in
+                binned_output.write(QL_trash_fpath, read_id)
+            elif not align_filter(vals_to_filter):
+                align_seqs_fail += 1
+                # Get name of result POD5 file to write this read in
+                binned_output.write(align_trash_fpath, read_id)
+            else:
+                for hit_name in hit_names.split("&&"): # there can be multiple hits for single query sequence
+                    # Get name of result POD5 file to write this read in
+                    binned_file_path = os.path.join(outdir_path, "{}.pod5".format(hit_name))
+                    binned_output.write(binned_file_path, read_id)
+                # end for
+                seqs_pass += 1
+            # end if
+        # end for
+    # end for
+
+    # Copy reads to binned files
+    binned_output.flush(pod5_path)
+    if own_output:
+        binned_output.close()
+    # end if
+
+    return (seqs_pass, QL_seqs_fail, align_seqs_fail)
+# end def bin_pod5_file
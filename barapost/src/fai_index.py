@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# This module defines functions for reading indices of FASTA and FASTQ files (`.fai` files),
+#   which are created by `samtools faidx` and `samtools fqidx`.
+# Index allows to find out where each record begins without reading the file itself.
+
+import os
+
+from src.filesystem import is_gzipped
+
+
+def get_fai_path(fq_fa_path):
+    # Function returns path to index of a FASTA or FASTQ file.
+    #
+    # :param fq_fa_path: path to FASTA or FASTQ file;
+    # :type fq_fa_path: str;
+
+    return fq_fa_path + ".fai"
+# end def get_fai_path
+
+
+def _record_end(fields):
+    # Function calculates offset of the end of a record (i.e. of the beginning of the next one).
+    #
+    # :param fields: fields of an index line. FASTA index has 5 fields:
+    #   name, length, offset of sequence, bases per line, bytes per line.
+    #   FASTQ index has the 6-th field: offset of quality line(s);
+    # :type fields: list<str>;
+
+    length, linebases, linewidth = int(fields[1]), int(fields[3]), int(fields[4])
+    # The last line of a record: sequence for FASTA and quality for FASTQ
+    last_offset = int(fields[5]) if len(fields) > 5 else int(fields[2])
+
+    full_lines, rest = divmod(length, linebases)
+    end = last_offset + full_lines * linewidth
+    if rest != 0:
+        end += rest + linewidth - linebases
+    # end if
+
+    return end
+# end def _record_end
+
+
+def get_record_offsets(fq_fa_path):
+    # Function reads index of a FASTA or FASTQ file and returns list of offsets
+    #   of beginnings of all records. Size of the file is appended to the list.
+    # Returns None if the index cannot be used: if it does not exist, if it is older than the file,
+    #   if the file is gzipped, or if the index does not match the file.
+    #
+    # :param fq_fa_path: path to FASTA or FASTQ file;
+    # :type fq_fa_path: str;
+
+    fai_path = get_fai_path(fq_fa_path)
+
+    if is_gzipped(fq_fa_path) or not os.path.exists(fai_path):
+        return None
+    # end if
+    if os.path.getmtime(fai_path) < os.path.getmtime(fq_fa_path):
+        return None
+    # end if
+
+    offsets = [0]
+    try:
+        with open(fai_path, 'r') as fai_file:
+            for line in fai_file:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) in (5, 6):
+                    offsets.append(_record_end(fields))
+                # end if
+            # end for
+        # end with
+    except (OSError, ValueError, ZeroDivisionError):
+        return None
+    # end try
+
+    # The last line of the file may lack line break
+    file_size = os.path.getsize(fq_fa_path)
+    if not offsets[-1] in (file_size, file_size + 1):
+        return None
+    # end if
+    offsets[-1] = file_size
+
+    return offsets
+# end def get_record_offsets
+
+
+def read_records(fq_fa_path, start, end):
+    # Function reads records from a FASTA or FASTQ file between two offsets
+    #   returned by `get_record_offsets`.
+    #
+    # :param fq_fa_path: path to FASTA or FASTQ file;
+    # :type fq_fa_path: str;
+    # :param start: offset of the first record;
+    # :type start: int;
+    # :param end: offset of the end of the last record;
+    # :type end: int;
+
+    with open(fq_fa_path, 'rb') as fq_fa_file:
+        fq_fa_file.seek(start)
+        return fq_fa_file.read(end - start).decode("utf-8")
+    # end with
+# end def read_records
@@ -5,13 +5,19 @@
 
 import os
 from math import log
-from src.prune_seqs import prune_seqs
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # mean qualities are calculated in pure Python
+# end try
+
+from src.prune_seqs import prune_records
 from src.fmt_read_id import fmt_read_id
-from src.filesystem import OPEN_FUNCS, FORMATTING_FUNCS, is_gzipped
+from src.seq_records import fastq_records_from_str
+from src.resume_point import resume_records, get_resume_point
 from src.printlog import printlog_warning
 
-FASTQ_LINES_PER_READ = 4
-
 # Function for getting Q value from Phred33 character:
 substr_phred33 = lambda q_symb: ord(q_symb) - 33
 # List of probabilities corresponding to indices (index is Q, value is the propability):
@@ -21,6 +27,12 @@ qual2prop = lambda q: q2p_map[q]
 # Function for accessing Q by propability:
 prop2qual = lambda p: round(-10 * log(p, 10), 2)
 
+if not np is None:
+    # Array of probabilities corresponding to ASCII codes of Phred33 characters
+    #   (negative Qs are mapped as `q2p_map` maps them, since `get_read_avg_qual` does so)
+    code2prop = np.array([q2p_map[code - 33] for code in range(128)], dtype=np.float64)
+# end if
+
 
 def get_read_avg_qual(qual_str):
     # Function calculates mean quality of a single read.
@@ -34,118 +46,153 @@ def get_read_avg_qual(qual_str):
 # end def get_read_avg_qual
 
 
-def form_packet_numseqs(fastq_file, packet_size, fmt_func, max_seq_len):
-    # Function reads lines from 'fastq_file' and composes a packet of 'packet_size' sequences.
+def get_reads_avg_qual(qual_strs):
+    # Function calculates mean qualities of several reads at once.
+    # Quality lines are converted to a single array of ASCII codes with NumPy,
+    #   characters of each read are counted, and counts are multiplied by probabilities (`code2prop`).
+    # If NumPy is not installed (or quality lines are not ASCII or empty),
+    #   `get_read_avg_qual` is applied to each line.
+    # Returns list of mean qualities in the same order.
     #
-    # :param fastq_file: file instance from which to read;
-    # :type fastq_file: _io.TextIOWrapper or gzip.File;
+    # :param qual_strs: quality lines of reads in Phred33;
+    # :type qual_strs: list<str>;
+
+    if np is None or len(qual_strs) == 0:
+        return list(map(get_read_avg_qual, qual_strs))
+    # end if
+
+    joined_quals = "".join(qual_strs)
+    qual_lens = np.fromiter(map(len, qual_strs), dtype=np.int64, count=len(qual_strs))
+    if not joined_quals.isascii() or not qual_lens.all():
+        return list(map(get_read_avg_qual, qual_strs))
+    # end if
+
+    codes = np.frombuffer(joined_quals.encode("ascii"), dtype=np.uint8)
+    ends = np.cumsum(qual_lens).tolist()
+
+    # Count characters of each read
+    counts = np.empty((len(qual_strs), 128), dtype=np.float64)
+    start = 0
+    for i, end in enumerate(ends):
+        counts[i] = np.bincount(codes[start:end], minlength=128)
+        start = end
+    # end for
+
+    avg_err_props = (counts @ code2prop) / qual_lens # calculate average propabilities
+    return list(map(prop2qual, avg_err_props.tolist()))
+# end def get_reads_avg_qual
+
+
+def _next_record(records, fastq):
+    # Function returns next record from 'records' iterator or None if there are no records left.
+    # If file is broken, a warning is printed and None is returned.
+    #
+    # :param records: iterator of FASTQ records;
+    # :type records: iterator<FastqRecord>;
+    # :param fastq: path to FASTQ file;
+    # :type fastq: str;
+
+    try:
+        return next(records)
+    except StopIteration:
+        return None
+    except UnicodeDecodeError as err:
+        print()
+        printlog_warning("Warning: current file is broken: {}."\
+            .format(str(err)))
+        printlog_warning("File: `{}`".format(os.path.abspath(fastq)))
+        printlog_warning("Ceasing reading sequences from this file.")
+        return None
+    # end try
+# end def _next_record
+
+
+def form_packet_numseqs(records, fastq, packet_size, max_seq_len):
+    # Function retrieves records from 'records' and composes a packet of 'packet_size' sequences.
+    #
+    # :param records: iterator of FASTQ records;
+    # :type records: iterator<FastqRecord>;
+    # :param fastq: path to FASTQ file;
+    # :type fastq: str;
     # :param packet_size: number of sequences to retrive from file;
     # :type packet_size: int;
-    # :param fmt_func: formating functio nfrom FORMMATING_FUNCS tuple;
-    # :param max_seq_len: maximum length of a sequence proessed;
-    # :type max_seq_len: int (None if pruning is disabled);
+    # :param max_seq_len: maximum length of a sequence proessed
+    #   (sequences are pruned by `prune_records` before they get here);
+    # :type max_seq_len: int (float("inf") if pruning is disabled);
 
     packet = ""
-    qual_dict = dict() # {<seq_id>: <read_quality>}
+    read_ids = list() # IDs of reads (without '>')
+    qual_strs = list() # quality lines of reads
     eof = False
 
     for _ in range(packet_size):
 
-        try:
-            read_id = fmt_func(fastq_file.readline())
-        except UnicodeDecodeError as err:
-            print()
-            printlog_warning("Warning: current file is broken: {}."\
-                .format(str(err)))
-            printlog_warning("File: `{}`".format(os.path.abspath(fastq_file.name)))
-            printlog_warning("Ceasing reading sequences from this file.")
-            eof = True
-            break
-        # end try
-
-        if read_id == "": # if eof is reached, leave now
+        record = _next_record(records, fastq)
+        if record is None: # if eof is reached, leave now
             eof = True
             break
         # end if
 
-        read_id = fmt_read_id(read_id)
-        seq = fmt_func(fastq_file.readline())
-        fastq_file.readline() # pass comment
-        avg_qual = get_read_avg_qual( fmt_func(fastq_file.readline()) )
-
-        packet += read_id + '\n' + seq + '\n'
-        qual_dict[read_id[1:]] = avg_qual
+        read_id = fmt_read_id(record.seq_id)
+        packet += read_id + '\n' + record.seq + '\n'
+        read_ids.append(read_id[1:])
+        qual_strs.append(record.qual_line)
     # end for
 
-    if max_seq_len < float("inf"): # prune sequences
-        packet = prune_seqs(packet, max_seq_len)
-    # end if
+    # Mean qualities of all reads of the packet are calculated at once
+    qual_dict = dict(zip(read_ids, get_reads_avg_qual(qual_strs))) # {<seq_id>: <read_quality>}
 
     return {"fasta": packet, "qual": qual_dict}, eof
 # end def form_packet_numseqs
 
 
-def form_packet_totalbp(fastq_file, packet_size, fmt_func, max_seq_len):
-    # Function reads lines from 'fastq_file' and composes a packet of 'packet_size' base pairs.
+def form_packet_totalbp(records, fastq, packet_size, max_seq_len):
+    # Function retrieves records from 'records' and composes a packet of 'packet_size' base pairs.
 
-    # :param fastq_file: file instance from which to read;
-    # :type fastq_file: _io.TextIOWrapper or gzip.File;
+    # :param records: iterator of FASTQ records;
+    # :type records: iterator<FastqRecord>;
+    # :param fastq: path to FASTQ file;
+    # :type fastq: str;
     # :param packet_size: number of base pairs to retrive from file;
     # :type packet_size: int;
-    # :param fmt_func: formating functio nfrom FORMMATING_FUNCS tuple;
-    # :param max_seq_len: maximum length of a sequence proessed;
-    # :type max_seq_len: int (None if pruning is disabled);
+    # :param max_seq_len: maximum length of a sequence proessed
+    #   (sequences are pruned by `prune_records` before they get here);
+    # :type max_seq_len: int (float("inf") if pruning is disabled);
 
     packet = ""
-    qual_dict = dict() # {<seq_id>: <read_quality>}
+    read_ids = list() # IDs of reads (without '>')
+    qual_strs = list() # quality lines of reads
     eof = False
 
     totalbp = 0
 
     while totalbp < packet_size:
 
-        try:
-            read_id = fmt_func(fastq_file.readline())
-        except UnicodeDecodeError as err:
-            print()
-            printlog_warning("Warning: current file is broken: {}."\
-                .format(str(err)))
-            printlog_warning("File: `{}`".format(os.path.abspath(fastq_file.name)))
-            printlog_warning("Ceasing reading sequences from this file.")
-            eof = True
-            break
-        # end try
-
-        if read_id == "": # if eof is reached, leave now
+        record = _next_record(records, fastq)
+        if record is None: # if eof is reached, leave now
             eof = True
             break
         # end if
 
-        read_id = fmt_read_id(read_id)
-        seq = fmt_func(fastq_file.readline())
-        fastq_file.readline() # pass comment
-        avg_qual = get_read_avg_qual( fmt_func(fastq_file.readline()) )
-
-        packet += read_id + '\n' + seq + '\n'
-        qual_dict[read_id[1:]] = avg_qual
+        read_id = fmt_read_id(record.seq_id)
+        packet += read_id + '\n' + record.seq + '\n'
+        read_ids.append(read_id[1:])
+        qual_strs.append(record.qual_line)
 
-        totalbp += min(len(seq), max_seq_len)
+        totalbp += min(len(record.seq), max_seq_len)
     # end while
 
-    if max_seq_len < float("inf"): # prune sequences
-        packet = prune_seqs(packet, max_seq_len)
-    # end if
+    # Mean qualities of all reads of the packet are calculated at once
+    qual_dict = dict(zip(read_ids, get_reads_avg_qual(qual_strs))) # {<seq_id>: <read_quality>}
 
     return {"fasta": packet, "qual": qual_dict}, eof
 # end def form_packet_totalbp
 
 
 def fastq_packets(fastq, packet_size, num_done_seqs, packet_mode=0,
-    saved_packet_size=None, saved_packet_mode=None,
-    max_seq_len=float("inf"), probing_batch_size=float("inf")):
+    saved_sizes=(), max_seq_len=float("inf"), probing_batch_size=float("inf"), resume_point=None):
     # Generator yields fasta-formattedpackets of records from fastq file.
-    # This function passes 'num_done_seqs' sequences (i.e. they will not be processed)
-    #   to 'pass_processed_files'.
+    # This function passes 'num_done_seqs' sequences (i.e. they will not be processed).
 
     # :param fastq: path to fastq file;
     # :type fastq: str;
@@ -155,70 +202,92 @@ def fastq_packets(fastq, packet_size, num_done_seqs, packet_mode=0,
     # :type num_done_seqs: int;
     # :param packet_mode: packet mode (see -c option);
     # :type packet_mode: int;
-    # :param saved_packet_size: size of last sent packet from tmp file. Necessary for resumption.
-    #   It will be None, if no tmp file was in classification directory;
-    # :type saved_packet_size: int;
-    # :param saved_packet_mode: mode used whilst formig the last sent packet from tmp file.
-    #   Necessary for resumption. It will be None, if no tmp file was in classification directory;
-    # :type saved_packet_mode: int;
+    # :param saved_sizes: sizes and modes of the first packets saved in tmp file. Necessary for resumption.
+    #   Size and mode are None for packets of standard size;
+    # :type saved_sizes: list<tuple<int, int>>;
     # :param max_seq_len: maximum length of a sequence proessed;
     # :type max_seq_len: int (float("inf") if pruning is disabled);
-
-    how_to_open = OPEN_FUNCS[ is_gzipped(fastq) ]
-    fmt_func = FORMATTING_FUNCS[ is_gzipped(fastq) ]
-
-    with how_to_open(fastq) as fastq_file:
-
-        # Pass reads, which have been already processed:
-        for _ in range(int(num_done_seqs * FASTQ_LINES_PER_READ)):
-            fastq_file.readline()
-        # end for
-
+    # :param resume_point: resume point (see `src.resume_point`).
+    #   If it corresponds to 'num_done_seqs', processed sequences are not read, but skipped at once;
+    # :type resume_point: dict;
+
+    # Each packet is given resume point of it's last sequence
+    position = dict()
+    records = resume_records(fastq, num_done_seqs, position, resume_point)
+    if max_seq_len < float("inf"): # prune sequences as soon as they are read
+        seq_records = prune_records(records, max_seq_len)
+    else:
+        seq_records = records
+    # end if
+    saved_sizes = iter(saved_sizes)
+    try:
         # End of file
         eof = False
 
-        # Here goes check for saved packet size and mode:
-        if not saved_packet_size is None:
-            wrk_pack_size = saved_packet_size
-        else:
-            wrk_pack_size = packet_size
-        # end if
-
-        if not saved_packet_mode is None:
-            wrk_pack_mode = saved_packet_mode
-        else:
-            wrk_pack_mode = packet_mode
-        # end if
+        while not eof:
 
-        if wrk_pack_mode == 0:
-            form_packet = form_packet_numseqs
-        else:
-            form_packet = form_packet_totalbp
-        # end if
+            # Here goes check for saved packet size and mode:
+            wrk_pack_size, wrk_pack_mode = next(saved_sizes, (None, None))
+            if wrk_pack_size is None:
+                wrk_pack_mode = packet_mode
+                wrk_pack_size = min(packet_size, probing_batch_size) if packet_mode == 0 else packet_size
+            # end if
 
-        # Process all remaining sequences with standart packet size:
-        while not eof:
+            if wrk_pack_mode == 0:
+                form_packet = form_packet_numseqs
+            else:
+                form_packet = form_packet_totalbp
+            # end if
 
-            packet, eof = form_packet(fastq_file, wrk_pack_size, fmt_func, max_seq_len)
+            packet, eof = form_packet(seq_records, fastq, wrk_pack_size, max_seq_len)
 
             if eof and packet["fasta"] == "":
                 return
             # end if
 
+            packet["resume_point"] = get_resume_point(position)
             yield packet
 
             if packet_mode == 0:
                 probing_batch_size -= wrk_pack_size
-                wrk_pack_size = min(packet_size, probing_batch_size)
             else:
                 probing_batch_size -= len(packet['qual'])
             # end if
-
-            # Switch back to standart packet size
-            # As Vorotos said, repeated assignment is the best check:
-            if wrk_pack_mode != packet_mode:
-                wrk_pack_mode = packet_mode
-            # end if
         # end while
-    # end with
+    finally:
+        records.close() # close input file
+    # end try
 # end def fastq_packets
+
+
+def fastq_packets_from_str(data, packet_size):
+    # Generator yields fasta-formatted packets of 'packet_size' records from FASTQ-formatted string.
+    #
+    # :param data: FASTQ-formatted string;
+    # :type data: str;
+    # :param packet_size: number of sequences to align in one 'blastn' launching;
+    # :type packet_size: int;
+
+    packet = ""
+    read_ids = list() # IDs of reads (without '>')
+    qual_strs = list() # quality lines of reads
+
+    for record in fastq_records_from_str(data):
+
+        read_id = fmt_read_id(record.seq_id)
+        packet += read_id + '\n' + record.seq + '\n'
+        read_ids.append(read_id[1:])
+        qual_strs.append(record.qual_line)
+
+        if len(read_ids) == packet_size:
+            yield {"fasta": packet, "qual": dict(zip(read_ids, get_reads_avg_qual(qual_strs)))}
+            packet = ""
+            read_ids = list()
+            qual_strs = list()
+        # end if
+    # end for
+
+    if packet != "":
+        yield {"fasta": packet, "qual": dict(zip(read_ids, get_reads_avg_qual(qual_strs)))}
+    # end if
+# end def fastq_packets_from_str
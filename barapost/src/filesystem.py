@@ -3,12 +3,13 @@
 
 import os
 import re
-from gzip import open as open_as_gzip
+from src.gzip_io import open_gzip
 from src.platform import platf_depend_exit
 from src.printlog import printlog_info, printlog_error, printlog_error_time
 
-# For opening plain text and gzipped files
-OPEN_FUNCS = (open, open_as_gzip)
+# For opening plain text and gzipped files.
+# Gzipped files are decompressed in separate threads (see src/gzip_io.py).
+OPEN_FUNCS = (open, open_gzip)
 
 # Data from plain text and gzipped should be parsed in different way,
 #   because data from .gz is read as 'bytes', not 'str'.
@@ -22,6 +23,7 @@ is_gzipped = lambda file: file.endswith(".gz")
 is_fastq = lambda f: not re.search(r".+\.f(ast)?q(\.gz)?$", f) is None
 is_fasta = lambda f: not re.search(r".+\.(m)?f(ast)?a(\.gz)?$", f) is None
 is_fast5 = lambda f: f.endswith(".fast5")
+is_pod5 = lambda f: f.endswith(".pod5")
 
 
 # Characters not allowes in filenames
@@ -0,0 +1,504 @@
+# -*- coding: utf-8 -*-
+# This module defines reading and writing of gzipped files.
+#
+# BGZF files (gzip files consisting of independent blocks, e.g. created by `bgzip`) are
+#   decompressed block-wise by several threads: blocks are read ahead and decompressed
+#   while previous ones are being parsed.
+# Other gzip files (including multi-member ones) cannot be decompressed in parallel,
+#   but they are decompressed in a separate thread, also ahead of parsing.
+# `zlib` releases GIL while (de)compressing, so threads do work simultaneously.
+#
+# Files opened for reading are binary, like ones opened by `gzip.open`.
+
+import io
+import os
+import zlib
+import queue
+import struct
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Number of threads (de)compressing BGZF blocks
+N_THREADS = min(4, os.cpu_count() or 1)
+
+# Number of BGZF blocks read ahead
+READ_AHEAD_BLOCKS = 64
+
+# Size of pieces, which are read from non-BGZF gzip files, and number of pieces decompressed ahead
+PIECE_SIZE = 1024 * 1024
+READ_AHEAD_PIECES = 8
+
+# Maximum size of uncompressed data in a BGZF block (the same as in htslib)
+BGZF_BLOCK_SIZE = 0xff00
+
+# Header of a gzip member with extra field
+_GZIP_EXTRA_HEADER = b"\x1f\x8b\x08\x04"
+
+# Empty BGZF block, which marks the end of a BGZF file
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def is_bgzf(fpath):
+    # Function checks if a gzipped file is a BGZF file.
+    #
+    # :param fpath: path to gzipped file;
+    # :type fpath: str;
+
+    with open(fpath, 'rb') as gz_file:
+        header = gz_file.read(18)
+    # end with
+
+    return len(header) == 18 and header[:4] == _GZIP_EXTRA_HEADER and header[12:14] == b"BC"
+# end def is_bgzf
+
+
+def _read_bgzf_block(raw_file):
+    # Function reads a single compressed BGZF block.
+    # Returns tuple (compressed data, CRC32, size of uncompressed data),
+    #   or None if the end of file is reached.
+    #
+    # :param raw_file: BGZF file opened in binary mode;
+    # :type raw_file: _io.BufferedReader;
+
+    header = raw_file.read(12)
+    if len(header) == 0:
+        return None
+    # end if
+    if len(header) != 12 or header[:4] != _GZIP_EXTRA_HEADER:
+        raise OSError("Invalid BGZF block header in file `{}`".format(raw_file.name))
+    # end if
+
+    xlen = struct.unpack("<H", header[10:12])[0]
+    extra = raw_file.read(xlen)
+
+    # Find subfield 'BC' containing size of the block
+    bsize = None
+    pos = 0
+    while pos + 4 <= len(extra):
+        sublen = struct.unpack("<H", extra[pos+2:pos+4])[0]
+        if extra[pos:pos+2] == b"BC":
+            bsize = struct.unpack("<H", extra[pos+4:pos+6])[0]
+        # end if
+        pos += 4 + sublen
+    # end while
+
+    if bsize is None:
+        raise OSError("Invalid BGZF block header in file `{}`".format(raw_file.name))
+    # end if
+
+    cdata = raw_file.read(bsize - xlen - 19)
+    crc, isize = struct.unpack("<II", raw_file.read(8))
+
+    return cdata, crc, isize
+# end def _read_bgzf_block
+
+
+def _inflate_bgzf_block(block):
+    # Function decompresses a BGZF block returned by `_read_bgzf_block`.
+    #
+    # :param block: tuple (compressed data, CRC32, size of uncompressed data);
+    # :type block: tuple<bytes, int, int>;
+
+    cdata, crc, isize = block
+    data = zlib.decompress(cdata, -15)
+
+    if len(data) != isize or zlib.crc32(data) != crc:
+        raise OSError("BGZF block is corrupted")
+    # end if
+
+    return data
+# end def _inflate_bgzf_block
+
+
+def _deflate_bgzf_block(data):
+    # Function compresses data to a BGZF block.
+    #
+    # :param data: data to compress (at most `BGZF_BLOCK_SIZE` bytes);
+    # :type data: bytes;
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+
+    return b"".join((
+        _GZIP_EXTRA_HEADER,
+        b"\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00",
+        struct.pack("<H", len(cdata) + 25), # total size of the block minus 1
+        cdata,
+        struct.pack("<II", zlib.crc32(data), len(data))
+    ))
+# end def _deflate_bgzf_block
+
+
+def bgzf_blocks(fpath):
+    # Generator yields decompressed blocks of BGZF file along with their offsets in the file.
+    # Yields tuples (offset of compressed block, decompressed data).
+    #
+    # :param fpath: path to BGZF file;
+    # :type fpath: str;
+
+    with open(fpath, 'rb') as raw_file:
+        coffset = raw_file.tell()
+        block = _read_bgzf_block(raw_file)
+        while not block is None:
+            yield coffset, _inflate_bgzf_block(block)
+            coffset = raw_file.tell()
+            block = _read_bgzf_block(raw_file)
+        # end while
+    # end with
+# end def bgzf_blocks
+
+
+def make_virtual_offset(coffset, uoffset):
+    # Function makes BGZF virtual offset (the same as in htslib).
+    #
+    # :param coffset: offset of compressed block in file;
+    # :type coffset: int;
+    # :param uoffset: offset within decompressed block;
+    # :type uoffset: int;
+
+    return (coffset << 16) | uoffset
+# end def make_virtual_offset
+
+
+class BgzfRandomReader:
+    # Class provides random access to decompressed data of BGZF file by virtual offsets.
+    # The last decompressed block is cached, so that sequential reads do not decompress it twice.
+
+    def __init__(self, fpath):
+        self.name = fpath
+        self._raw_file = open(fpath, 'rb')
+        self._cached_coffset = None
+        self._cached_data = b""
+        self._next_coffset = None
+    # end def __init__
+
+    def _load_block(self, coffset):
+        # Function returns decompressed block, which begins at 'coffset'.
+        if coffset != self._cached_coffset:
+            self._raw_file.seek(coffset)
+            block = _read_bgzf_block(self._raw_file)
+            if block is None:
+                raise EOFError("Virtual offset is beyond the end of file `{}`".format(self.name))
+            # end if
+            self._cached_data = _inflate_bgzf_block(block)
+            self._cached_coffset = coffset
+            self._next_coffset = self._raw_file.tell()
+        # end if
+        return self._cached_data
+    # end def _load_block
+
+    def read(self, voffset, length):
+        # Function reads 'length' bytes of decompressed data beginning at virtual offset 'voffset'.
+        #
+        # :param voffset: BGZF virtual offset;
+        # :type voffset: int;
+        # :param length: number of bytes to read;
+        # :type length: int;
+
+        coffset, uoffset = voffset >> 16, voffset & 0xffff
+        pieces = list()
+        while length > 0:
+            data = self._load_block(coffset)
+            piece = data[uoffset : uoffset + length]
+            pieces.append(piece)
+            length -= len(piece)
+            coffset, uoffset = self._next_coffset, 0
+        # end while
+        return b"".join(pieces)
+    # end def read
+
+    def close(self):
+        self._raw_file.close()
+    # end def close
+# end class BgzfRandomReader
+
+
+class _BgzfReader(io.RawIOBase):
+    # Raw stream of decompressed data of BGZF file.
+    # Blocks are decompressed by a pool of threads, `READ_AHEAD_BLOCKS` blocks ahead.
+    # Stream can start at any virtual offset.
+
+    def __init__(self, fpath, voffset=0):
+        self.name = fpath
+        self._raw_file = open(fpath, 'rb')
+        self._raw_file.seek(voffset >> 16)
+        self._executor = ThreadPoolExecutor(N_THREADS)
+        self._pending = deque()
+        self._eof = False
+        self._buffer = b""
+        self._pos = 0
+        # Pass data of the first block preceding the virtual offset
+        self._skip = voffset & 0xffff
+        self._fill()
+    # end def __init__
+
+    def _fill(self):
+        # Function submits blocks to the pool till there are `READ_AHEAD_BLOCKS` of them.
+        while not self._eof and len(self._pending) < READ_AHEAD_BLOCKS:
+            block = _read_bgzf_block(self._raw_file)
+            if block is None:
+                self._eof = True
+            else:
+                self._pending.append(self._executor.submit(_inflate_bgzf_block, block))
+            # end if
+        # end while
+    # end def _fill
+
+    def readable(self):
+        return True
+    # end def readable
+
+    def readinto(self, buff):
+        while self._pos == len(self._buffer):
+            if len(self._pending) == 0:
+                return 0 # end of file
+            # end if
+            self._buffer = self._pending.popleft().result()
+            self._pos = min(self._skip, len(self._buffer))
+            self._skip = 0
+            self._fill()
+        # end while
+
+        n = min(len(buff), len(self._buffer) - self._pos)
+        buff[:n] = self._buffer[self._pos : self._pos + n]
+        self._pos += n
+        return n
+    # end def readinto
+
+    def close(self):
+        if not self.closed:
+            for future in self._pending:
+                future.cancel()
+            # end for
+            self._executor.shutdown(wait=True)
+            self._raw_file.close()
+        # end if
+        super().close()
+    # end def close
+# end class _BgzfReader
+
+
+class _GzipReader(io.RawIOBase):
+    # Raw stream of decompressed data of gzip file (it can consist of several members).
+    # Data is decompressed in a separate thread, `READ_AHEAD_PIECES` pieces ahead.
+
+    def __init__(self, fpath):
+        self.name = fpath
+        self._queue = queue.Queue(maxsize=READ_AHEAD_PIECES)
+        self._stop = threading.Event()
+        self._eof = False
+        self._buffer = b""
+        self._pos = 0
+        self._thread = threading.Thread(target=self._inflate, args=(fpath,), daemon=True)
+        self._thread.start()
+    # end def __init__
+
+    def _put(self, item):
+        # Function puts item to the queue, unless reading is stopped.
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+            # end try
+        # end while
+    # end def _put
+
+    def _inflate(self, fpath):
+        # Function decompresses the file and puts decompressed pieces to the queue.
+        # None is put at the end of file; exception is put if an error occurs.
+        try:
+            with open(fpath, 'rb') as raw_file:
+                decompressor = zlib.decompressobj(31)
+                piece = raw_file.read(PIECE_SIZE)
+                is_empty = piece == b""
+                while piece != b"" and not self._stop.is_set():
+                    data = decompressor.decompress(piece)
+                    # Next member begins
+                    while decompressor.eof and decompressor.unused_data != b"":
+                        piece = decompressor.unused_data
+                        decompressor = zlib.decompressobj(31)
+                        data += decompressor.decompress(piece)
+                    # end while
+                    if data != b"":
+                        self._put(data)
+                    # end if
+                    piece = raw_file.read(PIECE_SIZE)
+                # end while
+                if not is_empty and not decompressor.eof and not self._stop.is_set():
+                    raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+                # end if
+            # end with
+            self._put(None)
+        except (OSError, EOFError, zlib.error) as err:
+            self._put(err)
+        # end try
+    # end def _inflate
+
+    def readable(self):
+        return True
+    # end def readable
+
+    def readinto(self, buff):
+        while self._pos == len(self._buffer):
+            if self._eof:
+                return 0 # end of file
+            # end if
+            item = self._queue.get()
+            if item is None:
+                self._eof = True
+            elif isinstance(item, BaseException):
+                raise item
+            else:
+                self._buffer = item
+                self._pos = 0
+            # end if
+        # end while
+
+        n = min(len(buff), len(self._buffer) - self._pos)
+        buff[:n] = self._buffer[self._pos : self._pos + n]
+        self._pos += n
+        return n
+    # end def readinto
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+        # end if
+        super().close()
+    # end def close
+# end class _GzipReader
+
+
+class _BgzfWriter(io.RawIOBase):
+    # Raw stream, which writes data to a BGZF file.
+    # Blocks are compressed by a pool of threads. EOF marker is written on closing.
+
+    def __init__(self, fpath, mode):
+        self.name = fpath
+        self._raw_file = open(fpath, mode)
+        self._executor = ThreadPoolExecutor(N_THREADS)
+        self._pending = deque()
+        self._buffer = bytearray()
+    # end def __init__
+
+    def writable(self):
+        return True
+    # end def writable
+
+    def _write_ready(self, max_pending):
+        # Function writes compressed blocks to file till there are at most `max_pending` of them left.
+        while len(self._pending) > max_pending:
+            self._raw_file.write(self._pending.popleft().result())
+        # end while
+    # end def _write_ready
+
+    def write(self, data):
+        self._buffer.extend(data)
+        while len(self._buffer) >= BGZF_BLOCK_SIZE:
+            block = bytes(self._buffer[:BGZF_BLOCK_SIZE])
+            del self._buffer[:BGZF_BLOCK_SIZE]
+            self._pending.append(self._executor.submit(_deflate_bgzf_block, block))
+            self._write_ready(N_THREADS * 2)
+        # end while
+        return len(data)
+    # end def write
+
+    def flush(self):
+        # Buffered data is compressed into a (possibly short) block, and all blocks are written to file.
+        # Thus data written before flushing is in file even if other processes append to it afterwards.
+        if not self._raw_file.closed:
+            if len(self._buffer) != 0:
+                self._pending.append(self._executor.submit(_deflate_bgzf_block, bytes(self._buffer)))
+                self._buffer = bytearray()
+            # end if
+            self._write_ready(0)
+            self._raw_file.flush()
+        # end if
+        super().flush()
+    # end def flush
+
+    def close(self):
+        if not self.closed:
+            self.flush()
+            self._executor.shutdown(wait=True)
+            self._raw_file.write(BGZF_EOF)
+            self._raw_file.close()
+        # end if
+        super().close()
+    # end def close
+# end class _BgzfWriter
+
+
+def bgzf_virtual_offset(fpath, offset):
+    # Function converts offset in decompressed data of BGZF file to virtual offset.
+    # Only headers and trailers of blocks are read: blocks are not decompressed.
+    # Returns None if the offset is beyond the end of data.
+    #
+    # :param fpath: path to BGZF file;
+    # :type fpath: str;
+    # :param offset: offset in decompressed data;
+    # :type offset: int;
+
+    with open(fpath, 'rb') as raw_file:
+        coffset = 0
+        while True:
+            header = raw_file.read(18)
+            if len(header) != 18 or header[:4] != _GZIP_EXTRA_HEADER or header[12:14] != b"BC":
+                return None
+            # end if
+            bsize = struct.unpack("<H", header[16:18])[0] + 1 # total size of the block
+            raw_file.seek(coffset + bsize - 4)
+            isize = struct.unpack("<I", raw_file.read(4))[0] # size of decompressed data
+            if offset < isize:
+                return make_virtual_offset(coffset, offset)
+            # end if
+            offset -= isize
+            coffset += bsize
+        # end while
+    # end with
+# end def bgzf_virtual_offset
+
+
+def open_gzip(fpath, mode="rb", offset=0):
+    # Function opens gzipped file. It is meant to replace `gzip.open`.
+    # Files opened for reading are binary. Files opened for writing or appending are text ones,
+    #   and data is written in BGZF format. Flushing such a file writes all data written to it.
+    # Files opened for reading can be read from 'offset' of decompressed data: BGZF files are
+    #   read from the corresponding block, other files are decompressed from the beginning.
+    #
+    # :param fpath: path to gzipped file;
+    # :type fpath: str;
+    # :param mode: 'r' or 'rb' for reading, 'w' or 'a' for writing or appending;
+    # :type mode: str;
+    # :param offset: offset in decompressed data to start reading at;
+    # :type offset: int;
+
+    if mode.startswith('r'):
+        voffset = None
+        if is_bgzf(fpath):
+            voffset = bgzf_virtual_offset(fpath, offset) if offset != 0 else 0
+        # end if
+        if not voffset is None:
+            return io.BufferedReader(_BgzfReader(fpath, voffset), buffer_size=PIECE_SIZE)
+        # end if
+
+        gz_file = io.BufferedReader(_GzipReader(fpath), buffer_size=PIECE_SIZE)
+        # Decompressed data preceding the offset is passed without being parsed
+        while offset > 0:
+            passed = len(gz_file.read(min(offset, PIECE_SIZE)))
+            if passed == 0:
+                break
+            # end if
+            offset -= passed
+        # end while
+        return gz_file
+    else:
+        # Writer buffers data itself, so flushing the text wrapper flushes data to file
+        return io.TextIOWrapper(_BgzfWriter(fpath, mode[0] + 'b'), encoding="utf-8")
+    # end if
+# end def open_gzip
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+# This module defines HTTP(S) client, which barapost uses to interact with NCBI servers.
+# Connections are kept alive and reused: there is one connection per host in each process.
+# Requests to each host are rate-limited, and failed requests are meant to be repeated
+#   after delays growing exponentially (with random jitter, see `backoff_delay`).
+# Rate limits can be shared by parallel processes (see `make_shared_limits` and `init_shared_limits`).
+
+import os
+import random
+import socket
+import http.client
+import multiprocessing as mp
+from time import time, sleep
+
+try:
+    import ssl
+except ImportError:
+    pass
+else:
+    ssl._create_default_https_context = ssl._create_unverified_context
+# end try
+
+
+# Minimum intervals (in seconds) between two requests to a host.
+# NCBI E-utilities allow at most 3 requests per second without an API key.
+HOST_INTERVALS = {
+    "eutils.ncbi.nlm.nih.gov": 0.34,
+    "www.ncbi.nlm.nih.gov": 0.34,
+    "blast.ncbi.nlm.nih.gov": 1.0,
+}
+DEFAULT_INTERVAL = 0.0
+
+# Parameters of exponential backoff (in seconds)
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 120.0
+
+# Exceptions meaning that the request should be repeated
+NETWORK_ERRORS = (OSError, socket.gaierror,
+    http.client.RemoteDisconnected, http.client.CannotSendRequest,
+    http.client.BadStatusLine, http.client.IncompleteRead)
+
+# Exceptions meaning that a reused keep-alive connection has been closed by server.
+# `http.client.RemoteDisconnected` is a subclass of `ConnectionResetError`.
+STALE_CONNECTION_ERRORS = (BrokenPipeError, ConnectionResetError, ConnectionAbortedError)
+
+# Methods, requests of which can be safely sent twice
+IDEMPOTENT_METHODS = ("GET", "HEAD")
+
+# Keep-alive connections: {host: connection}
+_connections = dict()
+# PID of the process which owns connections in `_connections`.
+# Child processes must not reuse sockets of their parent.
+_owner_pid = None
+
+# Time of the last request to each host: {host: time}
+_last_request = dict()
+
+# Hosts, request times of which can be shared by parallel processes
+_SHARED_HOSTS = tuple(HOST_INTERVALS.keys())
+# Lock and array of times of the last requests to `_SHARED_HOSTS` shared by parallel processes.
+# They are None if the process does not share rate limits with other processes.
+_shared_lock = None
+_shared_times = None
+
+# Hosts redirected to other addresses (e.g. to a local stand-in server):
+#   {host: (address, port, use_https)}
+_host_overrides = dict()
+
+
+def override_host(host, address, port, use_https=False):
+    # Function redirects all requests meant for `host` to another address.
+    # It allows to run barapost against a local stand-in HTTP server.
+    #
+    # :param host: host to redirect, e.g. "eutils.ncbi.nlm.nih.gov";
+    # :type host: str;
+    # :param address: address to redirect to;
+    # :type address: str;
+    # :param port: port to redirect to;
+    # :type port: int;
+    # :param use_https: whether to use HTTPS when connecting to `address`;
+    # :type use_https: bool;
+
+    _host_overrides[host] = (address, port, use_https)
+    close_connection(host)
+    # Stand-in servers do not need to be spared
+    HOST_INTERVALS[host] = 0.0
+# end def override_host
+
+
+def close_connection(host):
+    # Function closes keep-alive connection to `host`, if there is any.
+    #
+    # :param host: server address;
+    # :type host: str;
+
+    conn = _connections.pop(host, None)
+    if not conn is None:
+        conn.close()
+    # end if
+# end def close_connection
+
+
+def _get_connection(host, timeout):
+    # Function returns keep-alive connection to `host` creating it if necessary.
+    #
+    # :param host: server address;
+    # :type host: str;
+    # :param timeout: socket timeout in seconds;
+    # :type timeout: float or None;
+
+    global _owner_pid
+
+    # Connections inherited from parent process are dropped (not closed: they belong to parent)
+    if _owner_pid != os.getpid():
+        _connections.clear()
+        _owner_pid = os.getpid()
+    # end if
+
+    conn = _connections.get(host)
+    if conn is None:
+        if host in _host_overrides:
+            address, port, use_https = _host_overrides[host]
+            conn_class = http.client.HTTPSConnection if use_https else http.client.HTTPConnection
+            conn = conn_class(address, port, timeout=timeout)
+        else:
+            conn = http.client.HTTPSConnection(host, timeout=timeout)
+        # end if
+        _connections[host] = conn
+    else:
+        conn.timeout = timeout
+        if not conn.sock is None:
+            conn.sock.settimeout(timeout)
+        # end if
+    # end if
+
+    return conn
+# end def _get_connection
+
+
+def make_shared_limits():
+    # Function creates objects, via which parallel processes share rate limits.
+    # They should be passed to `init_shared_limits` in each process.
+
+    return mp.Lock(), mp.Array('d', len(_SHARED_HOSTS), lock=False)
+# end def make_shared_limits
+
+
+def init_shared_limits(lock, times):
+    # Function makes current process share rate limits with other processes.
+    #
+    # :param lock: lock returned by `make_shared_limits`;
+    # :type lock: multiprocessing.Lock;
+    # :param times: array returned by `make_shared_limits`;
+    # :type times: multiprocessing.Array;
+
+    global _shared_lock
+    _shared_lock = lock
+
+    global _shared_times
+    _shared_times = times
+# end def init_shared_limits
+
+
+def _wait_for_turn(host):
+    # Function sleeps, if necessary, in order to keep request rate to `host` within limits.
+    #
+    # :param host: server address;
+    # :type host: str;
+
+    interval = HOST_INTERVALS.get(host, DEFAULT_INTERVAL)
+
+    if not _shared_lock is None and host in _SHARED_HOSTS:
+        # Reserve the next free time slot and sleep outside of the lock
+        i = _SHARED_HOSTS.index(host)
+        with _shared_lock:
+            slot = max(time(), _shared_times[i] + interval)
+            _shared_times[i] = slot
+        # end with
+        delay = slot - time()
+        if delay > 0:
+            sleep(delay)
+        # end if
+        return
+    # end if
+
+    delay = _last_request.get(host, 0) + interval - time()
+    if delay > 0:
+        sleep(delay)
+    # end if
+    _last_request[host] = time()
+# end def _wait_for_turn
+
+
+def backoff_delay(attempt):
+    # Function returns delay (in seconds) before the next attempt of a failed request.
+    # Delay grows exponentially and is randomized ("equal jitter"), so that
+    #   parallel processes do not retry simultaneously.
+    #
+    # :param attempt: number of failed attempts (starting from 0);
+    # :type attempt: int;
+
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+# end def backoff_delay
+
+
+def request(method, host, url, body=None, headers=None, timeout=30, stream=False):
+    # Function performs single HTTP(S) request through keep-alive connection to `host`.
+    # If a reused connection turns out to be closed by server, request is repeated
+    #   once through a new connection: if sending of the request fails, or if
+    #   an idempotent request (see `IDEMPOTENT_METHODS`) gets no response at all.
+    #   A POST request, which has been sent, is never repeated: server might have received it.
+    # Other network errors are raised.
+    #
+    # :param method: HTTP method ("GET" or "POST");
+    # :type method: str;
+    # :param host: server address;
+    # :type host: str;
+    # :param url: the rest of url;
+    # :type url: str;
+    # :param body: request body;
+    # :type body: str or bytes;
+    # :param headers: request headers;
+    # :type headers: dict<str: str>;
+    # :param timeout: socket timeout in seconds;
+    # :type timeout: float or None;
+    # :param stream: if True, response body is not read: caller must read the response object
+    #   to the end (or call `close_connection`) before the next request to `host`;
+    # :type stream: bool;
+    #
+    # Returns tuple of three elements: (status code <int>, response object, response body <bytes>).
+    # Response object should be used only for accessing status reason and headers,
+    #   unless `stream` is True: then response body is None.
+
+    if headers is None:
+        headers = dict()
+    # end if
+
+    _wait_for_turn(host)
+
+    for first_try in (True, False):
+        conn = _get_connection(host, timeout)
+        is_reused = not conn.sock is None
+        try:
+            conn.request(method, url, body, headers)
+        except NETWORK_ERRORS as err:
+            close_connection(host)
+            # Server might have closed idle connection -- it is not an error.
+            if is_reused and first_try and isinstance(err, STALE_CONNECTION_ERRORS):
+                continue
+            # end if
+            raise
+        # end try
+
+        try:
+            response = conn.getresponse()
+            content = None if stream else response.read()
+        except NETWORK_ERRORS as err:
+            close_connection(host)
+            # Server closed idle connection without any response
+            if is_reused and first_try and method in IDEMPOTENT_METHODS\
+                    and isinstance(err, http.client.RemoteDisconnected):
+                continue
+            # end if
+            raise
+        # end try
+
+        if response.will_close:
+            close_connection(host)
+        # end if
+        return response.status, response, content
+    # end for
+# end def request
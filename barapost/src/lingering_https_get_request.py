@@ -1,89 +1,136 @@
 # -*- coding: utf-8 -*-
 
-import socket
-import http.client
 from time import sleep
 
 from src.printlog import printlog_info, printlog_error
 from src.platform import platf_depend_exit
+from src.https_client import request, backoff_delay, NETWORK_ERRORS, IDEMPOTENT_METHODS
 
-try:
-    import ssl
-except ImportError:
-    pass
-else:
-    ssl._create_default_https_context = ssl._create_unverified_context
-# end try
 
+def _print_conn_error(server, url, err, delay, request_for=None, acc=None):
+    # Function prints message about failed connection.
 
-def lingering_https_get_request(server, url, request_for=None, acc=None):
+    comment_str = ""
+    if not request_for is None:
+        comment_str += " requesting for {}".format(request_for)
+        if not acc is None:
+            comment_str += " (accession: `{}`)".format(acc)
+        # end if
+        comment_str += '.'
+    # end if
+    print()
+    printlog_info("Can't connect to `{}`{}".format(server + url, comment_str))
+    printlog_info( str(err) )
+    printlog_info("the program will sleep for {} seconds and try to connect again.".format(round(delay)))
+# end def _print_conn_error
+
+
+def lingering_https_request(method, server, url, body=None, headers=None,
+    request_for=None, acc=None, timeout=30, allowed_codes=(200,), stream=False, idempotent=None):
     # Function performs a "lingering" HTTPS request.
     # It means that the function tries to get the response
     #     again and again if the request fails.
+    # Non-idempotent request is not repeated after a network error, since server
+    #     might have received it: the error is raised, and caller decides what to do.
     #
+    # :param method: HTTP method ("GET" or "POST");
+    # :type method: str;
     # :param server: server address;
     # :type server: str;
     # :param url: the rest of url;
     # :type url: str;
+    # :param body: request body;
+    # :type body: str;
+    # :param headers: request headers;
+    # :type headers: dict<str: str>;
     # :param request_for: some comment for error message;
     # :type request_for: str;
     # :param acc: GenBank accession;
     # :type acc: str;
+    # :param timeout: socket timeout in seconds;
+    # :type timeout: float or None;
+    # :param allowed_codes: status codes that are not considered as errors;
+    # :type allowed_codes: tuple<int>;
+    # :param stream: if True, response body is not read (see `src.https_client.request`);
+    # :type stream: bool;
+    # :param idempotent: True if the request can be safely sent twice
+    #   (default: True for methods in `IDEMPOTENT_METHODS`);
+    # :type idempotent: bool;
     #
-    # Returns obtained response coded in UTF-8 ('str').
-
-    error = True
+    # Returns tuple of two elements: (response object, response text coded in UTF-8 ('str')).
+    # If `stream` is True, response text is None, and response object should be read by caller.
 
     # We can get spurious 404 or sth due to instability of NCBI servers work.
-    # Let's give it 3 attempts (with 15 sec spans in between),
-    #   and if all them are unsuccessful -- teminate execution.
+    # Let's give it 3 attempts, and if all them are unsuccessful -- teminate execution.
     attempt_i = 0
     max_attempts = 3
 
-    while error:
+    if idempotent is None:
+        idempotent = method in IDEMPOTENT_METHODS
+    # end if
+
+    # Number of network errors in a row
+    net_fails = 0
+
+    while True:
         try:
-            conn = http.client.HTTPSConnection(server, timeout=30) # create connection
-            conn.request("GET", url) # ask for if there areresults
-            response = conn.getresponse() # get the resonse
-
-            if response.code != 200:
-                if attempt_i < max_attempts and "ncbi.nlm.nih.gov" in server:
-                    printlog_error("Error {}: {}.".format(response.code, response.reason))
-                    printlog_error("It may be due to instable work of NCBI servers.")
-                    printlog_error("{} attempts to connect left, waiting 15 sec..."\
-                        .format(max_attempts - attempt_i))
-                    attempt_i += 1
-                else:
-                    printlog_error("Cannot find {} for {}.".format(request_for, acc))
-                    printlog_error("Request failed with status code {}: {}"\
-                        .format(response.code, response.reason))
-                    platf_depend_exit(1)
-                # end if
+            status, response, content = request(method, server, url, body, headers, timeout, stream)
+            if stream and not status in allowed_codes:
+                content = response.read() # error responses are not streamed
             # end if
-
-            resp_content = str(response.read(), "utf-8") # get response text
-        except (OSError,\
-                http.client.RemoteDisconnected,\
-                socket.gaierror,\
-                http.client.CannotSendRequest) as err:
-            comment_str = ""
-            if not request_for is None:
-                comment_str += " requesting for {}".format(request_for)
-                if not acc is None:
-                    comment_str += " (accession: `{}`)".format(acc)
-                # end if
-                comment_str += '.'
+        except NETWORK_ERRORS as err:
+            if not idempotent:
+                raise
             # end if
-            print()
-            printlog_info("Can't connect to `{}`{}".format(server + url, comment_str))
-            printlog_info( str(err) )
-            printlog_info("""the program will sleep for 30 seconds and try to connect again.""")
-            sleep(30)
-        else:
-            error = False # if no exception ocured, get out of the loop
-        finally:
-            conn.close()
+            delay = backoff_delay(net_fails)
+            _print_conn_error(server, url, err, delay, request_for, acc)
+            net_fails += 1
+            sleep(delay)
+            continue
         # end try
+
+        net_fails = 0
+
+        if not status in allowed_codes:
+            if attempt_i < max_attempts and "ncbi.nlm.nih.gov" in server:
+                delay = backoff_delay(attempt_i)
+                printlog_error("Error {}: {}.".format(status, response.reason))
+                printlog_error("It may be due to instable work of NCBI servers.")
+                printlog_error("{} attempts to connect left, waiting {} sec..."\
+                    .format(max_attempts - attempt_i, round(delay)))
+                attempt_i += 1
+                sleep(delay)
+                continue
+            else:
+                printlog_error("Cannot find {} for {}.".format(request_for, acc))
+                printlog_error("Request failed with status code {}: {}"\
+                    .format(status, response.reason))
+                platf_depend_exit(1)
+            # end if
+        # end if
+
+        if stream:
+            return response, None
+        # end if
+        return response, str(content, "utf-8")
     # end while
-    return resp_content
+# end def lingering_https_request
+
+
+def lingering_https_get_request(server, url, request_for=None, acc=None):
+    # Function performs a "lingering" HTTPS GET request.
+    #
+    # :param server: server address;
+    # :type server: str;
+    # :param url: the rest of url;
+    # :type url: str;
+    # :param request_for: some comment for error message;
+    # :type request_for: str;
+    # :param acc: GenBank accession;
+    # :type acc: str;
+    #
+    # Returns obtained response coded in UTF-8 ('str').
+
+    return lingering_https_request("GET", server, url,
+        request_for=request_for, acc=acc)[1]
 # end def lingering_https_get_request
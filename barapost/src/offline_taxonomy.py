@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+# This module defines offline taxonomy backend, which does not need network.
+# It uses NCBI taxonomy dump (files `nodes.dmp` and `names.dmp` from `taxdump.tar.gz`)
+#   and file `nucl_gb.accession2taxid(.gz)` (mapping of GenBank accessions to TaxIDs).
+# These files are converted once to an SQLite index, which is stored in the same directory.
+# Afterwards, lineage of an accession is retrieved with a few primary key lookups.
+
+import os
+import sqlite3
+from functools import lru_cache
+
+from src.printlog import printlog_info, printlog_info_time, printlog_error, printlog_error_time
+from src.platform import platf_depend_exit
+from src.filesystem import OPEN_FUNCS, FORMATTING_FUNCS, is_gzipped
+
+
+INDEX_FNAME = "barapost_taxdump_index.sqlite"
+ACC2TAXID_FNAMES = ("nucl_gb.accession2taxid", "nucl_gb.accession2taxid.gz")
+
+# Number of rows inserted into index in one transaction
+_INSERT_CHUNK_SIZE = 100000
+
+# Path to the index and connection to it
+_index_path = None
+_conn = None
+# PID of the process which owns `_conn`. SQLite connections must not be shared by processes.
+_conn_pid = None
+
+
+def _get_source_paths(taxdump_dir):
+    # Function returns paths to source files of the index.
+    #
+    # :param taxdump_dir: path to directory with taxonomy dump;
+    # :type taxdump_dir: str;
+    #
+    # Returns tuple of paths: (nodes.dmp, names.dmp, nucl_gb.accession2taxid).
+
+    nodes_path = os.path.join(taxdump_dir, "nodes.dmp")
+    names_path = os.path.join(taxdump_dir, "names.dmp")
+    acc2taxid_path = None
+    for fname in ACC2TAXID_FNAMES:
+        if os.path.exists(os.path.join(taxdump_dir, fname)):
+            acc2taxid_path = os.path.join(taxdump_dir, fname)
+            break
+        # end if
+    # end for
+
+    for path in (nodes_path, names_path, acc2taxid_path):
+        if path is None or not os.path.exists(path):
+            printlog_error_time("Error: taxonomy dump is incomplete.")
+            printlog_error("Directory `{}` must contain files `nodes.dmp`, `names.dmp`".format(taxdump_dir))
+            printlog_error("  and `nucl_gb.accession2taxid` (it can be gzipped).")
+            platf_depend_exit(1)
+        # end if
+    # end for
+
+    return nodes_path, names_path, acc2taxid_path
+# end def _get_source_paths
+
+
+def _get_signature(paths):
+    # Function returns string, which identifies current versions of source files.
+    #
+    # :param paths: paths to source files;
+    # :type paths: tuple<str>;
+
+    return ';'.join(map(lambda p: "{}:{}:{}".format(os.path.basename(p),
+        os.path.getsize(p), int(os.path.getmtime(p))), paths))
+# end def _get_signature
+
+
+def _iter_dmp(dmp_path):
+    # Generator yields fields of lines of a `.dmp` file.
+    #
+    # :param dmp_path: path to `.dmp` file;
+    # :type dmp_path: str;
+
+    with open(dmp_path, 'r') as dmp_file:
+        for line in dmp_file:
+            yield line.rstrip("\t|\n").split("\t|\t")
+        # end for
+    # end with
+# end def _iter_dmp
+
+
+def _insert_in_chunks(conn, sql, rows):
+    # Function inserts rows to the index in chunks.
+    #
+    # :param conn: connection to the index;
+    # :type conn: sqlite3.Connection;
+    # :param sql: INSERT statement;
+    # :type sql: str;
+    # :param rows: rows to insert;
+    # :type rows: iterable;
+
+    chunk = list()
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == _INSERT_CHUNK_SIZE:
+            conn.executemany(sql, chunk)
+            chunk = list()
+        # end if
+    # end for
+    conn.executemany(sql, chunk)
+# end def _insert_in_chunks
+
+
+def _iter_acc2taxid(acc2taxid_path):
+    # Generator yields pairs (accession without version, TaxID) from `nucl_gb.accession2taxid` file.
+    #
+    # :param acc2taxid_path: path to `nucl_gb.accession2taxid` file;
+    # :type acc2taxid_path: str;
+
+    how_to_open = OPEN_FUNCS[is_gzipped(acc2taxid_path)]
+    fmt_func = FORMATTING_FUNCS[is_gzipped(acc2taxid_path)]
+
+    with how_to_open(acc2taxid_path) as acc_file:
+        acc_file.readline() # pass header
+        for line in acc_file:
+            # Columns: accession, accession.version, taxid, gi
+            fields = fmt_func(line).split('\t')
+            if len(fields) > 2:
+                yield fields[0], int(fields[2])
+            # end if
+        # end for
+    # end with
+# end def _iter_acc2taxid
+
+
+def _build_index(index_path, source_paths, signature):
+    # Function builds SQLite index from taxonomy dump.
+    #
+    # :param index_path: path to index file;
+    # :type index_path: str;
+    # :param source_paths: paths to source files (see `_get_source_paths`);
+    # :type source_paths: tuple<str>;
+    # :param signature: signature of source files (see `_get_signature`);
+    # :type signature: str;
+
+    nodes_path, names_path, acc2taxid_path = source_paths
+
+    printlog_info_time("Building offline taxonomy index `{}`.".format(index_path))
+    printlog_info("It is done only once, but it may take a while.")
+
+    tmp_index_path = index_path + ".tmp"
+    if os.path.exists(tmp_index_path):
+        os.unlink(tmp_index_path)
+    # end if
+
+    try:
+        conn = sqlite3.connect(tmp_index_path)
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute("""CREATE TABLE nodes (taxid INTEGER PRIMARY KEY,
+            parent INTEGER, rank TEXT, name TEXT)""")
+        conn.execute("""CREATE TABLE acc2taxid (acc TEXT PRIMARY KEY,
+            taxid INTEGER) WITHOUT ROWID""")
+
+        # Nodes: TaxID, parent TaxID, rank
+        _insert_in_chunks(conn, "INSERT INTO nodes (taxid, parent, rank) VALUES (?, ?, ?)",
+            map(lambda f: (int(f[0]), int(f[1]), f[2]), _iter_dmp(nodes_path)))
+
+        # Names: only scientific ones are necessary
+        _insert_in_chunks(conn, "UPDATE nodes SET name = ? WHERE taxid = ?",
+            map(lambda f: (f[1], int(f[0])),
+                filter(lambda f: f[3] == "scientific name", _iter_dmp(names_path))))
+        conn.commit()
+        printlog_info_time("Taxonomy nodes are indexed. Indexing accessions...")
+
+        _insert_in_chunks(conn, "INSERT OR REPLACE INTO acc2taxid (acc, taxid) VALUES (?, ?)",
+            _iter_acc2taxid(acc2taxid_path))
+
+        conn.execute("INSERT INTO meta (key, value) VALUES ('signature', ?)", (signature,))
+        conn.commit()
+        conn.close()
+    except (OSError, sqlite3.Error) as err:
+        printlog_error_time("Error: cannot build offline taxonomy index `{}`.".format(index_path))
+        printlog_error(str(err))
+        platf_depend_exit(1)
+    # end try
+
+    os.replace(tmp_index_path, index_path)
+    printlog_info_time("Offline taxonomy index is built.")
+# end def _build_index
+
+
+def init_offline_taxonomy(taxdump_dir):
+    # Function checks if the index of taxonomy dump exists and is up to date.
+    # If it is not, function builds it.
+    #
+    # :param taxdump_dir: path to directory with taxonomy dump;
+    # :type taxdump_dir: str;
+
+    global _index_path
+
+    source_paths = _get_source_paths(taxdump_dir)
+    signature = _get_signature(source_paths)
+    index_path = os.path.join(taxdump_dir, INDEX_FNAME)
+
+    up_to_date = False
+    if os.path.exists(index_path):
+        try:
+            conn = sqlite3.connect(index_path)
+            saved_signature = conn.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+            conn.close()
+            up_to_date = not saved_signature is None and saved_signature[0] == signature
+        except sqlite3.Error:
+            up_to_date = False
+        # end try
+    # end if
+
+    if not up_to_date:
+        _build_index(index_path, source_paths, signature)
+    # end if
+
+    _index_path = index_path
+    _get_lineage.cache_clear()
+# end def init_offline_taxonomy
+
+
+def is_enabled():
+    # Function returns True if offline taxonomy backend is initialized.
+    return not _index_path is None
+# end def is_enabled
+
+
+def _get_conn():
+    # Function returns connection to the index opening it if necessary.
+
+    global _conn, _conn_pid
+
+    if _conn is None or _conn_pid != os.getpid():
+        _conn = sqlite3.connect("file:{}?mode=ro".format(_index_path), uri=True)
+        _conn_pid = os.getpid()
+    # end if
+    return _conn
+# end def _get_conn
+
+
+@lru_cache(maxsize=65536)
+def _get_lineage(taxid):
+    # Function retrieves lineage of a taxon.
+    #
+    # :param taxid: TaxID;
+    # :type taxid: int;
+    #
+    # Returns tuple of two elements: (scientific name of the taxon,
+    #   list of pairs (rank, name) from root to the taxon itself).
+    # Returns None if the TaxID is absent in the index.
+
+    conn = _get_conn()
+    lineage = list()
+    curr_taxid = taxid
+
+    while True:
+        node = conn.execute("SELECT parent, rank, name FROM nodes WHERE taxid = ?",
+            (curr_taxid,)).fetchone()
+        if node is None:
+            return None
+        # end if
+        parent, rank, name = node
+        lineage.append( (rank, name) )
+        # Root node is the parent of itself
+        if parent == curr_taxid:
+            break
+        # end if
+        curr_taxid = parent
+    # end while
+
+    lineage.reverse()
+    return lineage[-1][1], lineage
+# end def _get_lineage
+
+
+def get_lineages(accs):
+    # Function retrieves lineages of organisms by accessions of their records.
+    #
+    # :param accs: list of accessions (with or without version);
+    # :type accs: list<str>;
+    #
+    # Returns dict of the following structure:
+    #   {accession: (scientific_name, [(rank, name) from root to the organism])}.
+    # Accessions absent in the index are not included in the dict.
+
+    conn = _get_conn()
+    lineages = dict()
+
+    for acc in accs:
+        row = conn.execute("SELECT taxid FROM acc2taxid WHERE acc = ?",
+            (acc.partition('.')[0],)).fetchone()
+        if not row is None:
+            lineage = _get_lineage(row[0])
+            if not lineage is None:
+                lineages[acc] = lineage
+            # end if
+        # end if
+    # end for
+
+    return lineages
+# end def get_lineages
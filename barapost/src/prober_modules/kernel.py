@@ -2,21 +2,48 @@
 # In this module, kernel functions for prober are defined.
 
 import os
+from time import time
+from functools import partial
 
-from src.printlog import printlog_info
+from src.printlog import printlog_info, log_info
 from src.filesystem import remove_tmp_files
 
 from src.prune_seqs import prune_seqs
 from src.write_classification import write_classification
+from src.resume_point import write_resume_point
 from src.prober_modules.networking import configure_request, send_request
+from src.prober_modules.networking import submit_request, save_tmp_data
 from src.prober_modules.networking import wait_for_align, BlastError
 from src.prober_modules.prober_spec import parse_align_results_xml, write_hits_to_download
 
 from src.fasta import fasta_packets_from_str
 
+# Maximum number of requests, which can be in flight simultaneously (see `-n` option).
+# NCBI asks not to overload BLAST server, so this number is kept small.
+MAX_REQUESTS_IN_FLIGHT = 5
+
+
+def keep_in_flight(tmp_fpath, requests):
+    # Function keeps Request IDs of requests, which are in flight, in temporary file
+    #   (see `src.prober_modules.networking.save_tmp_data`).
+    # If there are no requests in flight, temporary file is removed.
+    #
+    # :param tmp_fpath: path to temporary file;
+    # :type tmp_fpath: str;
+    # :param requests: requests in order of their packets (see `save_tmp_data`);
+    # :type requests: list<tuple<str, int, int>>;
+
+    if len(requests) != 0:
+        save_tmp_data(tmp_fpath, requests)
+    else:
+        remove_tmp_files(tmp_fpath)
+    # end if
+# end def keep_in_flight
+
+
 def _split_and_resubmit(packet, packet_size, packet_mode, pack_to_send, seqs_processed,
         fq_fa_path, tmp_fpath, taxonomy_path, tsv_res_path, acc_fpath,
-        blast_algorithm, author_email, organisms, acc_dict, out_of_n):
+        blast_algorithm, author_email, organisms, acc_dict, out_of_n, extra_rids=(), save_in_flight=None):
     # :param packet: "packet" dictionary described in "barapost-prober.py" before the kernel loop:
     # :type packet: dict;
     # :param packet_size: size of the packet (see option `-c` for definition);
@@ -49,6 +76,12 @@ def _split_and_resubmit(packet, packet_size, packet_mode, pack_to_send, seqs_pro
     # :type acc_dict: dict<str: (str, int)>;
     # :param out_of_n: dictionary for printing how many packets left;
     # :type out_of_n: dict<str: str, str: int>;
+    # :param extra_rids: other requests in flight, which should be kept in tmp file
+    #   after the packet (see `submit`);
+    # :type extra_rids: list<tuple<str, int, int>>;
+    # :param save_in_flight: function saving other requests in flight
+    #   to temporary file (see `_handle_result`);
+    # :type save_in_flight: function;
 
     # Number of sequnces in packet to be splitted:
     pack_len = len(packet["qual"])
@@ -71,17 +104,34 @@ def _split_and_resubmit(packet, packet_size, packet_mode, pack_to_send, seqs_pro
         # end if
 
         # Split the packet
-        for _, splitted_packet in enumerate(fasta_packets_from_str(packet["fasta"], new_pack_size_0)):
+        splitted_packets = list(fasta_packets_from_str(packet["fasta"], new_pack_size_0))
+        # Resume point of the packet is the resume point of it's last subpacket
+        if "resume_point" in packet:
+            splitted_packets[-1]["resume_point"] = packet["resume_point"]
+        # end if
+
+        for i, splitted_packet in enumerate(splitted_packets):
 
             # Inherit quality information from "ancestor" qual_dict
             for query_name in splitted_packet["qual"].keys():
                 splitted_packet["qual"][query_name] = packet["qual"][query_name]
             # end for
 
+            # Subpackets, which are not submitted yet, are kept in tmp file before requests in flight,
+            #   so that the whole packet is resubmitted on resumption
+            unsent = [(None, len(p["qual"]), 0) for p in splitted_packets[i+1:]]
+            if len(unsent) != 0:
+                sub_extra_rids = unsent + list(extra_rids)
+                sub_save_in_flight = partial(keep_in_flight, tmp_fpath, sub_extra_rids)
+            else:
+                sub_extra_rids, sub_save_in_flight = extra_rids, save_in_flight
+            # end if
+
             # Submit subpacket
-            submit(splitted_packet, new_pack_size_0, 0, pack_to_send, seqs_processed,
+            submit(splitted_packet, len(splitted_packet["qual"]), 0, pack_to_send, seqs_processed,
                 fq_fa_path, tmp_fpath, taxonomy_path, tsv_res_path, acc_fpath,
-                blast_algorithm, author_email, organisms, acc_dict, out_of_n)
+                blast_algorithm, author_email, organisms, acc_dict, out_of_n,
+                sub_extra_rids, sub_save_in_flight)
         # end for
     else:
         # Prune the only sequence in packet and resend it
@@ -102,13 +152,14 @@ def _split_and_resubmit(packet, packet_size, packet_mode, pack_to_send, seqs_pro
 
         submit(packet, packet_size, packet_mode, pack_to_send, seqs_processed,
             fq_fa_path, tmp_fpath, taxonomy_path, tsv_res_path, acc_fpath,
-            blast_algorithm, author_email, organisms, acc_dict, out_of_n)
+            blast_algorithm, author_email, organisms, acc_dict, out_of_n,
+            extra_rids, save_in_flight)
     # end if
 # end def _split_and_resubmit
 
 
 def _handle_result(align_xml_text, packet, taxonomy_path,
-    tsv_res_path, acc_dict, acc_fpath, seqs_processed, pack_to_send, tmp_fpath):
+    tsv_res_path, acc_dict, acc_fpath, seqs_processed, pack_to_send, tmp_fpath, save_in_flight=None):
     # :param align_xml_text: XML text with results of alignment;
     # :type align_xml_text: str;
     # :param packet: "packet" dictionary described in "barapost-prober.py" before the kernel loop:
@@ -129,6 +180,9 @@ def _handle_result(align_xml_text, packet, taxonomy_path,
     # :type pack_to_send: list<int>;
     # :param tmp_fpath: path to current temporary file;
     # :type tmp_fpath: str;
+    # :param save_in_flight: function saving Request IDs of requests, which are still in flight,
+    #   to temporary file (see `keep_in_flight`). If it is None, there are no such requests;
+    # :type save_in_flight: function;
 
     # Get result tsv lines
     result_tsv_lines = parse_align_results_xml(align_xml_text,
@@ -138,18 +192,29 @@ def _handle_result(align_xml_text, packet, taxonomy_path,
     write_classification(result_tsv_lines, tsv_res_path)
     # Write accessions and names of hits to TSV file `hits_to_download.tsv
     write_hits_to_download(acc_dict, acc_fpath)
+    # Save resume point in order to resume from the next packet without reading processed sequences
+    if "resume_point" in packet:
+        write_resume_point(packet["resume_point"], tsv_res_path)
+    # end if
 
     # Update summary information
     seqs_processed[0] += len( packet["qual"] )
     pack_to_send[0] += 1
-    remove_tmp_files(tmp_fpath)
+
+    # Temporary file is updated only after results are written:
+    #   RID of this request is replaced with the rest ones at once
+    if save_in_flight is None:
+        remove_tmp_files(tmp_fpath)
+    else:
+        save_in_flight()
+    # end if
 
 # end def _handle_result
 
 
 def retrieve_ready_job(saved_RID, packet, packet_size, packet_mode, pack_to_send, seqs_processed,
         fq_fa_path, tmp_fpath, taxonomy_path, tsv_res_path, acc_fpath,
-        blast_algorithm, author_email, organisms, acc_dict, out_of_n):
+        blast_algorithm, author_email, organisms, acc_dict, out_of_n, save_in_flight=None, extra_rids=()):
     # :param saved_RID: saved Request ID from previous run;
     # :type saved_RID: str;
     # :param packet: "packet" dictionary described in "barapost-prober.py" before the kernel loop:
@@ -184,6 +249,12 @@ def retrieve_ready_job(saved_RID, packet, packet_size, packet_mode, pack_to_send
     # :type acc_dict: dict<str: (str, int)>;
     # :param out_of_n: dictionary for printing how many packets left;
     # :type out_of_n: dict<str: str, str: int>;
+    # :param save_in_flight: function saving Request IDs of other requests in flight
+    #   to temporary file (see `_handle_result`);
+    # :type save_in_flight: function;
+    # :param extra_rids: other requests in flight, which should be kept in tmp file
+    #   if the packet is resubmitted (see `submit`);
+    # :type extra_rids: list<tuple<str, int, int>>;
 
     resume_rtoe = 0 # we will not sleep at the very beginning of resumption
 
@@ -197,7 +268,7 @@ def retrieve_ready_job(saved_RID, packet, packet_size, packet_mode, pack_to_send
 
         _handle_result(align_xml_text, packet, taxonomy_path,
             tsv_res_path, acc_dict, acc_fpath, seqs_processed, pack_to_send,
-            tmp_fpath)
+            tmp_fpath, save_in_flight)
 
         return False
     elif error.code == 2:
@@ -207,7 +278,8 @@ def retrieve_ready_job(saved_RID, packet, packet_size, packet_mode, pack_to_send
 
         _split_and_resubmit(packet, packet_size, packet_mode, pack_to_send, seqs_processed,
             fq_fa_path, tmp_fpath, taxonomy_path, tsv_res_path, acc_fpath,
-            blast_algorithm, author_email, organisms, acc_dict, out_of_n)
+            blast_algorithm, author_email, organisms, acc_dict, out_of_n,
+            extra_rids, save_in_flight)
         return False
     else:
         return True
@@ -215,9 +287,37 @@ def retrieve_ready_job(saved_RID, packet, packet_size, packet_mode, pack_to_send
 # end def retrieve_ready_job
 
 
+def _print_submission_info(packet, blast_algorithm, pack_num, out_of_n):
+    # Function prints information about a packet being submitted.
+    #
+    # :param packet: "packet" dictionary described in "barapost-prober.py" before the kernel loop:
+    # :type packet: dict;
+    # :param blast_algorithm: BLAST algorithm to use (see option `-a`);
+    # :type blast_algorithm: str;
+    # :param pack_num: ordinal number of packet to send;
+    # :type pack_num: int;
+    # :param out_of_n: dictionary for printing how many packets left;
+    # :type out_of_n: dict<str: str, str: int>;
+
+    s_letter = 's' if len(packet["qual"]) != 1 else ''
+    print()
+    printlog_info("Going to BLAST (" + blast_algorithm + ")")
+
+    # Count base pairs in packet
+    lines = filter(lambda x: not x.startswith('>'), packet["fasta"].splitlines())
+    totalbp = len(''.join(map(lambda x: x.strip(), lines)))
+    totalbp = "{:,}".format(totalbp)
+    del lines
+
+    printlog_info("Request number {}{}. Sending {} sequence{} ({} b.p. totally)."\
+        .format(pack_num, out_of_n["msg"],
+                len(packet["qual"]), s_letter, totalbp))
+# end def _print_submission_info
+
+
 def submit(packet, packet_size, packet_mode, pack_to_send, seqs_processed,
         fq_fa_path, tmp_fpath, taxonomy_path, tsv_res_path, acc_fpath,
-        blast_algorithm, author_email, organisms, acc_dict, out_of_n):
+        blast_algorithm, author_email, organisms, acc_dict, out_of_n, extra_rids=(), save_in_flight=None):
     # :param packet: "packet" dictionary described in "barapost-prober.py" before the kernel loop:
     # :type packet: dict;
     # :param packet_size: size of the packet (see option `-c` for definition);
@@ -250,20 +350,14 @@ def submit(packet, packet_size, packet_mode, pack_to_send, seqs_processed,
     # :type acc_dict: dict<str: (str, int)>;
     # :param out_of_n: dictionary for printing how many packets left;
     # :type out_of_n: dict<str: str, str: int>;
+    # :param extra_rids: other requests in flight (pipelined mode), which should be kept
+    #   in tmp file after current request (see `src.prober_modules.networking.save_tmp_data`);
+    # :type extra_rids: list<tuple<str, int, int>>;
+    # :param save_in_flight: function saving Request IDs of other requests in flight
+    #   to temporary file (see `_handle_result`);
+    # :type save_in_flight: function;
 
-    s_letter = 's' if len(packet["qual"]) != 1 else ''
-    print()
-    printlog_info("Going to BLAST (" + blast_algorithm + ")")
-
-    # Count base pairs in packet
-    lines = filter(lambda x: not x.startswith('>'), packet["fasta"].splitlines())
-    totalbp = len(''.join(map(lambda x: x.strip(), lines)))
-    totalbp = "{:,}".format(totalbp)
-    del lines
-
-    printlog_info("Request number {}{}. Sending {} sequence{} ({} b.p. totally)."\
-        .format(pack_to_send[0], out_of_n["msg"],
-                len(packet["qual"]), s_letter, totalbp))
+    _print_submission_info(packet, blast_algorithm, pack_to_send[0], out_of_n)
 
     error = BlastError(-1)
 
@@ -275,13 +369,13 @@ def submit(packet, packet_size, packet_mode, pack_to_send, seqs_processed,
         # Send the request and get BLAST XML response.
         # 'align_xml_text' will be None if an error occurs.
         align_xml_text, error = send_request(request, pack_to_send, packet_size, packet_mode,
-            os.path.basename(fq_fa_path), tmp_fpath)
+            os.path.basename(fq_fa_path), tmp_fpath, extra_rids)
 
         if error.code == 0:
             # Write results and leave the loop
             _handle_result(align_xml_text, packet, taxonomy_path,
                 tsv_res_path, acc_dict, acc_fpath, seqs_processed, pack_to_send,
-                tmp_fpath)
+                tmp_fpath, save_in_flight)
 
         elif error.code == 2:
             # If NCBI BLAST server rejects the request due to too large amount of data in it --
@@ -290,9 +384,175 @@ def submit(packet, packet_size, packet_mode, pack_to_send, seqs_processed,
 
             _split_and_resubmit(packet, packet_size, packet_mode, pack_to_send, seqs_processed,
                 fq_fa_path, tmp_fpath, taxonomy_path, tsv_res_path, acc_fpath,
-                blast_algorithm, author_email, organisms, acc_dict, out_of_n)
+                blast_algorithm, author_email, organisms, acc_dict, out_of_n,
+                extra_rids, save_in_flight)
 
             error = BlastError(0) # _split_and_resubmit will process packet successfully
         # end if
     # end while
 # end def submit
+
+
+def submit_pipelined(packets, max_in_flight, saved_requests, packet_size, packet_mode,
+        pack_to_send, seqs_processed,
+        fq_fa_path, tmp_fpath, taxonomy_path, tsv_res_path, acc_fpath,
+        blast_algorithm, author_email, organisms, acc_dict, out_of_n, probing_batch_size):
+    # Function submits packets to BLAST server keeping up to `max_in_flight` requests
+    #   in flight simultaneously. Results are retrieved and written to classification file
+    #   strictly in order of submission, i.e. in order of sequences in input file.
+    #
+    # :param packets: packet generator (`fastq_packets` or `fasta_packets`);
+    # :type packets: generator;
+    # :param max_in_flight: maximum number of requests in flight (see option `-n`);
+    # :type max_in_flight: int;
+    # :param saved_requests: requests saved during previous run (see `save_tmp_data`).
+    #   They correspond to first packets yielded by `packets`. Requests with Request ID
+    #   will be retrieved without resending, the rest packets will be submitted;
+    # :type saved_requests: list<tuple<str, int, int>>;
+    # :param packet_size: size of the packet (see option `-c` for definition);
+    # :type packet_size: int;
+    # :param packet_mode: packet forming mode (see option `-c` for definition);
+    # :type packet_mode: int;
+    # :param pack_to_send: ordinal number of packet to send
+    #   (it is list rather that in because it should be mutable);
+    # :type pack_to_send: list<int>;
+    # :param seqs_processed: nuber of sequnces processed
+    #   (it is list rather that in because it should be mutable);
+    # :type seqs_processed: list<int>;
+    # :param fq_fa_path: path to current input file;
+    # :type fq_fa_path: str;
+    # :param tmp_fpath: path to current temporary file;
+    # :type tmp_fpath: str;
+    # :param taxonomy_path: path to taxonomt file;
+    # :type taxonomy_path: str;
+    # :param tsv_res_path: path to current classification file;
+    # :type tsv_res_path: str;
+    # :param acc_fpath: path to file `hits_to_download.tsv`;
+    # :type acc_fpath: str;
+    # :param blast_algorithm: BLAST algorithm to use (see option `-a`);
+    # :type blast_algorithm: str;
+    # :param author_email: author's email to send within request;
+    # :type author_email: str;
+    # :param organisms: list of strings performing `nt` database slices;
+    # :type organisms: list<str>;
+    # :param acc_dict: accession dictionary for writing to `hits_to_download.tsv`;
+    # :type acc_dict: dict<str: (str, int)>;
+    # :param out_of_n: dictionary for printing how many packets left;
+    # :type out_of_n: dict<str: str, str: int>;
+    # :param probing_batch_size: number of sequences meant to be processed during current run;
+    # :type probing_batch_size: int or float("inf");
+
+    # Requests in flight. Each of them is a dict of the following structure:
+    # {
+    #     "packet": "packet" dictionary,
+    #     "RID": Request ID <str>,
+    #     "rtoe": time in seconds estimated by BLAST server <int>,
+    #     "time": time of submission <float>,
+    #     "pack_num": ordinal number of packet <int>,
+    #     "size": packet size to save in tmp file <int>,
+    #     "mode": packet mode to save in tmp file <int>
+    # }
+    in_flight = list()
+    filename = os.path.basename(fq_fa_path)
+    saved_requests = list(saved_requests)
+    exhausted = False
+
+    def save_in_flight():
+        # Keep RIDs of all requests in flight in tmp file
+        keep_in_flight(tmp_fpath, [(job["RID"], job["size"], job["mode"]) for job in in_flight])
+    # end def save_in_flight
+
+    while True:
+
+        # Fill the pipeline
+        while not exhausted and len(in_flight) < max_in_flight:
+
+            # Do not submit sequences beyond probing batch
+            seqs_in_flight = sum(map(lambda job: len(job["packet"]["qual"]), in_flight))
+            if seqs_processed[0] + seqs_in_flight >= probing_batch_size:
+                break
+            # end if
+
+            try:
+                packet = next(packets)
+            except StopIteration:
+                exhausted = True
+                break
+            # end try
+
+            if packet["fasta"] == "":
+                exhausted = True
+                break
+            # end if
+
+            # First packets of resumed file might have been formed
+            #   with saved (i.e. non-standard) size and mode
+            rid, size, mode = saved_requests.pop(0) if len(saved_requests) != 0 else (None, None, None)
+            if size is None:
+                size, mode = packet_size, packet_mode
+            # end if
+
+            if not rid is None:
+                # This packet has been already sent -- just wait for it
+                rtoe = 0
+                log_info("Request ID {} from previous run is in flight.".format(rid))
+            else:
+                _print_submission_info(packet, blast_algorithm, pack_to_send[0], out_of_n)
+
+                request = configure_request(packet["fasta"], blast_algorithm, organisms, author_email)
+                rid, rtoe = submit_request(request)
+                printlog_info("Request ID: {}. {} request(s) in flight.".format(rid, len(in_flight)+1))
+            # end if
+
+            in_flight.append({
+                "packet": packet,
+                "RID": rid,
+                "rtoe": rtoe,
+                "time": time(),
+                "pack_num": pack_to_send[0],
+                "size": size,
+                "mode": mode
+            })
+            pack_to_send[0] += 1
+            save_in_flight()
+        # end while
+
+        if len(in_flight) == 0:
+            break
+        # end if
+
+        # Wait for the earliest request in order to write results in proper order.
+        # Rest requests are being processed by BLAST server meanwhile.
+        job = in_flight[0]
+        rtoe_left = max(0, int(job["rtoe"] - (time() - job["time"])))
+
+        align_xml_text, error = wait_for_align(job["RID"], rtoe_left,
+            [job["pack_num"]], filename)
+
+        # Remove the request from pipeline: it is either done now or will be resubmitted
+        in_flight.pop(0)
+        extra_rids = [(j["RID"], j["size"], j["mode"]) for j in in_flight]
+
+        if error.code == 0:
+            # OK -- results are retrieved
+            _handle_result(align_xml_text, job["packet"], taxonomy_path,
+                tsv_res_path, acc_dict, acc_fpath, seqs_processed, [job["pack_num"]],
+                tmp_fpath, save_in_flight)
+
+        elif error.code == 2:
+            # Split or prune the packet and resubmit it synchronously.
+            # Subpackets are saved in tmp file with their sizes before RIDs of requests in flight.
+            _split_and_resubmit(job["packet"], job["size"], job["mode"], [job["pack_num"]],
+                seqs_processed, fq_fa_path, tmp_fpath, taxonomy_path, tsv_res_path,
+                acc_fpath, blast_algorithm, author_email, organisms, acc_dict, out_of_n,
+                extra_rids, save_in_flight)
+        else:
+            # Request is expired -- resend the packet
+            submit(job["packet"], job["size"], job["mode"], [job["pack_num"]], seqs_processed,
+                fq_fa_path, tmp_fpath, taxonomy_path, tsv_res_path, acc_fpath,
+                blast_algorithm, author_email, organisms, acc_dict, out_of_n, extra_rids, save_in_flight)
+        # end if
+
+        save_in_flight()
+    # end while
+# end def submit_pipelined
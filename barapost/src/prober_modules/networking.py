@@ -3,17 +3,26 @@
 
 import os
 import re
-from time import sleep
+from time import time, sleep
 import logging
 
-import http.client
 import urllib.parse
 
-from src.lingering_https_get_request import lingering_https_get_request
+from src.lingering_https_get_request import lingering_https_get_request, lingering_https_request
+from src.https_client import backoff_delay, NETWORK_ERRORS
 
 from src.platform import platf_depend_exit
 from src.printlog import log_info, printlog_info, printlog_info_time, printlog_error, printlog_error_time, getwt, printn
 
+# Number of attempts to submit a request, which fail due to network errors
+SUBMISSION_ATTEMPTS = 3
+
+# Minimum interval between two submissions (in seconds) according to NCBI usage policy.
+SUBMISSION_INTERVAL = 10
+
+# Time of the last submission
+_last_submission = 0
+
 
 def verify_taxids(taxid_list):
     # Funciton verifies TaxIDs passed to prober with `-g` option.
@@ -102,45 +111,22 @@ def configure_request(packet, blast_algorithm, organisms, author_email):
 # end def configure_request
 
 
-def send_request(request, pack_to_send, packet_size, packet_mode, filename, tmp_fpath):
-    # Function sends a request to "blast.ncbi.nlm.nih.gov/blast/Blast.cgi"
-    #     and then waits for satisfaction of the request and retrieves response text.
+def post_request(request):
+    # Function submits a request to "blast.ncbi.nlm.nih.gov/blast/Blast.cgi"
+    #     and returns immediately, without waiting for results of alignment.
     #
     # :param request: request_data (it is a dict that `configure_request()` function returns);
     # :param request: dict<dict>;
-    # :param pack_to_send: current number (like id) of packet meant to be sent now.
-    # :type pack_to_send: int;
-    # :param pack_to_send: ordinal number of packet;
-    # :type pack_to_send: int;
-    # :param packet_size: numner of sequences in the packet;
-    # :type packet_size: int;
     #
-    # Returns XML text of type 'str' with BLAST response.
-
-    payload = request["payload"]
-    headers = request["headers"]
+    # Request is not repeated after a network error (see `submit_request`): the error is raised.
+    #
+    # Returns tuple of two elements: (Request ID <str>, estimated time of alignment in seconds <int>).
 
     server = "blast.ncbi.nlm.nih.gov"
     url = "/blast/Blast.cgi"
-    error = True
 
-    while error:
-        try:
-            conn = http.client.HTTPSConnection(server) # create a connection
-            conn.request("POST", url, payload, headers) # send the request
-            response = conn.getresponse() # get the response
-            response_text = str(response.read(), "utf-8") # get response text
-        except OSError as oserr:
-            printlog_info_time("`https://blast.ncbi.nlm.nih.gov` is not available.")
-            printlog_info( str(oserr) )
-            printlog_info("barapost will try to connect again in 30 seconds...\n")
-            sleep(30)
-
-        # if no exception occured
-        else:
-            error = False
-        # end try
-    # end while
+    response_text = lingering_https_request("POST", server, url,
+        request["payload"], request["headers"], "submission of the request", timeout=120)[1]
 
     try:
         rid = re.search(r"RID = (.+)", response_text).group(1) # get Request ID
@@ -152,16 +138,109 @@ def send_request(request, pack_to_send, packet_size, packet_mode, filename, tmp_
             den_file.write(response_text)
         # end with
         platf_depend_exit(1)
-    finally:
-        conn.close()
     # end try
 
-    # Save temporary data
-    with open(tmp_fpath, 'w') as tmpfile:
-        tmpfile.write("Request_ID: {}\n".format(rid))
-        tmpfile.write("Packet_size: {}\n".format(packet_size))
-        tmpfile.write("Packet_mode: {}".format(packet_mode))
+    return rid, rtoe
+# end def post_request
+
+
+def submit_request(request):
+    # Function submits a request to BLAST server (see `post_request`).
+    # NCBI asks not to submit requests more often than once per `SUBMISSION_INTERVAL` seconds,
+    #   so the function sleeps, if necessary.
+    # If submission fails due to a network error, server might have received the request or not.
+    #   Request ID is unknown anyway, so the request is submitted again after a delay,
+    #   but not more than `SUBMISSION_ATTEMPTS` times. Then the program exits:
+    #   Request IDs of requests in flight are kept in temporary file, and the run can be resumed.
+    #
+    # :param request: request_data (it is a dict that `configure_request()` function returns);
+    # :param request: dict<dict>;
+    #
+    # Returns tuple of two elements: (Request ID <str>, estimated time of alignment in seconds <int>).
+
+    global _last_submission
+
+    for attempt_i in range(SUBMISSION_ATTEMPTS):
+        delay = _last_submission + SUBMISSION_INTERVAL - time()
+        if delay > 0:
+            sleep(delay)
+        # end if
+        _last_submission = time()
+        try:
+            return post_request(request)
+        except NETWORK_ERRORS as err:
+            print()
+            printlog_info_time("Submission of the request failed: {}".format(err))
+            printlog_info("BLAST server might have received the request, but Request ID is unknown.")
+            if attempt_i == SUBMISSION_ATTEMPTS - 1:
+                break
+            # end if
+            delay = backoff_delay(attempt_i)
+            printlog_info("The request will be submitted again in {} seconds.".format(round(delay)))
+            sleep(delay)
+        # end try
+    # end for
+
+    printlog_error("{} attempts to submit the request have failed.".format(SUBMISSION_ATTEMPTS))
+    printlog_error("Please, check your Internet connection and restart barapost-prober: it will resume the work.")
+    platf_depend_exit(1)
+# end def submit_request
+
+
+def save_tmp_data(tmp_fpath, requests):
+    # Function saves requests, which are in flight now, to temporary file in order of their packets.
+    # Each request is saved as "Request_ID" line. If it's packet has non-standard size
+    #   (e.g. it is the first packet of resumed run or a subpacket of a split packet),
+    #   "Packet_size" and "Packet_mode" lines follow it. Packets, which have not been submitted yet
+    #   (the rest subpackets of a split packet), are saved with "-" instead of Request ID.
+    #
+    # :param tmp_fpath: path to temporary file;
+    # :type tmp_fpath: str;
+    # :param requests: list of tuples (<Request ID or None>, <packet size or None>, <packet mode or None>).
+    #   Size and mode are None for packets of standard size;
+    # :type requests: list<tuple<str, int, int>>;
+
+    lines = list()
+    for rid, packet_size, packet_mode in requests:
+        lines.append("Request_ID: {}".format(rid if not rid is None else '-'))
+        if not packet_size is None:
+            lines.append("Packet_size: {}".format(packet_size))
+            lines.append("Packet_mode: {}".format(packet_mode))
+        # end if
+    # end for
+
+    # File is replaced at once, so that an interruption cannot leave it incomplete
+    part_fpath = tmp_fpath + ".part"
+    with open(part_fpath, 'w') as tmpfile:
+        tmpfile.write('\n'.join(lines))
     # end with
+    os.replace(part_fpath, tmp_fpath)
+# end def save_tmp_data
+
+
+def send_request(request, pack_to_send, packet_size, packet_mode, filename, tmp_fpath,
+    extra_rids=()):
+    # Function sends a request to "blast.ncbi.nlm.nih.gov/blast/Blast.cgi"
+    #     and then waits for satisfaction of the request and retrieves response text.
+    #
+    # :param request: request_data (it is a dict that `configure_request()` function returns);
+    # :param request: dict<dict>;
+    # :param pack_to_send: current number (like id) of packet meant to be sent now.
+    # :type pack_to_send: int;
+    # :param pack_to_send: ordinal number of packet;
+    # :type pack_to_send: int;
+    # :param packet_size: numner of sequences in the packet;
+    # :type packet_size: int;
+    # :param extra_rids: other requests in flight, which should be saved in tmp file
+    #   after current request (see `save_tmp_data`);
+    # :type extra_rids: list<tuple<str, int, int>>;
+    #
+    # Returns XML text of type 'str' with BLAST response.
+
+    rid, rtoe = submit_request(request)
+
+    # Save temporary data
+    save_tmp_data(tmp_fpath, [(rid, packet_size, packet_mode)] + list(extra_rids))
 
     # Wait for results of alignment
     return wait_for_align(rid, rtoe, pack_to_send, filename)
@@ -10,8 +10,9 @@ from src.printlog import printlog_info, printlog_error, printlog_error_time, pri
 from src.platform import platf_depend_exit
 from src.filesystem import remove_bad_chars
 from src.filesystem import rename_file_verbosely
+from src.resume_point import get_resume_point_fpath, read_resume_point, truncate_partial_line
 
-from src.taxonomy import find_taxonomy
+from src.taxonomy import find_taxonomy_batch
 
 
 def ask_for_resumption():
@@ -55,13 +56,14 @@ def look_around(outdir_path, new_dpath, infile_path, blast_algorithm, acc_dict,
     # Returns None if there is no result from previous run.
     # If there are results from previous run, returns a dict of the following structure:
     # {
-    #     "RID": saved_RID <str>,
-    #     "packet_size_save": saved packet size <int>,
-    #     "packet_size_mode": saved packet mode <int>,
+    #     "saved_requests": requests in flight saved in tmp file: tuples
+    #         (<Request ID or None>, <packet size or None>, <packet mode or None>)
+    #         (see `src.prober_modules.networking.save_tmp_data`) <list<tuple<str, int, int>>>,
     #     "tsv_respath": path_to_tsv_file_from_previous_run <str>,
     #     "n_done_reads": number_of_successfull_requests_from_currenrt_FASTA_file <int>,
     #     "tmp_fpath": path_to_pemporary_file <str>,
-    #     "decr_pb": valuse decreasing size of probing batch (see below, where this variable is defined) <int>
+    #     "decr_pb": valuse decreasing size of probing batch (see below, where this variable is defined) <int>,
+    #     "resume_point": resume point from previous run (see `src.resume_point`) <dict> or None
     # }
     #
     # :param outdir_path: path to output directory;
@@ -89,7 +91,11 @@ def look_around(outdir_path, new_dpath, infile_path, blast_algorithm, acc_dict,
     # Form path to file with hits to download
     acc_fpath = os.path.join(outdir_path, "hits_to_download.tsv")
 
+    # Form path to resume point file
+    resume_fpath = get_resume_point_fpath(tsv_res_fpath)
+
     num_done_seqs = 0 # variable to keep number of successfully processed sequences
+    resume_point = None
 
     resume = None
     # Check if there are results from previous run.
@@ -105,6 +111,7 @@ def look_around(outdir_path, new_dpath, infile_path, blast_algorithm, acc_dict,
         rename_file_verbosely(tsv_res_fpath)
         rename_file_verbosely(tmp_fpath)
         rename_file_verbosely(acc_fpath)
+        rename_file_verbosely(resume_fpath)
     else:
         printlog_info("Let's try to resume...")
 
@@ -112,15 +119,38 @@ def look_around(outdir_path, new_dpath, infile_path, blast_algorithm, acc_dict,
         if os.path.exists(tsv_res_fpath):
             # There can be invalid information in this file
             try:
-                with open(tsv_res_fpath, 'r') as res_file:
-                    lines = res_file.readlines()
-                    num_done_seqs = len(lines) - 1 # the first line is a head
-                    last_line = lines[-1]
+                resume_point = read_resume_point(tsv_res_fpath)
+                if not resume_point is None and os.path.getsize(tsv_res_fpath) == resume_point["tsv_size"]:
+                    # Classification file has not been modified after the last resume point
+                    #   was saved, so there is no need to read it
+                    num_done_seqs = resume_point["n_done"]
+                    last_seq_id = resume_point["read_id"]
+                else:
+                    # Outdated resume point will be used only if it matches
+                    #   number of processed sequences (see `src.resume_point.resume_records`).
+                    # The last line might have been written partially
+                    truncate_partial_line(tsv_res_fpath)
+
+                    improper_lines = list() # list of tuples (<line number>, <line>)
+                    num_lines = 0
+                    with open(tsv_res_fpath, 'r') as res_file:
+                        for line in res_file:
+                            num_lines += 1
+                            # There must be 10 columns in each row:
+                            if line.count('\t') != 9:
+                                improper_lines.append((num_lines, line))
+                            # end if
+                            last_line = line
+                        # end for
+                    # end with
+                    if num_lines == 0:
+                        raise ValueError("File `classification.tsv` is empty")
+                    # end if
+                    num_done_seqs = num_lines - 1 # the first line is a head
                     last_seq_id = last_line.split('\t')[0]
-                # end with
-                # There must be 10 columns in each row:
-                if any(map(lambda l: l.count('\t') != 9, lines)):
-                    raise ValueError("There must be 10 colums separated by tabs in file `classification.tsv`")
+                    if len(improper_lines) != 0:
+                        raise ValueError("There must be 10 colums separated by tabs in file `classification.tsv`")
+                    # end if
                 # end if
 
             except Exception as err:
@@ -130,10 +160,8 @@ def look_around(outdir_path, new_dpath, infile_path, blast_algorithm, acc_dict,
                 # If the reason is known -- print erroneous lines
                 if isinstance(err, ValueError):
                     printlog_error("Here are numbers of improper lines:")
-                    for i, line in enumerate(lines):
-                        if line.count('\t') != 9:
-                            printlog_error(str(i+1) + ": `{}`".format(line))
-                        # end if
+                    for i, line in improper_lines:
+                        printlog_error(str(i) + ": `{}`".format(line))
                     # end for
                 # end if
 
@@ -148,6 +176,7 @@ def look_around(outdir_path, new_dpath, infile_path, blast_algorithm, acc_dict,
                         rename_file_verbosely(tsv_res_fpath)
                         rename_file_verbosely(tmp_fpath)
                         rename_file_verbosely(acc_fpath)
+                        rename_file_verbosely(resume_fpath)
                         return None
                     elif reply == 'q':
                         platf_depend_exit(0)
@@ -198,6 +227,7 @@ def look_around(outdir_path, new_dpath, infile_path, blast_algorithm, acc_dict,
                         rename_file_verbosely(tsv_res_fpath)
                         rename_file_verbosely(tmp_fpath)
                         rename_file_verbosely(acc_fpath)
+                        rename_file_verbosely(resume_fpath)
                         return None
                     elif reply == 'q':
                         platf_depend_exit(0)
@@ -224,21 +254,46 @@ def look_around(outdir_path, new_dpath, infile_path, blast_algorithm, acc_dict,
                 temp_lines = tmp_file.readlines()
             # end with
 
-            RID_save = re.search(r"Request_ID: (.+)", temp_lines[0]).group(1).strip()
-            packet_size_save = int(re.search(r"Packet_size: ([0-9]*)", temp_lines[1]).group(1).strip())
-            packet_mode_save = int(re.search(r"Packet_mode: ([0-9]{1})", temp_lines[2]).group(1).strip())
+            # There can be several requests in flight (see `src.prober_modules.networking.save_tmp_data`).
+            # Each of them is a list [<Request ID or None>, <packet size or None>, <packet mode or None>].
+            saved_requests = list()
+            for line in temp_lines:
+                rid_match = re.search(r"Request_ID: (.+)", line)
+                if not rid_match is None:
+                    rid = rid_match.group(1).strip()
+                    saved_requests.append([rid if rid != '-' else None, None, None])
+                    continue
+                # end if
+                size_match = re.search(r"Packet_size: ([0-9]+)", line)
+                if not size_match is None:
+                    saved_requests[-1][1] = int(size_match.group(1))
+                    continue
+                # end if
+                mode_match = re.search(r"Packet_mode: ([0-9]{1})", line)
+                if not mode_match is None:
+                    saved_requests[-1][2] = int(mode_match.group(1))
+                # end if
+            # end for
+
+            if len(saved_requests) == 0:
+                raise AttributeError("tmp file contains no Request ID")
+            # end if
+            # Size and mode of a packet are saved together
+            if any(map(lambda req: (req[1] is None) != (req[2] is None), saved_requests)):
+                raise AttributeError("incomplete packet size in tmp file")
+            # end if
+            saved_requests = list(map(tuple, saved_requests))
 
-        except (AttributeError, OSError):
+        except (AttributeError, IndexError, OSError):
 
             # There is no need to disturb a user, merely proceed.
             return {
-                "RID": None,
-                "packet_size_save": None,
-                "packet_mode_save": None,
+                "saved_requests": list(),
                 "tsv_respath": tsv_res_fpath,
                 "n_done_reads": num_done_seqs,
                 "tmp_fpath": tmp_fpath,
-                "decr_pb": 0
+                "decr_pb": 0,
+                "resume_point": resume_point
             }
         else:
             # Let's assume that a user won't modify his/her brobing_batch size between erroneous runs:
@@ -246,13 +301,12 @@ def look_around(outdir_path, new_dpath, infile_path, blast_algorithm, acc_dict,
             decr_pb = num_done_seqs if num_done_seqs < probing_batch_size else 0
             # Return data from previous run
             return {
-                "RID": RID_save,
-                "packet_size_save": packet_size_save,
-                "packet_mode_save": packet_mode_save,
+                "saved_requests": saved_requests,
                 "tsv_respath": tsv_res_fpath,
                 "n_done_reads": num_done_seqs,
                 "tmp_fpath": tmp_fpath,
-                "decr_pb": decr_pb
+                "decr_pb": decr_pb,
+                "resume_point": resume_point
             }
         # end try
     # end if
@@ -287,6 +341,9 @@ def parse_align_results_xml(xml_text, qual_dict, acc_dict, taxonomy_path):
 
     result_tsv_lines = list()
 
+    # Accessions and names of hits: their taxonomy will be downloaded at once
+    acc_def_pairs = list()
+
     # /=== Parse BLAST XML response ===/
 
     root = ElementTree.fromstring(xml_text) # get tree instance
@@ -342,8 +399,7 @@ def parse_align_results_xml(xml_text, qual_dict, acc_dict, taxonomy_path):
                 curr_acc = sys.intern(hit.find("Hit_accession").text)
                 hit_accs.append( curr_acc ) # get hit accession
 
-                # Get taxonomy
-                find_taxonomy(curr_acc, hit_def, taxonomy_path)
+                acc_def_pairs.append( (curr_acc, hit_def) )
 
                 # Update accession dictionary
                 try:
@@ -378,6 +434,9 @@ def parse_align_results_xml(xml_text, qual_dict, acc_dict, taxonomy_path):
         printn(qual_info_to_print)
     # end for
 
+    # Get taxonomy
+    find_taxonomy_batch(acc_def_pairs, taxonomy_path)
+
     return result_tsv_lines
 # end def parse_align_results_xml
 
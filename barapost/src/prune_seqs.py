@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
-# This module defines function that prunes sequences passed in fasta-formatted string.
+# This module defines functions that prune sequences: sequences of records
+#   retrieved from files (`prune_records`) and sequences passed in fasta-formatted string (`prune_seqs`).
+# Both of them pass records once, so pruning takes linear time.
+
+from src.seq_records import fasta_records_from_str
 
 
 def _prune(seq, value):
@@ -15,33 +19,47 @@ def _prune(seq, value):
 # end def _prune
 
 
-def prune_seqs(packet, value):
-    # Function prunes all sequences in fasta-formatted string.
-    # Function prunes sequences from both ends.
-    # :param packet: FASTA data;
-    # :type packet: str;
+def _check_value(value):
+    # Function checks length of resulting sequences.
     # :param value: length of resulting sequence;
     # :type value: int;
 
-    lines = packet.splitlines()
-    packet = ""
-
     if value < 1:
         raise ValueError("Invalid value of parameter `value`: it must be > 1")
     # end if
+# end def _check_value
+
+
+def prune_records(records, value):
+    # Generator prunes sequences of records (FASTA or FASTQ) and yields these records.
+    # Function prunes sequences from both ends. Sequences are pruned in place,
+    #   other fields of records (e.g. quality lines) remain intact.
+    # :param records: iterable of records;
+    # :type records: iterable<FastaRecord or FastqRecord>;
+    # :param value: length of resulting sequence;
+    # :type value: int;
 
-    # Get indices of ID lines in fasta-formatted string
-    id_line_idxs = list(map(lines.index, filter(lambda x: x.startswith('>'), lines)))
-    id_line_idxs.append(len(lines)) # fictive last id line
-
-    for id_curr, id_next in zip(id_line_idxs[:-1], id_line_idxs[1:]):
-        # If 'i' lies between two ID lines. it's sequence line
-        is_seq = lambda i: i > id_curr and i < id_next
-        # Get all sequence lines of current record
-        seq_lines = map(lambda j: lines[j], filter(is_seq, range(len(lines))))
-        seq = _prune("".join(seq_lines), value) # form a single string and prune it
-        packet += lines[id_curr] + '\n' + seq + '\n' # apend pruned record to packet
+    _check_value(value)
+
+    for record in records:
+        if len(record.seq) > value:
+            record.seq = _prune(record.seq, value)
+        # end if
+        yield record
     # end for
+# end def prune_records
+
+
+def prune_seqs(packet, value):
+    # Function prunes all sequences in fasta-formatted string.
+    # Function prunes sequences from both ends.
+    # :param packet: FASTA data;
+    # :type packet: str;
+    # :param value: length of resulting sequence;
+    # :type value: int;
+
+    _check_value(value)
 
-    return packet
+    return "".join(record.seq_id + '\n' + record.seq + '\n'
+        for record in prune_records(fasta_records_from_str(packet), value))
 # end def prune_seqs
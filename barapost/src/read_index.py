@@ -0,0 +1,477 @@
+# -*- coding: utf-8 -*-
+# This module defines read index: file, which maps IDs of reads (sequences) of FASTA or FASTQ file
+#   to their offsets. The index is built in one pass and stored beside the file (see `get_index_path`).
+# The index is used:
+#   - by barapost-local: to split a file into chunks without reading it (see `ReadIndex.locate`),
+#     worker processes read their chunks themselves (see `read_range`);
+#   - by barapost-binning: to fetch reads of each binned file by their IDs (see `ReadIndex.fetch`);
+#   - on resumption: to find the last processed read by it's ID and continue right after it
+#     (see `ReadIndex.locate_read` and `ReadIndex.records_from`).
+# Reads of uncompressed files are accessed via `mmap`. Gzipped files can be indexed only
+#   if they are BGZF files (e.g. ones compressed by `bgzip`): their reads are accessed
+#   via BGZF virtual offsets.
+#
+# Index file has the following structure:
+#   - the first line: <INDEX_SIGNATURE>\t<size of indexed file>\t<modification time of indexed file (ns)>;
+#   - a line for each record in order of the file: <read ID>\t<offset>\t<virtual offset>;
+#   - the last line: <total size of uncompressed data>\t<virtual offset of the end of data>.
+# Offsets are offsets in uncompressed data. Virtual offsets are the same as offsets for uncompressed files.
+# Read IDs are formatted by `fmt_read_id` (without leading '>'), like in classification files.
+
+import os
+import mmap
+from bisect import bisect_right
+
+from src.fmt_read_id import fmt_read_id
+from src.seq_records import fastq_records_from_str, fasta_records_from_str
+from src.filesystem import is_gzipped, is_fastq
+from src.gzip_io import is_bgzf, bgzf_blocks, make_virtual_offset, BgzfRandomReader
+
+INDEX_SIGNATURE = "#barapost_read_index_v1"
+
+# Size of pieces, which are read from uncompressed files while indexing
+_PIECE_SIZE = 1024 * 1024
+
+# Maximum size of data, which is read (and decoded) at once while fetching records.
+# Adjacent records are read together up to this size.
+FETCH_SPAN_SIZE = 4 * 1024 * 1024
+
+
+def get_index_path(fq_fa_path):
+    # Function returns path to read index of a FASTA or FASTQ file.
+    #
+    # :param fq_fa_path: path to FASTA or FASTQ file;
+    # :type fq_fa_path: str;
+
+    return fq_fa_path + ".bpidx"
+# end def get_index_path
+
+
+def _file_signature(fq_fa_path):
+    # Function returns size and modification time of file: index is valid only if they have not changed.
+    #
+    # :param fq_fa_path: path to FASTA or FASTQ file;
+    # :type fq_fa_path: str;
+
+    stat = os.stat(fq_fa_path)
+    return stat.st_size, stat.st_mtime_ns
+# end def _file_signature
+
+
+def is_indexable(fq_fa_path):
+    # Function checks if a file can be indexed: it must be uncompressed or BGZF.
+    #
+    # :param fq_fa_path: path to FASTA or FASTQ file;
+    # :type fq_fa_path: str;
+
+    return not is_gzipped(fq_fa_path) or is_bgzf(fq_fa_path)
+# end def is_indexable
+
+
+def _plain_pieces(fq_fa_path):
+    # Generator yields pieces of uncompressed file.
+    #
+    # :param fq_fa_path: path to FASTA or FASTQ file;
+    # :type fq_fa_path: str;
+
+    with open(fq_fa_path, 'rb') as fq_fa_file:
+        piece = fq_fa_file.read(_PIECE_SIZE)
+        while piece != b"":
+            yield piece
+            piece = fq_fa_file.read(_PIECE_SIZE)
+        # end while
+    # end with
+# end def _plain_pieces
+
+
+def _scan_records(pieces, fastq):
+    # Generator yields offsets and ID lines of records found in data.
+    # The last yielded tuple contains total size of data and None.
+    #
+    # :param pieces: iterable of pieces of data;
+    # :type pieces: iterable<bytes>;
+    # :param fastq: True if data is FASTQ, False if it is FASTA;
+    # :type fastq: bool;
+
+    pos = 0 # offset of the beginning of 'tail'
+    tail = b"" # incomplete line remaining from the previous piece
+    line_num = 0 # number of line in FASTQ record: 0, 1, 2 or 3
+
+    for piece in pieces:
+        lines = (tail + piece).split(b'\n')
+        tail = lines.pop()
+        for line in lines:
+            if fastq:
+                if line_num == 0 and line.strip() != b"":
+                    yield pos, line
+                # end if
+                line_num = (line_num + 1) % 4
+            elif line.startswith(b'>'):
+                yield pos, line
+            # end if
+            pos += len(line) + 1
+        # end for
+    # end for
+
+    # The last line lacks line break
+    if tail.strip() != b"" and ((fastq and line_num == 0) or (not fastq and tail.startswith(b'>'))):
+        yield pos, tail
+    # end if
+    yield pos + len(tail), None
+# end def _scan_records
+
+
+def build_read_index(fq_fa_path):
+    # Function builds read index of a FASTA or FASTQ file and writes it beside the file.
+    # Returns the index (see `ReadIndex`) or None if the file cannot be indexed.
+    #
+    # :param fq_fa_path: path to FASTA or FASTQ file;
+    # :type fq_fa_path: str;
+
+    if not is_indexable(fq_fa_path):
+        return None
+    # end if
+
+    signature = _file_signature(fq_fa_path)
+    fastq = is_fastq(fq_fa_path)
+
+    if is_gzipped(fq_fa_path):
+        # Blocks are recorded in order to convert offsets to virtual offsets
+        block_coffsets = list()
+        block_ustarts = list()
+
+        def pieces():
+            ustart = 0
+            for coffset, data in bgzf_blocks(fq_fa_path):
+                if len(data) != 0:
+                    block_coffsets.append(coffset)
+                    block_ustarts.append(ustart)
+                    ustart += len(data)
+                    yield data
+                # end if
+            # end for
+        # end def pieces
+
+        def virtual_offset(offset):
+            i = bisect_right(block_ustarts, offset) - 1
+            if i < 0:
+                return 0
+            # end if
+            return make_virtual_offset(block_coffsets[i], offset - block_ustarts[i])
+        # end def virtual_offset
+
+        scanned = _scan_records(pieces(), fastq)
+    else:
+        virtual_offset = lambda offset: offset
+        scanned = _scan_records(_plain_pieces(fq_fa_path), fastq)
+    # end if
+
+    read_ids = list()
+    offsets = list()
+    for offset, id_line in scanned:
+        if not id_line is None:
+            read_ids.append(fmt_read_id(id_line.decode("utf-8").strip())[1:])
+        # end if
+        offsets.append(offset)
+    # end for
+
+    # Virtual offsets are calculated after all blocks are passed
+    voffsets = list(map(virtual_offset, offsets))
+
+    index_path = get_index_path(fq_fa_path)
+    with open(index_path, 'w') as index_file:
+        index_file.write("{}\t{}\t{}\n".format(INDEX_SIGNATURE, *signature))
+        for read_id, offset, voffset in zip(read_ids, offsets, voffsets):
+            index_file.write("{}\t{}\t{}\n".format(read_id, offset, voffset))
+        # end for
+        index_file.write("{}\t{}\n".format(offsets[-1], voffsets[-1]))
+    # end with
+
+    return ReadIndex(fq_fa_path, read_ids, offsets, voffsets)
+# end def build_read_index
+
+
+def load_read_index(fq_fa_path):
+    # Function loads read index of a FASTA or FASTQ file.
+    # Returns the index (see `ReadIndex`) or None if there is no index or if it is out of date.
+    #
+    # :param fq_fa_path: path to FASTA or FASTQ file;
+    # :type fq_fa_path: str;
+
+    index_path = get_index_path(fq_fa_path)
+    if not os.path.exists(index_path):
+        return None
+    # end if
+
+    read_ids = list()
+    offsets = list()
+    voffsets = list()
+
+    try:
+        with open(index_path, 'r') as index_file:
+            header = index_file.readline().rstrip('\n').split('\t')
+            if header != [INDEX_SIGNATURE] + list(map(str, _file_signature(fq_fa_path))):
+                return None
+            # end if
+            for line in index_file:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) == 3:
+                    read_ids.append(fields[0])
+                # end if
+                offsets.append(int(fields[-2]))
+                voffsets.append(int(fields[-1]))
+            # end for
+        # end with
+    except (OSError, ValueError, IndexError):
+        return None
+    # end try
+
+    if len(offsets) != len(read_ids) + 1:
+        return None # index is truncated
+    # end if
+
+    return ReadIndex(fq_fa_path, read_ids, offsets, voffsets)
+# end def load_read_index
+
+
+def get_read_index(fq_fa_path):
+    # Function loads read index of a FASTA or FASTQ file, or builds it if it is absent or out of date.
+    # Returns None if the file cannot be indexed.
+    #
+    # :param fq_fa_path: path to FASTA or FASTQ file;
+    # :type fq_fa_path: str;
+
+    read_index = load_read_index(fq_fa_path)
+    if read_index is None:
+        read_index = build_read_index(fq_fa_path)
+    # end if
+    return read_index
+# end def get_read_index
+
+
+def read_range(fq_fa_path, voffset, length):
+    # Function reads 'length' bytes of (uncompressed) data of FASTA or FASTQ file
+    #   beginning at virtual offset 'voffset' (see `ReadIndex.locate`).
+    #
+    # :param fq_fa_path: path to FASTA or FASTQ file;
+    # :type fq_fa_path: str;
+    # :param voffset: virtual offset of the beginning of data;
+    # :type voffset: int;
+    # :param length: number of bytes to read;
+    # :type length: int;
+
+    if is_gzipped(fq_fa_path):
+        reader = BgzfRandomReader(fq_fa_path)
+        try:
+            data = reader.read(voffset, length)
+        finally:
+            reader.close()
+        # end try
+    else:
+        with open(fq_fa_path, 'rb') as fq_fa_file:
+            fq_fa_file.seek(voffset)
+            data = fq_fa_file.read(length)
+        # end with
+    # end if
+
+    return data.decode("utf-8")
+# end def read_range
+
+
+class ReadIndex:
+    # Read index of a FASTA or FASTQ file.
+    # Records are addressed either by read ID or by their ordinal number in the file.
+
+    def __init__(self, fq_fa_path, read_ids, offsets, voffsets):
+        # :param fq_fa_path: path to FASTA or FASTQ file;
+        # :type fq_fa_path: str;
+        # :param read_ids: IDs of reads in order of the file;
+        # :type read_ids: list<str>;
+        # :param offsets: offsets of records in uncompressed data. The last element is size of data;
+        # :type offsets: list<int>;
+        # :param voffsets: virtual offsets of records. The last element is virtual offset of the end of data;
+        # :type voffsets: list<int>;
+
+        self.fq_fa_path = fq_fa_path
+        self.read_ids = read_ids
+        self._offsets = offsets
+        self._voffsets = voffsets
+        self._positions = None # {<read_id>: <ordinal number of record>}, is created on demand
+        self._reader = None # file is opened on demand
+    # end def __init__
+
+    def __len__(self):
+        return len(self.read_ids)
+    # end def __len__
+
+    def __contains__(self, read_id):
+        return read_id in self._get_positions()
+    # end def __contains__
+
+    def _get_positions(self):
+        if self._positions is None:
+            self._positions = {read_id: i for i, read_id in enumerate(self.read_ids)}
+        # end if
+        return self._positions
+    # end def _get_positions
+
+    def position(self, read_id):
+        # Function returns ordinal number of record with given read ID or None if it is absent.
+        #
+        # :param read_id: ID of a read;
+        # :type read_id: str;
+
+        return self._get_positions().get(read_id)
+    # end def position
+
+    def offset(self, num):
+        # Function returns offset of 'num'-th record in uncompressed data.
+        # Offset of the record following the last one is size of data.
+        #
+        # :param num: ordinal number of record;
+        # :type num: int;
+
+        return self._offsets[num]
+    # end def offset
+
+    def locate_read(self, read_id):
+        # Function returns location of record with given read ID:
+        #   tuple (offset in uncompressed data, size of record), or None if it is absent.
+        #
+        # :param read_id: ID of a read;
+        # :type read_id: str;
+
+        num = self.position(read_id)
+        if num is None:
+            return None
+        # end if
+        return self._offsets[num], self._offsets[num+1] - self._offsets[num]
+    # end def locate_read
+
+    def locate(self, start, end):
+        # Function returns location of records from 'start'-th to ('end'-1)-th:
+        #   tuple (virtual offset of the first record, total size of records).
+        #
+        # :param start: ordinal number of the first record;
+        # :type start: int;
+        # :param end: ordinal number of the record following the last one;
+        # :type end: int;
+
+        return self._voffsets[start], self._offsets[end] - self._offsets[start]
+    # end def locate
+
+    def _read(self, voffset, length):
+        # Function reads data from the indexed file.
+        if self._reader is None:
+            if is_gzipped(self.fq_fa_path):
+                self._reader = BgzfRandomReader(self.fq_fa_path)
+            elif length == 0:
+                return b"" # empty file cannot be mapped
+            else:
+                with open(self.fq_fa_path, 'rb') as fq_fa_file:
+                    self._reader = mmap.mmap(fq_fa_file.fileno(), 0, access=mmap.ACCESS_READ)
+                # end with
+            # end if
+        # end if
+
+        if isinstance(self._reader, mmap.mmap):
+            return self._reader[voffset : voffset + length]
+        else:
+            return self._reader.read(voffset, length)
+        # end if
+    # end def _read
+
+    def read_records(self, start, end):
+        # Function returns text of records from 'start'-th to ('end'-1)-th.
+        #
+        # :param start: ordinal number of the first record;
+        # :type start: int;
+        # :param end: ordinal number of the record following the last one;
+        # :type end: int;
+
+        text = self._read(*self.locate(start, end)).decode("utf-8")
+        if '\r' in text:
+            text = text.replace('\r', "")
+        # end if
+        return text
+    # end def read_records
+
+    def _records_from_str(self):
+        # Function returns function retrieving records from text of indexed file.
+        if is_fastq(self.fq_fa_path):
+            return fastq_records_from_str
+        else:
+            return fasta_records_from_str
+        # end if
+    # end def _records_from_str
+
+    def _span_end(self, start, end):
+        # Function returns ordinal number of record following the last one, which is read along with
+        #   'start'-th record: records are read by spans of at most `FETCH_SPAN_SIZE` bytes (but at least one record).
+        limit = self._offsets[start] + FETCH_SPAN_SIZE
+        span_end = start + 1
+        while span_end < end and self._offsets[span_end + 1] <= limit:
+            span_end += 1
+        # end while
+        return span_end
+    # end def _span_end
+
+    def fetch(self, read_ids):
+        # Generator yields records (see src/seq_records.py) with given IDs in order of the file.
+        # IDs absent from the index are passed. Adjacent records are read at once.
+        #
+        # :param read_ids: IDs of reads to fetch;
+        # :type read_ids: iterable<str>;
+
+        records_from_str = self._records_from_str()
+
+        positions = self._get_positions()
+        nums = sorted(positions[read_id] for read_id in set(read_ids) if read_id in positions)
+
+        i = 0
+        while i < len(nums):
+            # Find run of adjacent records
+            j = i + 1
+            while j < len(nums) and nums[j] == nums[j-1] + 1:
+                j += 1
+            # end while
+            start = nums[i]
+            while start <= nums[j-1]:
+                span_end = self._span_end(start, nums[j-1] + 1)
+                yield from records_from_str(self.read_records(start, span_end))
+                start = span_end
+            # end while
+            i = j
+        # end while
+    # end def fetch
+
+    def records_from(self, start):
+        # Generator yields all records beginning with 'start'-th one.
+        #
+        # :param start: ordinal number of the first record;
+        # :type start: int;
+
+        records_from_str = self._records_from_str()
+
+        while start < len(self.read_ids):
+            span_end = self._span_end(start, len(self.read_ids))
+            yield from records_from_str(self.read_records(start, span_end))
+            start = span_end
+        # end while
+    # end def records_from
+
+    def close(self):
+        if not self._reader is None:
+            self._reader.close()
+            self._reader = None
+        # end if
+    # end def close
+
+    def __enter__(self):
+        return self
+    # end def __enter__
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    # end def __exit__
+# end class ReadIndex
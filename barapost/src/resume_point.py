@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+# This module defines resume points: records, which allow to resume processing of an input file
+#   without reading sequences, which have been already processed.
+#
+# Resume point is written to file `RESUME_POINT_FNAME` (beside classification file) after results
+#   of each packet are written to classification file. Each line of this file is a resume point:
+#   <number of processed sequences>\t<offset of the last processed record>\t<size of classification file>\t<ID of the last processed sequence>
+# Offset is an offset of the record in the input file (in decompressed data for gzipped files).
+# On resumption, the last processed record is found at the recorded offset
+#   and it's ID is compared to the recorded one. If they do not match (e.g. the input file has changed),
+#   processed sequences are passed one by one, as previously.
+# If the input file has an up-to-date read index (see src/read_index.py), the last processed record
+#   is found in the index by it's ID, and records following it are read via the index.
+
+import os
+from itertools import islice
+
+from src.fmt_read_id import fmt_read_id
+from src.filesystem import is_fastq
+from src.seq_records import fastq_records, fasta_records
+from src.read_index import load_read_index
+
+RESUME_POINT_FNAME = "resume_point.tsv"
+
+
+def get_resume_point_fpath(tsv_res_path):
+    # Function returns path to resume point file corresponding to classification file.
+    #
+    # :param tsv_res_path: path to classification file;
+    # :type tsv_res_path: str;
+
+    return os.path.join(os.path.dirname(tsv_res_path), RESUME_POINT_FNAME)
+# end def get_resume_point_fpath
+
+
+def write_resume_point(resume_point, tsv_res_path):
+    # Function appends resume point to resume point file.
+    # It should be called after results are written to classification file.
+    #
+    # :param resume_point: resume point of the following structure:
+    #   {"n_done": number of processed sequences <int>, "offset": offset of the last processed record <int>,
+    #   "read_id": ID of the last processed sequence <str>};
+    # :type resume_point: dict;
+    # :param tsv_res_path: path to classification file;
+    # :type tsv_res_path: str;
+
+    with open(get_resume_point_fpath(tsv_res_path), 'a') as resume_file:
+        resume_file.write("{}\t{}\t{}\t{}\n".format(resume_point["n_done"], resume_point["offset"],
+            os.path.getsize(tsv_res_path), resume_point["read_id"]))
+    # end with
+# end def write_resume_point
+
+
+def read_resume_point(tsv_res_path):
+    # Function reads the last valid resume point from resume point file.
+    # Returns None if there is no valid resume point or if classification file is smaller
+    #   than it was when the resume point was written.
+    # Returns dict of the same structure as one passed to `write_resume_point`
+    #   with additional key "tsv_size" -- size of classification file.
+    #
+    # :param tsv_res_path: path to classification file;
+    # :type tsv_res_path: str;
+
+    resume_fpath = get_resume_point_fpath(tsv_res_path)
+    if not os.path.exists(resume_fpath) or not os.path.exists(tsv_res_path):
+        return None
+    # end if
+
+    resume_point = None
+    with open(resume_fpath, 'r') as resume_file:
+        for line in resume_file:
+            # The last line may be written partially
+            fields = line.rstrip('\n').split('\t')
+            if not line.endswith('\n') or len(fields) != 4:
+                continue
+            # end if
+            try:
+                resume_point = {
+                    "n_done": int(fields[0]),
+                    "offset": int(fields[1]),
+                    "tsv_size": int(fields[2]),
+                    "read_id": fields[3],
+                }
+            except ValueError:
+                continue
+            # end try
+        # end for
+    # end with
+
+    if resume_point is None or os.path.getsize(tsv_res_path) < resume_point["tsv_size"]:
+        return None
+    # end if
+
+    return resume_point
+# end def read_resume_point
+
+
+def truncate_partial_line(tsv_res_path):
+    # Function removes the last line of classification file if it lacks line break,
+    #   i.e. if it was written partially.
+    #
+    # :param tsv_res_path: path to classification file;
+    # :type tsv_res_path: str;
+
+    with open(tsv_res_path, 'r+b') as tsv_file:
+        tsv_file.seek(0, os.SEEK_END)
+        size = tsv_file.tell()
+        pos = size
+        # Find the last line break reading the file backwards
+        while pos > 0:
+            step = min(pos, 4096)
+            tsv_file.seek(pos - step)
+            last_break = tsv_file.read(step).rfind(b'\n')
+            if last_break != -1:
+                pos = pos - step + last_break + 1
+                break
+            # end if
+            pos -= step
+        # end while
+        if pos != size:
+            tsv_file.truncate(pos)
+        # end if
+    # end with
+# end def truncate_partial_line
+
+
+def _seek_resume_point(fq_fa_path, resume_point):
+    # Function returns iterator of records of FASTQ or FASTA file, which follow
+    #   the last processed record recorded in 'resume_point', and offset of the first of them.
+    # Returns (None, None) if the recorded record is not found at the recorded offset.
+    #
+    # :param fq_fa_path: path to FASTQ or FASTA file;
+    # :type fq_fa_path: str;
+    # :param resume_point: resume point (see `read_resume_point`);
+    # :type resume_point: dict;
+
+    seq_records = fastq_records if is_fastq(fq_fa_path) else fasta_records
+
+    records = seq_records(fq_fa_path, resume_point["offset"])
+    try:
+        last_record = next(records, None)
+    except UnicodeDecodeError:
+        last_record = None # offset is not at the beginning of a record
+    # end try
+
+    if not last_record is None and fmt_read_id(last_record.seq_id)[1:] == resume_point["read_id"]:
+        return records, resume_point["offset"] + last_record.size
+    # end if
+
+    records.close()
+    return None, None
+# end def _seek_resume_point
+
+
+def _seek_read_index(fq_fa_path, num_done_seqs, resume_point):
+    # Function returns iterator of records of FASTQ or FASTA file, which follow 'num_done_seqs'
+    #   processed ones, and offset of the first of them. Records are read via read index.
+    # If resume point corresponds to 'num_done_seqs', the last processed record is found by it's ID.
+    #   Otherwise it is found by it's ordinal number.
+    # Returns (None, None) if there is no up-to-date index or if it does not agree with resume point.
+    #
+    # :param fq_fa_path: path to FASTQ or FASTA file;
+    # :type fq_fa_path: str;
+    # :param num_done_seqs: number of processed sequences;
+    # :type num_done_seqs: int;
+    # :param resume_point: resume point (see `read_resume_point`);
+    # :type resume_point: dict;
+
+    read_index = load_read_index(fq_fa_path)
+    if read_index is None or num_done_seqs > len(read_index):
+        return None, None
+    # end if
+
+    if not resume_point is None and resume_point["n_done"] == num_done_seqs and num_done_seqs > 0:
+        location = read_index.locate_read(resume_point["read_id"])
+        if location is None or location[0] != read_index.offset(num_done_seqs - 1):
+            return None, None
+        # end if
+        offset = sum(location) # the record right after the last processed one
+    else:
+        offset = read_index.offset(num_done_seqs)
+    # end if
+
+    def records():
+        with read_index:
+            yield from read_index.records_from(num_done_seqs)
+        # end with
+    # end def records
+
+    return records(), offset
+# end def _seek_read_index
+
+
+def resume_records(fq_fa_path, num_done_seqs, position, resume_point=None):
+    # Generator yields records of FASTQ or FASTA file, which follow 'num_done_seqs' processed ones.
+    # If the file has an up-to-date read index, records are read via the index right after the
+    #   last processed one. Otherwise, if 'resume_point' corresponds to 'num_done_seqs',
+    #   reading starts directly at the recorded offset. Otherwise processed sequences are passed one by one.
+    # Position of the last yielded record is kept in 'position' dict:
+    #   {"n_done": number of processed sequences <int>, "offset": offset of the last yielded record <int>,
+    #   "seq_id": ID line of the last yielded record <str>} (see `get_resume_point`).
+    #
+    # :param fq_fa_path: path to FASTQ or FASTA file;
+    # :type fq_fa_path: str;
+    # :param num_done_seqs: number of processed sequences;
+    # :type num_done_seqs: int;
+    # :param position: dict to keep position in;
+    # :type position: dict;
+    # :param resume_point: resume point (see `read_resume_point`);
+    # :type resume_point: dict;
+
+    num_done_seqs = int(num_done_seqs)
+
+    records = None
+
+    if num_done_seqs > 0:
+        records, offset = _seek_read_index(fq_fa_path, num_done_seqs, resume_point)
+    # end if
+
+    if records is None and not resume_point is None\
+            and resume_point["n_done"] == num_done_seqs and num_done_seqs > 0:
+        records, offset = _seek_resume_point(fq_fa_path, resume_point)
+    # end if
+
+    if records is None:
+        records = (fastq_records if is_fastq(fq_fa_path) else fasta_records)(fq_fa_path)
+        offset = 0
+        for record in islice(records, num_done_seqs):
+            offset += record.size
+        # end for
+    # end if
+
+    position["n_done"] = num_done_seqs
+    try:
+        for record in records:
+            position["n_done"] += 1
+            position["offset"] = offset
+            position["seq_id"] = record.seq_id
+            offset += record.size
+            yield record
+        # end for
+    finally:
+        records.close()
+    # end try
+# end def resume_records
+
+
+def get_resume_point(position):
+    # Function makes resume point (see `write_resume_point`) from position of the last
+    #   record retrieved by `resume_records`.
+    #
+    # :param position: position of the last retrieved record;
+    # :type position: dict;
+
+    return {
+        "n_done": position["n_done"],
+        "offset": position["offset"],
+        "read_id": fmt_read_id(position["seq_id"])[1:],
+    }
+# end def get_resume_point
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+# This module defines generators that yield records retrieved from FASTQ and FASTA files.
+# They are shared by barapost-prober, barapost-local (packet forming) and barapost-binning.
+#
+# Files are read in binary mode by large blocks (see `BLOCK_SIZE`), and each block is decoded at once.
+# FASTQ blocks with short reads are split into lines, lines of long reads are found with `str.find`
+#   and sliced once, and FASTA blocks are split into records by "\n>",
+#   so lines are not read, stripped and decoded one by one.
+
+from codecs import getincrementaldecoder
+
+from src.filesystem import OPEN_FUNCS, is_gzipped
+
+# Size of blocks read from files
+BLOCK_SIZE = 256 * 1024
+
+FASTQ_LINES_PER_READ = 4
+
+# FASTQ records with sequences longer than this are parsed by `_fastq_records_by_find`
+LONG_LINE_LEN = 1024
+
+
+def _nbytes(text):
+    # Function returns size of UTF-8 encoded text.
+    #
+    # :param text: text;
+    # :type text: str;
+
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+# end def _nbytes
+
+
+class FastqRecord:
+    # FASTQ record: four lines of FASTQ without line breaks.
+
+    __slots__ = ("seq_id", "seq", "opt_id", "qual_line")
+
+    def __init__(self, seq_id, seq, opt_id, qual_line):
+        self.seq_id = seq_id
+        self.seq = seq
+        self.opt_id = opt_id
+        self.qual_line = qual_line
+    # end def __init__
+
+    @property
+    def size(self):
+        # Size of the record in file (in bytes, line breaks included)
+        return sum(map(_nbytes, (self.seq_id, self.seq, self.opt_id, self.qual_line))) + 4
+    # end def size
+# end class FastqRecord
+
+
+class FastaRecord:
+    # FASTA record: ID line and sequence (joined into a single line).
+    # Size of the record in file (in bytes, line breaks included) is kept along with it.
+
+    __slots__ = ("seq_id", "seq", "size")
+
+    def __init__(self, seq_id, seq, size=None):
+        self.seq_id = seq_id
+        self.seq = seq
+        self.size = size
+    # end def __init__
+# end class FastaRecord
+
+
+def _open_at(fpath, offset):
+    # Function opens plain text or gzipped file in binary mode and sets position to 'offset'.
+    # Offset of gzipped file is an offset in decompressed data.
+    #
+    # :param fpath: path to file;
+    # :type fpath: str;
+    # :param offset: offset to start reading at;
+    # :type offset: int;
+
+    if is_gzipped(fpath):
+        return OPEN_FUNCS[True](fpath, 'rb', offset)
+    # end if
+
+    infile = open(fpath, 'rb')
+    infile.seek(offset)
+    return infile
+# end def _open_at
+
+
+def text_blocks(fpath, offset=0):
+    # Generator yields decoded blocks of a plain text or gzipped file.
+    # Blocks are cut at arbitrary positions. Carriage returns are removed.
+    #
+    # :param fpath: path to file;
+    # :type fpath: str;
+    # :param offset: offset to start reading at (see `_open_at`);
+    # :type offset: int;
+
+    # Incremental decoder handles characters split between blocks
+    decoder = getincrementaldecoder("utf-8")()
+
+    with _open_at(fpath, offset) as infile:
+        block = infile.read(BLOCK_SIZE)
+        while block != b"":
+            text = decoder.decode(block)
+            if '\r' in text:
+                text = text.replace('\r', "")
+            # end if
+            yield text
+            block = infile.read(BLOCK_SIZE)
+        # end while
+        yield decoder.decode(b"", final=True)
+    # end with
+# end def text_blocks
+
+
+def _fastq_records_by_lines(pending, block):
+    # Function retrieves complete FASTQ records from a block of text, which is split into lines at once.
+    # It is faster for short lines.
+    # Returns tuple of two elements: (<iterator of records>, <text remaining after the last complete record>).
+    #   The remaining text is None if an empty ID line is met.
+    #
+    # :param pending: incomplete record remaining from previous blocks;
+    # :type pending: str;
+    # :param block: block of text;
+    # :type block: str;
+
+    lines = block.split('\n')
+    if pending != "":
+        # Pending text is short, so only it is split again, and the block is not copied
+        head = pending.split('\n')
+        head[-1] += lines[0]
+        lines[0:1] = head
+    # end if
+    # The last line is incomplete (it is empty if text ends with a line break)
+    n_full = (len(lines) - 1) // FASTQ_LINES_PER_READ * FASTQ_LINES_PER_READ
+    seq_ids = lines[0:n_full:FASTQ_LINES_PER_READ]
+    stop = "" in seq_ids
+    if stop:
+        n_full = seq_ids.index("") * FASTQ_LINES_PER_READ
+        seq_ids = seq_ids[:n_full // FASTQ_LINES_PER_READ]
+    # end if
+    # Slices of lines are the 1-st, 2-nd, 3-rd and 4-th lines of records
+    records = map(FastqRecord, seq_ids,
+        *(lines[i:n_full:FASTQ_LINES_PER_READ] for i in range(1, FASTQ_LINES_PER_READ)))
+    return records, None if stop else '\n'.join(lines[n_full:])
+# end def _fastq_records_by_lines
+
+
+def _fastq_records_by_find(text):
+    # Function retrieves complete FASTQ records from text: line breaks are found with `str.find`,
+    #   and each line is sliced from the text once.
+    # It is faster for long lines, since `str.split` compares characters one by one.
+    # Returns tuple of two elements: (<list of records>, <text remaining after the last complete record>).
+    #   The remaining text is None if an empty ID line is met.
+    #
+    # :param text: text beginning with a record;
+    # :type text: str;
+
+    records = list()
+    find = text.find
+    pos = 0 # start of the current record
+    while True:
+        id_end = find('\n', pos)
+        if id_end == pos:
+            return records, None
+        # end if
+        seq_end = find('\n', id_end + 1) if id_end != -1 else -1
+        opt_end = find('\n', seq_end + 1) if seq_end != -1 else -1
+        qual_end = find('\n', opt_end + 1) if opt_end != -1 else -1
+        if qual_end == -1:
+            return records, text[pos:]
+        # end if
+        records.append(FastqRecord(text[pos:id_end], text[id_end+1:seq_end],
+            text[seq_end+1:opt_end], text[opt_end+1:qual_end]))
+        pos = qual_end + 1
+    # end while
+# end def _fastq_records_by_find
+
+
+def _count_line_breaks(text, limit):
+    # Function counts line breaks in text, but not more than 'limit' of them.
+    #
+    # :param text: text;
+    # :type text: str;
+    # :param limit: maximum number of line breaks to count;
+    # :type limit: int;
+
+    n_breaks = 0
+    pos = -1
+    while n_breaks < limit:
+        pos = text.find('\n', pos + 1)
+        if pos == -1:
+            break
+        # end if
+        n_breaks += 1
+    # end while
+    return n_breaks
+# end def _count_line_breaks
+
+
+def _has_short_seq(pending, block):
+    # Function checks if sequence of the first record in pending text and a block is short (see `LONG_LINE_LEN`).
+    #
+    # :param pending: incomplete record remaining from previous blocks;
+    # :type pending: str;
+    # :param block: block of text;
+    # :type block: str;
+
+    if len(pending) > 2 * LONG_LINE_LEN:
+        return False
+    # end if
+    # Pending text begins with ID line, and the second line is a sequence
+    head = pending + block[:2 * LONG_LINE_LEN]
+    id_end = head.find('\n')
+    seq_end = head.find('\n', id_end + 1) if id_end != -1 else -1
+    return seq_end != -1 and seq_end - id_end <= LONG_LINE_LEN
+# end def _has_short_seq
+
+
+def fastq_records_from_blocks(blocks):
+    # Generator yields FASTQ records from blocks of text (see `text_blocks`).
+    # Incomplete record at the end of a block is kept in a single buffer and prepended to the next block.
+    # Text is split into lines at once if sequences are short (see `_has_short_seq`),
+    #   otherwise line breaks are searched for one by one.
+    # Reading stops at the first empty ID line.
+    #
+    # :param blocks: iterable of blocks of text;
+    # :type blocks: iterable<str>;
+
+    pending = "" # incomplete record remaining from previous blocks
+    parts = list() # blocks, which do not complete a long pending record
+    n_breaks = 0 # number of line breaks in a long pending record and in 'parts'
+    for block in blocks:
+        if len(parts) != 0 or len(pending) > len(block):
+            # Blocks are collected until a long record is complete,
+            #   so that it is not copied and searched through again for each block
+            if len(parts) == 0:
+                n_breaks = _count_line_breaks(pending, FASTQ_LINES_PER_READ)
+            # end if
+            n_breaks += _count_line_breaks(block, FASTQ_LINES_PER_READ - n_breaks)
+            parts.append(block)
+            if n_breaks < FASTQ_LINES_PER_READ:
+                continue
+            # end if
+            records, pending = _fastq_records_by_find("".join([pending] + parts))
+            parts = list()
+        elif _has_short_seq(pending, block):
+            records, pending = _fastq_records_by_lines(pending, block)
+        else:
+            records, pending = _fastq_records_by_find(pending + block)
+        # end if
+        yield from records
+        if pending is None:
+            return
+        # end if
+    # end for
+
+    # Truncated last record
+    pending = "".join([pending] + parts)
+    if pending != "" and not pending.startswith('\n'):
+        lines = pending.split('\n', FASTQ_LINES_PER_READ - 1)
+        lines.extend([""] * (FASTQ_LINES_PER_READ - len(lines)))
+        yield FastqRecord(*lines)
+    # end if
+# end def fastq_records_from_blocks
+
+
+def _fasta_record(record_text):
+    # Function makes FASTA record from it's text (without leading '>').
+    #
+    # :param record_text: text of FASTA record;
+    # :type record_text: str;
+
+    seq_id, _, seq = record_text.partition('\n')
+    # Leading '>' and line break preceding the next record are counted in size
+    return FastaRecord('>' + seq_id, seq.replace('\n', ""), _nbytes(record_text) + 2)
+# end def _fasta_record
+
+
+def fasta_records_from_blocks(blocks):
+    # Generator yields FASTA records from blocks of text (see `text_blocks`).
+    # Text is split into records at once by "\n>" instead of being processed line by line.
+    # Sequence lines of a record are joined into a single line. Lines before the first ID line are passed.
+    #
+    # :param blocks: iterable of blocks of text;
+    # :type blocks: iterable<str>;
+
+    # Pieces of incomplete record remaining from previous blocks.
+    # Line break is put before the beginning of data in order to split the first ID line too.
+    pending = ['\n']
+    preamble = True # True if the first ID line has not been found yet
+
+    for block in blocks:
+        pending.append(block)
+        if not '>' in block:
+            continue
+        # end if
+        records = "".join(pending).split("\n>")
+        pending = [records.pop()]
+        if len(records) == 0:
+            continue
+        # end if
+        if preamble:
+            del records[0]
+            preamble = False
+        # end if
+        yield from map(_fasta_record, records)
+    # end for
+
+    # The last record
+    if not preamble:
+        yield _fasta_record("".join(pending))
+    # end if
+# end def fasta_records_from_blocks
+
+
+def fastq_records(fq_path, offset=0):
+    # Generator yields records retrieved from FASTQ file.
+    #
+    # :param fq_path: path to FASTQ file;
+    # :type fq_path: str;
+    # :param offset: offset of the first record to retrieve (see `_open_at`);
+    # :type offset: int;
+
+    return fastq_records_from_blocks(text_blocks(fq_path, offset))
+# end def fastq_records
+
+
+def fasta_records(fa_path, offset=0):
+    # Generator yields records retrieved from FASTA file.
+    #
+    # :param fa_path: path to FASTA file;
+    # :type fa_path: str;
+    # :param offset: offset of the first record to retrieve (see `_open_at`);
+    # :type offset: int;
+
+    return fasta_records_from_blocks(text_blocks(fa_path, offset))
+# end def fasta_records
+
+
+def fastq_records_from_str(data):
+    # Generator yields records retrieved from FASTQ-formatted string.
+    #
+    # :param data: FASTQ-formatted string;
+    # :type data: str;
+
+    return fastq_records_from_blocks((data,))
+# end def fastq_records_from_str
+
+
+def fasta_records_from_str(data):
+    # Generator yields records retrieved from FASTA-formatted string.
+    #
+    # :param data: FASTA-formatted string;
+    # :type data: str;
+
+    return fasta_records_from_blocks((data,))
+# end def fasta_records_from_str
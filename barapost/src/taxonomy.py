@@ -4,8 +4,14 @@
 import re
 import os
 import glob
+import urllib.parse
+from time import sleep
+from xml.etree import ElementTree
 
-from src.lingering_https_get_request import lingering_https_get_request
+from src.lingering_https_get_request import lingering_https_request
+from src.https_client import backoff_delay, close_connection, NETWORK_ERRORS
+import src.offline_taxonomy as offline_taxonomy
+import src.taxonomy_store as taxonomy_store
 
 from src.printlog import printlog_error, printlog_error_time
 from src.platform import platf_depend_exit
@@ -28,8 +34,17 @@ species_patt = r"[A-Za-z0-9\._]+"
 # All without spaces.
 proposed_fmt = r"(((%s)?;){6}(%s)?)" % (high_tax_name_patt, species_patt)
 
-# Global list of accessions of sequences whose taxonomy is in taxonomy file
-_tax_accs = list()
+# NCBI renamed rank "superkingdom" to "domain" (and viruses have "acellular root" instead of it)
+rank_aliases = {"domain": "superkingdom", "acellular root": "superkingdom"}
+
+# Taxonomy of records, which are not found in NCBI Taxonomy
+empty_taxonomy = tuple(map(lambda rank: (rank, ""), ranks))
+
+# Maximum number of IDs in a single request to NCBI E-utilities
+EUTILS_BATCH_SIZE = 200
+
+# Server of NCBI E-utilities
+EUTILS_SERVER = "eutils.ncbi.nlm.nih.gov"
 
 
 def init_tax_file(taxonomy_path):
@@ -45,149 +60,340 @@ def init_tax_file(taxonomy_path):
 # end def init_tax_file
 
 
-def fill_tax_accs(taxonomy_path):
-    # Function reads TSV taxonomy file and adds all accessions stored in it
-    #   to `_tax_accs`.
+def _get_tax_entries(taxonomy_path):
+    # Function returns dictionary {accession: taxonomy string} of entries of taxonomy file
+    #   (see module `src.taxonomy_store`). It creates taxonomy file if it does not exist.
+    # Once the file is read, entries are served from memory.
     #
     # :param taxonomy_path: path to TSV file with taxonomy;
     # :type taxonomy_path: str;
 
-    global _tax_accs
-
-    # Create this file if it does not exist
-    if not os.path.exists(taxonomy_path):
+    if not taxonomy_store.is_loaded(taxonomy_path) and not os.path.exists(taxonomy_path):
         init_tax_file(taxonomy_path)
     # end if
 
-    # Read the file, except the first line -- it's the header
-    with open(taxonomy_path, 'r') as tax_file:
-        tax_lines = tax_file.readlines()[1:]
-    # end with
+    return taxonomy_store.get_entries(taxonomy_path)
+# end def _get_tax_entries
+
+
+def _eutils_xml_request(utility, params, request_for):
+    # Function submits POST request to NCBI E-utilities and returns XML response unread.
+    # POST is used since lists of IDs can be too long for URL. It only retrieves data,
+    #   so it is repeated after network errors like GET request.
+    #
+    # :param utility: name of E-utility, e.g. "esummary";
+    # :type utility: str;
+    # :param params: parameters of the request;
+    # :type params: dict<str: str>;
+    # :param request_for: some comment for error message;
+    # :type request_for: str;
+    #
+    # Returns response object ('http.client.HTTPResponse'), which should be read to the end.
 
-    # Extract the first column
-    _tax_accs = list(map(lambda l: l.split('\t')[0], tax_lines))
-# end def fill_tax_accs
+    url = "/entrez/eutils/{}.fcgi".format(utility)
+    payload = urllib.parse.urlencode(params)
+    headers = { "Content-Type" : "application/x-www-form-urlencoded" }
 
+    return lingering_https_request("POST", EUTILS_SERVER, url, payload, headers,
+        request_for, timeout=60, stream=True, idempotent=True)[0]
+# end def _eutils_xml_request
 
-def download_taxonomy(hit_acc, hit_def, taxonomy_path):
-    # Function retrieves taxonomy of a hit from NCBI.
-    # Moreover, it saves this taxonomy in file ``taxonomy_tsv:
-    #     <accession>\t<taxonomy_str>
+
+def _parse_eutils_xml(utility, params, request_for, handle_elem, tag):
+    # Function requests NCBI E-utilities and parses XML response in a streaming way:
+    #   response is parsed while it is being received, and each `tag` element
+    #   is passed to `handle_elem` and then cleared.
+    # NCBI servers sometimes return broken responses, so there are several attempts.
     #
-    # :param hit_acc: hit accession;
-    # :type hit_acc: str;
-    # :param hit_def: definition of reference record;
-    # :type hit_def: str;
-    # :param taxonomy_path: path to TSV file with taxonomy;
-    # :type taxonomy_path: str;
+    # :param utility: name of E-utility, e.g. "esummary";
+    # :type utility: str;
+    # :param params: parameters of the request;
+    # :type params: dict<str: str>;
+    # :param request_for: some comment for error message;
+    # :type request_for: str;
+    # :param handle_elem: function, which handles elements;
+    # :type handle_elem: function;
+    # :param tag: tag of elements to handle;
+    # :type tag: str;
+
+    max_attempts = 3
+
+    for attempt_i in range(max_attempts):
+        response = _eutils_xml_request(utility, params, request_for)
+        try:
+            depth = 0
+            root = None
+            for event, elem in ElementTree.iterparse(response, events=("start", "end")):
+                if event == "start":
+                    if root is None:
+                        root = elem
+                    # end if
+                    depth += 1
+                else:
+                    depth -= 1
+                    # Nested elements (e.g. lineage taxons) are handled along with their parents
+                    if depth == 1 and elem.tag == tag:
+                        handle_elem(elem)
+                        elem.clear()
+                        # Handled elements are not kept in the tree
+                        root.clear()
+                    # end if
+                # end if
+            # end for
+            response.read() # the rest of response, so that the connection can be reused
+        except (ElementTree.ParseError,) + NETWORK_ERRORS as err:
+            # Response is not read to the end
+            close_connection(EUTILS_SERVER)
+            printlog_error("Cannot parse response of NCBI ({}): {}".format(request_for, err))
+            if attempt_i == max_attempts - 1:
+                printlog_error_time("Error: NCBI returns broken responses. Please, try again later.")
+                platf_depend_exit(1)
+            # end if
+            sleep(backoff_delay(attempt_i))
+        else:
+            return
+        # end try
+    # end for
+# end def _parse_eutils_xml
+
+
+def _get_taxids(accs):
+    # Function maps accessions to TaxIDs using single `esummary` request.
+    #
+    # :param accs: list of accessions (at most `EUTILS_BATCH_SIZE` of them);
+    # :type accs: list<str>;
+    #
+    # Returns dict of the following structure: {accession: TaxID}.
+    # Accessions are included both with and without version.
+
+    acc_taxids = dict()
+
+    def handle_docsum(docsum):
+        taxid = None
+        accs_of_rec = list()
+        for item in docsum.iter("Item"):
+            name = item.get("Name")
+            if name == "TaxId":
+                taxid = item.text
+            elif name in ("Caption", "AccessionVersion") and not item.text is None:
+                accs_of_rec.append(item.text)
+            # end if
+        # end for
+        if not taxid is None and taxid != "0":
+            for acc in accs_of_rec:
+                acc_taxids[acc] = taxid
+                acc_taxids[acc.partition('.')[0]] = taxid
+            # end for
+        # end if
+    # end def handle_docsum
 
-    # Get TaxID of the organism from GenBank summary:
-    gb_summary = lingering_https_get_request("www.ncbi.nlm.nih.gov",
-        "/nuccore/{}".format(hit_acc), "GenBank summary", hit_acc)
+    _parse_eutils_xml("esummary", {"db": "nuccore", "id": ','.join(accs)},
+        "GenBank summary", handle_docsum, "DocSum")
 
+    return acc_taxids
+# end def _get_taxids
 
-    re_search_obj = re.search(r"ORGANISM=([0-9]+)", gb_summary)
-    if not re_search_obj is None:
-        taxid = re_search_obj.group(1)
 
-        # Get taxonomy page of the organism
-        taxonomy_url = "/Taxonomy/Browser/wwwtax.cgi?mode=Info&id={}&lvl=3&lin=f&keep=1&srchmode=1&unlock".format(taxid)
-        taxonomy_text = lingering_https_get_request("www.ncbi.nlm.nih.gov",
-            taxonomy_url, "taxonomy", hit_acc)
+def _get_lineages(taxids):
+    # Function retrieves lineages of taxons using single `efetch` request to Taxonomy database.
+    #
+    # :param taxids: list of TaxIDs (at most `EUTILS_BATCH_SIZE` of them);
+    # :type taxids: list<str>;
+    #
+    # Returns dict of the following structure:
+    #   {TaxID: (scientific_name, [(rank, name) for each ancestor from root to the taxon])}.
+    # Merged TaxIDs are included as well.
+
+    lineages = dict()
+
+    def handle_taxon(taxon):
+        name = taxon.findtext("ScientificName")
+        lineage = list()
+        lineage_elem = taxon.find("LineageEx")
+        if not lineage_elem is None:
+            for anc in lineage_elem.iter("Taxon"):
+                lineage.append( (anc.findtext("Rank", "").lower(), anc.findtext("ScientificName", "")) )
+            # end for
+        # end if
+        lineage.append( (taxon.findtext("Rank", "").lower(), name) )
+        lineages[taxon.findtext("TaxId")] = (name, lineage)
+        aka_elem = taxon.find("AkaTaxIds")
+        if not aka_elem is None:
+            for aka_taxid in aka_elem.iter("TaxId"):
+                lineages[aka_taxid.text] = (name, lineage)
+            # end for
+        # end if
+    # end def handle_taxon
 
-        # This pattern will match taxonomic names along with their ranks
-        tax_rank_pattern = r"TITLE=\"([a-z ]+)\"\>([A-Z].+?)\</a\>"
+    _parse_eutils_xml("efetch", {"db": "taxonomy", "id": ','.join(taxids), "retmode": "xml"},
+        "taxonomy", handle_taxon, "Taxon")
 
-        # Get all taxonomic names of the organism
-        taxonomy = re.findall(tax_rank_pattern, taxonomy_text)
+    return lineages
+# end def _get_lineages
 
-        # We will convert ranks to lowercase just in case.
-        # Firstly convert tuples to lists in order to change them:
-        taxonomy = list(map(lambda x: list(x), taxonomy))
 
-        # Remove odd information from beginnig of names:
-        for i in range(len(taxonomy)):
-            taxonomy[i][0] = taxonomy[i][0].lower() # just in case
-        # end for
+def config_taxonomy_from_lineage(lineage, organism_name):
+    # Function forms a taxonomy tuple (see function `parse_taxonomy`) from lineage of an organism.
+    #
+    # :param lineage: ranks and names of all ancestors of the organism from root to the organism itself.
+    #   The organism itself (the last item) is not selected: species name is parsed from it's name;
+    # :type lineage: list<tuple<str, str>>;
+    # :param organism_name: scientific name of the organism;
+    # :type organism_name: str;
+    #
+    # Returns taxonomy tuple or None if there are no appropriate ranks in lineage.
+
+    # We will leave only following taxonomic ranks: domain, phylum, class, order, family, genus.
+    # Species name requires special handling, it will be added later.
+    ranks_to_select = ranks[:-1]
+
+    taxonomy = list()
+    found_ranks = set()
+    for rank, name in lineage[:-1]:
+        rank = rank_aliases.get(rank, rank)
+        if rank in ranks_to_select and not rank in found_ranks:
+            taxonomy.append( (rank, name) )
+            found_ranks.add(rank)
+        # end if
+    # end for
 
-        # We will leave only following taxonomic ranks: domain, phylum, class, order, family, genus.
-        # Species name requires special handling, it will be added later.
-        ranks_to_select = ranks[:-1]
+    # E.g., this record has no appropriate ranks: CP034535
+    if len(taxonomy) == 0:
+        return None
+    # end if
 
-        # Remove redundant ranks:
-        taxonomy = filter( lambda x: x[0].lower() in ranks_to_select, taxonomy )
+    # Check if species name is specified like other ranks (i.e. organism is a strain):
+    direct_species = tuple(filter(lambda x: x[0] == "species", lineage[:-1]))
 
-        # Convert back to tuples:
-        taxonomy = list(map(lambda x: tuple(x), taxonomy))
+    if len(direct_species) != 0:
+        # If species name is specified like other ranks, merely add it to list:
+        taxonomy.append( ("species", direct_species[0][1].partition(" ")[2]) )
+    else:
+        # Otherwise we need to parse species name from name of the organism
+        title = organism_name.split(' ')
+
+        # We will take all this words as species name.
+        # Viruses also often have unpredictable names.
+        #   Example: MN908947
+        try:
+            if title[1] in second_words_not_species or taxonomy[0][1].lower() == "viruses":
+                taxonomy.append( ("species", '_'.join(title[1:])) )
+            else:
+                taxonomy.append( ("species", title[1]) )
+            # end if
+        except IndexError:
+            # Handle absence of species name, e.g., this: AC150248.3
+            # Well, nothing to append in this case!
+            pass
+        # end try
+    # end if
 
-        # E.g., this record has no appropriate ranks: CP034535
-        # Merely return it's definition
-        if len(taxonomy) == 0:
-            # Save taxonomy
-            _tax_accs.append(hit_acc)
-            with open(taxonomy_path, 'a') as tax_file:
-                tax_file.write("{}\n".format('\t'.join( (hit_acc, hit_def) )))
-            # end with
+    # Fill in missing ranks with empty strings
+    for i in range(len(ranks)):
+        if len(taxonomy) < i+1: # for this (missing in the end): AC150248
+            taxonomy.append( (ranks[i], "") )
+        elif taxonomy[i][0] != ranks[i]: # for this (mising in the middle): MN908947
+            taxonomy.insert( i, (ranks[i], "") )
         # end if
+    # end for
 
-        # Check if species name is specified like other ranks:
-        check_direct_species_patt = r"TITLE=\"(species)\"\>([A-Za-z0-9 \.]+)\</a\>"
-        match_direct_species = re.search(check_direct_species_patt, taxonomy_text)
+    return tuple(taxonomy)
+# end def config_taxonomy_from_lineage
 
-        if not match_direct_species is None:
-            # If species name is specified like other ranks, merely add it to list:
-            taxonomy.append( (match_direct_species.group(1), match_direct_species.group(2).partition(" ")[2]) )
+
+def _download_lineages(accs):
+    # Function retrieves lineages of organisms by accessions of their records from NCBI.
+    #
+    # :param accs: list of accessions (at most `EUTILS_BATCH_SIZE` of them);
+    # :type accs: list<str>;
+    #
+    # Returns dict of the following structure:
+    #   {accession: (scientific_name, [(rank, name) from root to the organism])}.
+    # Accessions, which are not found in NCBI, are not included in the dict.
+
+    acc_taxids = _get_taxids(accs)
+    taxids = list(set(acc_taxids.values()))
+    lineages = dict()
+    for i in range(0, len(taxids), EUTILS_BATCH_SIZE):
+        lineages.update(_get_lineages(taxids[i : i+EUTILS_BATCH_SIZE]))
+    # end for
+
+    acc_lineages = dict()
+    for acc in accs:
+        taxid = acc_taxids.get(acc, acc_taxids.get(acc.partition('.')[0]))
+        if not taxid is None and taxid in lineages:
+            acc_lineages[acc] = lineages[taxid]
+        # end if
+    # end for
+
+    return acc_lineages
+# end def _download_lineages
+
+
+def download_taxonomy_batch(acc_def_pairs, taxonomy_path):
+    # Function retrieves taxonomy of hits from NCBI in batches:
+    #   one `esummary` request maps up to `EUTILS_BATCH_SIZE` accessions to TaxIDs,
+    #   and one `efetch` request retrieves lineages of all distinct TaxIDs.
+    # If offline taxonomy backend is initialized, local taxonomy dump is used instead of NCBI.
+    # Moreover, it saves this taxonomy in file `taxonomy.tsv`:
+    #     <accession>\t<taxonomy_str>
+    #
+    # :param acc_def_pairs: list of pairs (hit accession, definition of reference record);
+    # :type acc_def_pairs: list<tuple<str, str>>;
+    # :param taxonomy_path: path to TSV file with taxonomy;
+    # :type taxonomy_path: str;
+
+    if not os.path.exists(taxonomy_path):
+        init_tax_file(taxonomy_path)
+    # end if
+
+    for i in range(0, len(acc_def_pairs), EUTILS_BATCH_SIZE):
+        batch = acc_def_pairs[i : i+EUTILS_BATCH_SIZE]
+
+        if offline_taxonomy.is_enabled():
+            # Use local taxonomy dump (see `-x` option)
+            acc_lineages = offline_taxonomy.get_lineages([acc for acc, _ in batch])
         else:
-            # Otherwise we need to parse species name from title
-            title = re.search(r"\<title\>Taxonomy browser \((.+)\)\</title\>", taxonomy_text).group(1)
-
-            # Get words
-            title = title.split(' ')
-
-            # We will take all this words as species name.
-            # Viruses also often have unpredictable names.
-            #   Example: MN908947
-            try:
-                if title[1] in second_words_not_species or taxonomy[0][1].lower() == "viruses":
-                    taxonomy.append( ("species", '_'.join(title[1:])) )
-                else:
-                    taxonomy.append( ("species", title[1]) )
-                # end if
-            except IndexError:
-                # Handle absence of species name, e.g., this: AC150248.3
-                # Well, nothing to append in this case!
-                pass
-            # end try
+            acc_lineages = _download_lineages([acc for acc, _ in batch])
         # end if
 
-        # Fill in missing ranks with empty strings
-        for i in range(len(ranks)):
-            if len(taxonomy) < i+1: # for this (missing in the end): AC150248
-                taxonomy.append( (ranks[i], "") )
-            elif taxonomy[i][0] != ranks[i]: # for this (mising in the middle): MN908947
-                taxonomy.insert( i, (ranks[i], "") )
+        acc_tax_pairs = list()
+        for hit_acc, hit_def in batch:
+
+            if hit_acc in acc_lineages:
+                organism_name, lineage = acc_lineages[hit_acc]
+                taxonomy = config_taxonomy_from_lineage(lineage, organism_name)
+            else:
+                taxonomy = empty_taxonomy
+            # end if
+
+            if taxonomy is None:
+                # Record has no appropriate ranks -- merely save it's definition
+                acc_tax_pairs.append( (hit_acc, hit_def) )
+            else:
+                acc_tax_pairs.append( (hit_acc, config_taxonomy_str(taxonomy)) )
             # end if
         # end for
 
-        # It will be a bit faster
-        taxonomy = tuple(taxonomy)
-    else:
-        taxonomy = (
-            ('Domain', '',),
-            ('Phylum', '',),
-            ('Class', '',),
-            ('Order', '',),
-            ('Family', '',),
-            ('Genus', '',),
-            ('Species', '',),
-        )
-    # end if
+        # Save taxonomy
+        taxonomy_store.add_entries(taxonomy_path, acc_tax_pairs)
+    # end for
+# end def download_taxonomy_batch
 
-    # Save taxonomy
-    _tax_accs.append(hit_acc)
-    with open(taxonomy_path, 'a') as tax_file:
-        tax_file.write("{}\n".format('\t'.join( (hit_acc, config_taxonomy_str(taxonomy)) )))
-    # end with
+
+def download_taxonomy(hit_acc, hit_def, taxonomy_path):
+    # Function retrieves taxonomy of a hit from NCBI.
+    # Moreover, it saves this taxonomy in file ``taxonomy_tsv:
+    #     <accession>\t<taxonomy_str>
+    #
+    # :param hit_acc: hit accession;
+    # :type hit_acc: str;
+    # :param hit_def: definition of reference record;
+    # :type hit_def: str;
+    # :param taxonomy_path: path to TSV file with taxonomy;
+    # :type taxonomy_path: str;
+
+    download_taxonomy_batch([(hit_acc, hit_def)], taxonomy_path)
 # end def download_taxonomy
 
 
@@ -202,12 +408,8 @@ def find_taxonomy(hit_acc, hit_def, taxonomy_path):
     # :param taxonomy_path: path to TSV file with taxonomy;
     # :type taxonomy_path: str;
 
-    if len(_tax_accs) == 0:
-        fill_tax_accs(taxonomy_path)
-    # end if
-
     # If hit is not new -- go further
-    if hit_acc in _tax_accs:
+    if hit_acc in _get_tax_entries(taxonomy_path):
         return
     # end if
 
@@ -216,6 +418,32 @@ def find_taxonomy(hit_acc, hit_def, taxonomy_path):
 # end def find_taxonomy
 
 
+def find_taxonomy_batch(acc_def_pairs, taxonomy_path):
+    # Function downloads taxonomy of hits, which are not in taxonomy file yet,
+    #   with as few requests to NCBI as possible.
+    #
+    # :param acc_def_pairs: list of pairs (hit accession, definition of reference record);
+    # :type acc_def_pairs: list<tuple<str, str>>;
+    # :param taxonomy_path: path to TSV file with taxonomy;
+    # :type taxonomy_path: str;
+
+    tax_entries = _get_tax_entries(taxonomy_path)
+
+    new_pairs = list()
+    new_accs = set()
+    for hit_acc, hit_def in acc_def_pairs:
+        if not hit_acc in tax_entries and not hit_acc in new_accs:
+            new_pairs.append( (hit_acc, hit_def) )
+            new_accs.add(hit_acc)
+        # end if
+    # end for
+
+    if len(new_pairs) != 0:
+        download_taxonomy_batch(new_pairs, taxonomy_path)
+    # end if
+# end def find_taxonomy_batch
+
+
 def parse_taxonomy(taxonomy_str):
     # Function parses ID of user's reference sequence and forms a taxonomy tuple
     #   if there is proper taxonomy string in ID line in fasta format.
@@ -265,31 +493,19 @@ def config_taxonomy_str(taxonomy_tuple):
 
 
 def get_tax_keys(taxonomy_path):
-    # Function reads taxonomy file and returns it's
-    #   content (just accessions, without taxonomy) as tuple.
+    # Function returns accessions of entries of taxonomy file (without taxonomy)
+    #   as a set-like view: membership check takes O(1) time.
     #
     # :param taxonomy_path: path to TSV file with taxonomy;
     # :type taxonomy_path: str;
 
-    if not os.path.exists(taxonomy_path):
-        init_tax_file(taxonomy_path)
-    # end if
-
-    # Read the file, except the first line - it's the header
-    with open(taxonomy_path, 'r') as tax_file:
-        tax_lines = tax_file.readlines()[1:]
-    # end with
-
-    # Extract the first column and return it as tuple
-    tax_keys = tuple(map(lambda l: l.split('\t')[0], tax_lines))
-
-    return tax_keys
-# end def get_tax_dict
+    return _get_tax_entries(taxonomy_path).keys()
+# end def get_tax_keys
 
 
 def get_tax_dict(taxonomy_path):
-    # Function reads taxonomy file and returns it's
-    #   content as dictionary.
+    # Function returns content of taxonomy file as dictionary.
+    # Taxonomy file is read only once: subsequent calls read only new lines of it.
     #
     # :param taxonomy_path: path to TSV file with taxonomy;
     # :type taxonomy_path: str;
@@ -298,16 +514,7 @@ def get_tax_dict(taxonomy_path):
         init_tax_file(taxonomy_path)
     # end if
 
-    tax_dict = dict()
-    with open(taxonomy_path, 'r') as tax_file:
-        tax_file.readline() # pass header
-        for line in tax_file:
-            acc, taxonomy = line.split('\t')
-            tax_dict[acc] = parse_taxonomy(taxonomy.strip())
-        # end for
-    # end with
-
-    return tax_dict
+    return taxonomy_store.get_parsed(taxonomy_path, parse_taxonomy)
 # end def get_tax_dict
 
 
@@ -352,20 +559,9 @@ def save_taxonomy_directly(taxonomy_path, acc, taxonomy_str):
     # :param taxonomy_str: taxonomy string to save;
     # :type taxonomy_str: is;
 
-    if not os.path.exists(taxonomy_path):
-        init_tax_file(taxonomy_path)
-    # end if
-
-    if len(_tax_accs) == 0:
-        fill_tax_accs(taxonomy_path)
-    # end if
-
     # Do not add redundant taxonomy line
-    if not acc in _tax_accs:
-        with open(taxonomy_path, 'a') as tax_file:
-            tax_file.write("{}\n".format('\t'.join( (acc, config_taxonomy_own_seq(taxonomy_str)) )))
-        # end with
-        _tax_accs.append(acc)
+    if not acc in _get_tax_entries(taxonomy_path):
+        taxonomy_store.add_entries(taxonomy_path, [(acc, config_taxonomy_own_seq(taxonomy_str))])
     # end if
 # end def def save_taxonomy_directly
 
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+# This module defines in-memory store of taxonomy file (`taxonomy.tsv`).
+# Taxonomy file is read only once per process: accessions are kept in a dictionary,
+#   so lookups take O(1) time and do not touch the file.
+# The file is reread only at sync points (see `sync`): after entries are added and
+#   when parsed taxonomy is requested. Then only lines appended to the file
+#   (by current process or by other ones) are read, starting from the saved offset.
+
+import os
+
+
+# Stores of taxonomy files: {path to taxonomy file: store}.
+# Store is kept both under absolute path and under paths, by which it has been requested.
+# Store is a dictionary of the following structure:
+#   {
+#     "entries": {accession: taxonomy string},
+#     "parsed": {accession: parsed taxonomy},
+#     "unparsed": [accessions, which are not parsed yet],
+#     "offset": number of bytes already read
+#   }
+_stores = dict()
+
+
+def _new_store():
+    # Function returns empty store.
+    return {"entries": dict(), "parsed": dict(), "unparsed": list(), "offset": 0}
+# end def _new_store
+
+
+def _read_tail(store, taxonomy_path):
+    # Function reads lines appended to taxonomy file since last reading.
+    # Incomplete last line (it may be being written right now) is left for the next time.
+    #
+    # :param store: store of taxonomy file;
+    # :type store: dict;
+    # :param taxonomy_path: path to TSV file with taxonomy;
+    # :type taxonomy_path: str;
+
+    file_size = os.path.getsize(taxonomy_path)
+
+    if file_size == store["offset"]:
+        return # nothing new
+    elif file_size < store["offset"]:
+        # File has been rewritten -- read it from the very beginning.
+        # Dictionaries are cleared in place, since they might be referenced elsewhere
+        store["entries"].clear()
+        store["parsed"].clear()
+        store["unparsed"] = list()
+        store["offset"] = 0
+    # end if
+
+    with open(taxonomy_path, 'rb') as tax_file:
+        tax_file.seek(store["offset"])
+        tail = tax_file.read()
+    # end with
+
+    end = tail.rfind(b'\n') + 1
+    if end == 0:
+        return
+    # end if
+
+    lines = tail[:end].decode("utf-8").splitlines()
+    # Pass the header
+    if store["offset"] == 0:
+        lines = lines[1:]
+    # end if
+    store["offset"] += end
+
+    for line in lines:
+        acc, sep, taxonomy_str = line.partition('\t')
+        if sep != "":
+            store["entries"][acc] = taxonomy_str.strip()
+            store["unparsed"].append(acc)
+        # end if
+    # end for
+# end def _read_tail
+
+
+def is_loaded(taxonomy_path):
+    # Function checks if taxonomy file has been already read by current process.
+    #
+    # :param taxonomy_path: path to TSV file with taxonomy;
+    # :type taxonomy_path: str;
+
+    return taxonomy_path in _stores or os.path.abspath(taxonomy_path) in _stores
+# end def is_loaded
+
+
+def load(taxonomy_path):
+    # Function returns store of taxonomy file.
+    # Taxonomy file is read only if it has not been read yet (see `sync`).
+    # Taxonomy file must exist.
+    #
+    # :param taxonomy_path: path to TSV file with taxonomy;
+    # :type taxonomy_path: str;
+
+    try:
+        return _stores[taxonomy_path]
+    except KeyError:
+        pass
+    # end try
+
+    abspath = os.path.abspath(taxonomy_path)
+    store = _stores.get(abspath)
+    if store is None:
+        store = _new_store()
+        _read_tail(store, abspath)
+        _stores[abspath] = store
+    # end if
+
+    _stores[taxonomy_path] = store
+    return store
+# end def load
+
+
+def sync(taxonomy_path):
+    # Function reads lines appended to taxonomy file since last reading
+    #   and returns store of taxonomy file.
+    #
+    # :param taxonomy_path: path to TSV file with taxonomy;
+    # :type taxonomy_path: str;
+
+    store = load(taxonomy_path)
+    _read_tail(store, taxonomy_path)
+    return store
+# end def sync
+
+
+def get_entries(taxonomy_path):
+    # Function returns dictionary {accession: taxonomy string} of all entries of taxonomy file.
+    # Dictionary is shared: it is updated when new entries are read at sync points.
+    #
+    # :param taxonomy_path: path to TSV file with taxonomy;
+    # :type taxonomy_path: str;
+
+    return load(taxonomy_path)["entries"]
+# end def get_entries
+
+
+def get_parsed(taxonomy_path, parse_func):
+    # Function returns dictionary {accession: parsed taxonomy} of all entries of taxonomy file.
+    # It is a sync point: entries appended by other processes are read.
+    # Each entry is parsed only once.
+    #
+    # :param taxonomy_path: path to TSV file with taxonomy;
+    # :type taxonomy_path: str;
+    # :param parse_func: function, which parses taxonomy string;
+    # :type parse_func: function;
+
+    store = sync(taxonomy_path)
+
+    entries = store["entries"]
+    parsed = store["parsed"]
+    for acc in store["unparsed"]:
+        parsed[acc] = parse_func(entries[acc])
+    # end for
+    store["unparsed"] = list()
+
+    return parsed
+# end def get_parsed
+
+
+def add_entries(taxonomy_path, acc_tax_pairs):
+    # Function appends entries to taxonomy file and to it's store.
+    # All entries are written with a single `write` call.
+    #
+    # :param taxonomy_path: path to TSV file with taxonomy;
+    # :type taxonomy_path: str;
+    # :param acc_tax_pairs: pairs (accession, taxonomy string);
+    # :type acc_tax_pairs: list<tuple<str, str>>;
+
+    if len(acc_tax_pairs) == 0:
+        return
+    # end if
+
+    with open(taxonomy_path, 'a') as tax_file:
+        tax_file.write(''.join(map(lambda p: "{}\t{}\n".format(*p), acc_tax_pairs)))
+    # end with
+
+    # New entries are read from the file, as well as ones appended by other processes
+    sync(taxonomy_path)
+# end def add_entries